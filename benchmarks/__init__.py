@@ -0,0 +1,10 @@
+"""
+Benchmarks for microsite. Run these from the root of the repository, for example:
+
+    python -m benchmarks.link_rewrite
+    python -m benchmarks.render_pipeline --pages 2000 --output results.json
+    python -m benchmarks.compare baseline.json results.json
+    python -m benchmarks.startup --max-import-ms 150
+
+:py:mod:`benchmarks.synthetic` generates the sites the pipeline benchmarks run against.
+"""
@@ -0,0 +1,71 @@
+"""
+Compares two benchmark result files and reports any phase which got slower.
+
+    python -m benchmarks.compare before.json after.json --threshold 10
+
+Exits with status 1 if any phase's best time regressed by more than the threshold percentage. Phases
+which slowed down by less than ``--min-delta`` milliseconds are not counted, since very short phases
+are dominated by noise.
+"""
+
+import json
+import sys
+
+from argparse import ArgumentParser
+
+
+def compare(before: dict, after: dict, threshold: float, min_delta: float = 0.0) -> list[str]:
+    """
+    Prints a comparison of two benchmark reports.
+
+    :return: List of the phases which regressed by more than ``threshold`` percent and more than
+        ``min_delta`` seconds.
+    :rtype: list[str]
+    """
+
+    for key in ('spec', 'settings'):
+        if before.get(key) != after.get(key):
+            print(f'Warning: the two runs used different {key}; comparisons may not be fair.')
+
+    regressions = []
+    print(f'{"phase":<12} {"before":>12} {"after":>12} {"change":>9}')
+    for phase, result in before['results'].items():
+        if phase not in after['results']:
+            continue
+        old = result['min']
+        new = after['results'][phase]['min']
+        change = (new - old) / old * 100 if old else 0.0
+        flag = ''
+        if change > threshold and new - old > min_delta:
+            flag = '  REGRESSION'
+            regressions.append(phase)
+        print(f'{phase:<12} {old * 1000:10.1f}ms {new * 1000:10.1f}ms {change:+8.1f}%{flag}')
+    return regressions
+
+
+def main() -> None:
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('before', help='Results of the baseline run')
+    parser.add_argument('after', help='Results of the run to check')
+    parser.add_argument(
+        '--threshold', type=float, default=10.0, help='Percent slowdown counted as a regression'
+    )
+    parser.add_argument(
+        '--min-delta',
+        type=float,
+        default=5.0,
+        help='Milliseconds a phase must slow down by to count as a regression',
+    )
+    args = parser.parse_args()
+
+    with open(args.before) as file:
+        before = json.load(file)
+    with open(args.after) as file:
+        after = json.load(file)
+
+    if compare(before, after, args.threshold, args.min_delta / 1000):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Compares the cost of rewriting ``*.md`` links by re-parsing each rendered page with BeautifulSoup
+(the way pages used to be rendered) against rewriting them during the Markdown conversion with
+:py:class:`microsite.render.extensions.RewriteUrlsExtension`.
+
+    python -m benchmarks.link_rewrite --sections 500 --repeat 5
+"""
+
+import jinja2
+import timeit
+
+from argparse import ArgumentParser
+from bs4 import BeautifulSoup
+from markdown import Markdown
+from microsite.render.extensions import RewriteUrlsExtension
+
+EXTENSIONS = ['tables', 'md_in_html']
+TEMPLATE = jinja2.Environment().from_string(
+    '<!DOCTYPE html><html><head><title>{{ title }}</title>'
+    '<link rel="stylesheet" href="{{ stylesheet }}"></head>'
+    '<body><div class="content">{{ html }}</div></body></html>'
+)
+
+
+def make_document(sections: int) -> str:
+    """
+    Returns a Markdown document with the given number of sections, each containing prose, a table,
+    and several links to other pages.
+    """
+
+    section = (
+        '## Section {n}\n\n'
+        'Some **bold** and _italic_ prose which links to [the next page](page{n}.md), to '
+        '[a heading](page{n}.md#heading), to [a query](page{n}.md?view=full) and to '
+        '[somewhere else](https://example.com/README.md).\n\n'
+        '| Column A | Column B |\n| -------- | -------- |\n| [A](a{n}.md) | B |\n\n'
+    )
+    return ''.join(section.format(n=n) for n in range(sections))
+
+
+def render_with_soup(md: Markdown, document: str) -> str:
+    md_html = md.reset().convert(document)
+    page_html = TEMPLATE.render(stylesheet='style.css', title='Benchmark', html=md_html)
+    soup = BeautifulSoup(page_html, features='html.parser')
+    for a_tag in soup.find_all('a'):
+        href = a_tag.get('href')
+        if href and href.endswith('.md') and not href.startswith('http'):
+            href = href.split('.')
+            href[-1] = 'html'
+            a_tag['href'] = '.'.join(href)
+    return str(soup).replace('\n', '')
+
+
+def render_with_treeprocessor(md: Markdown, document: str) -> str:
+    md_html = md.reset().convert(document)
+    page_html = TEMPLATE.render(stylesheet='style.css', title='Benchmark', html=md_html)
+    return page_html.replace('\n', '')
+
+
+def main() -> None:
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sections', type=int, default=500, help='Sections in the document')
+    parser.add_argument('--repeat', type=int, default=5, help='Times to render the document')
+    args = parser.parse_args()
+
+    document = make_document(args.sections)
+    soup_md = Markdown(extensions=EXTENSIONS)
+    tree_md = Markdown(extensions=[*EXTENSIONS, RewriteUrlsExtension()])
+
+    print(f'Document size: {len(document)} characters, {args.repeat} renders per path')
+    results = {}
+    for name, func, md in (
+        ('BeautifulSoup re-parse', render_with_soup, soup_md),
+        ('Markdown treeprocessor', render_with_treeprocessor, tree_md),
+    ):
+        seconds = min(
+            timeit.repeat(lambda: func(md, document), number=1, repeat=args.repeat),
+        )
+        results[name] = seconds
+        print(f'{name:<24} {seconds * 1000:10.1f} ms per page')
+
+    baseline, candidate = results.values()
+    print(f'Speedup: {baseline / candidate:.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""
+Measures how a full build's peak memory use grows with the number of files in the site.
+
+    python -m benchmarks.memory --sizes 250 1000 4000 --max-bytes-per-file 2048
+
+Each site size is built in a fresh process, with :py:mod:`tracemalloc` recording the peak amount of
+memory Python allocated during the build. The growth in peak memory per additional file, between the
+smallest and largest sites, shows how much of the build's memory use scales with the size of the
+site rather than the size of a single page. The build manifest keeps a small record of every file,
+so some growth is expected. Everything else, like each page's Markdown and HTML and the queues of
+pending work, should stay the same size however large the site gets.
+
+Exits with status 1 if the growth per file exceeds ``--max-bytes-per-file``.
+"""
+
+import json
+import multiprocessing
+import platform
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from argparse import ArgumentParser
+from benchmarks.render_pipeline import make_engine
+from benchmarks.synthetic import SiteSpec, add_spec_arguments, generate_site, spec_from_args
+from dataclasses import asdict, replace
+from microsite.render import render
+from pathlib import Path
+
+
+def measure(spec_fields: dict, pretty_html: bool, workers: int) -> dict:
+    """
+    Generates a site and builds it, recording the build's peak memory use. Meant to be run in a
+    process of its own, so that the maximum resident set size is that of the build alone.
+    """
+
+    spec = SiteSpec(**spec_fields)
+    with tempfile.TemporaryDirectory(prefix='microsite-memory-') as work_dir:
+        source_dir = Path(work_dir) / 'site'
+        site = generate_site(source_dir, spec)
+        engine = make_engine(pretty_html, workers, str(Path(work_dir) / 'cache'))
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        render(
+            engines=[engine],
+            source_dir=str(source_dir),
+            target_dir=str(Path(work_dir) / 'output'),
+            incremental=False,
+        )
+        seconds = time.perf_counter() - start
+        _current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return {
+        'files': site['pages'] + site['assets'],
+        'site': site,
+        'seconds': seconds,
+        'peak_traced': peak,
+        'max_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+    }
+
+
+def run(args) -> dict:
+    base = spec_from_args(args)
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for size in sorted(args.sizes):
+        spec = replace(base, pages=size)
+        with context.Pool(processes=1) as pool:
+            result = pool.apply(measure, (asdict(spec), args.pretty_html, args.workers))
+        results.append(result)
+        print(
+            f'{result["files"]:>8} files {result["peak_traced"] / 2**20:10.1f} MiB peak traced '
+            f'{result["max_rss"] / 2**20:10.1f} MiB max RSS {result["seconds"]:8.1f} s',
+            file=sys.stderr,
+        )
+
+    smallest, largest = results[0], results[-1]
+    growth = 0.0
+    if largest['files'] > smallest['files']:
+        growth = (largest['peak_traced'] - smallest['peak_traced']) / (
+            largest['files'] - smallest['files']
+        )
+    return {
+        'benchmark': 'memory',
+        'spec': asdict(base),
+        'settings': {'pretty_html': args.pretty_html, 'workers': args.workers},
+        'environment': {
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+        },
+        'results': results,
+        'bytes_per_file': growth,
+    }
+
+
+def main() -> None:
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    add_spec_arguments(parser)
+    parser.add_argument(
+        '--sizes',
+        type=int,
+        nargs='+',
+        default=[250, 1000, 4000],
+        help='Numbers of pages to build sites with',
+    )
+    parser.add_argument('--pretty-html', default=False, action='store_true')
+    parser.add_argument('--workers', type=int, default=1, help='Worker processes for builds')
+    parser.add_argument(
+        '--max-bytes-per-file',
+        type=float,
+        help='Fail if peak memory grows by more than this many bytes per additional file',
+    )
+    parser.add_argument('--output', help='File to write the JSON results to')
+    parser.set_defaults(page_size=200, assets={'png': [50, 2000]})
+    args = parser.parse_args()
+
+    report = run(args)
+    print(f'Peak memory grows by {report["bytes_per_file"]:.0f} bytes per file', file=sys.stderr)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.max_bytes_per_file is not None and report['bytes_per_file'] > args.max_bytes_per_file:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
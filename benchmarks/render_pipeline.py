@@ -0,0 +1,179 @@
+"""
+Times each phase of the render pipeline against a synthetic site and writes the results as JSON.
+
+    python -m benchmarks.render_pipeline --pages 2000 --output before.json
+    python -m benchmarks.compare before.json after.json
+
+The phases are timed separately so that a change to one of them shows up clearly:
+
+- ``discovery``: Finding every file in the source directory.
+- ``read``: Reading each Markdown file.
+- ``markdown``: Converting each page's Markdown into HTML.
+- ``templating``: Rendering each page's HTML into the page template.
+- ``postprocess``: Formatting each rendered page.
+- ``write``: Writing each rendered page to disk.
+- ``assets``: Copying every file which is not rendered.
+- ``build_full``: A complete clean build with :py:func:`microsite.render.render`.
+- ``build_noop``: An incremental build when nothing has changed.
+"""
+
+import json
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+from argparse import ArgumentParser
+from benchmarks.synthetic import add_spec_arguments, generate_site, spec_from_args
+from dataclasses import asdict
+from microsite.config import MarkdownEngineConfig
+from microsite.filecopy import FileCopier
+from microsite.path import get_all_paths
+from microsite.render import render
+from microsite.render.markdown import MarkdownRenderEngine
+from pathlib import Path
+from shutil import rmtree
+
+
+def make_engine(pretty_html: bool, workers: int = 1, cache_dir: str = None):
+    config = MarkdownEngineConfig(
+        extensions=('tables', 'md_in_html'),
+        pretty_html=pretty_html,
+        title='Benchmark',
+    )
+    return MarkdownRenderEngine(config=config, index={}, workers=workers, cache_dir=cache_dir)
+
+
+def timed(func, repeat: int) -> dict:
+    """
+    Runs a function ``repeat`` times and summarizes how long it took.
+    """
+
+    runs = []
+    for _run in range(repeat):
+        start = time.perf_counter()
+        func()
+        runs.append(time.perf_counter() - start)
+    return {'min': min(runs), 'median': statistics.median(runs), 'runs': runs}
+
+
+def run(args) -> dict:
+    spec = spec_from_args(args)
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='microsite-bench-') as work_dir:
+        source_dir = Path(work_dir) / 'site'
+        target_dir = Path(work_dir) / 'output'
+        cache_dir = Path(work_dir) / 'cache'
+        site = generate_site(source_dir, spec)
+
+        engine = make_engine(args.pretty_html, cache_dir=str(cache_dir))
+        paths = get_all_paths(source_dir)
+        pages = [path for path in paths if path.endswith('.md')]
+        assets = [path for path in paths if not path.endswith('.md')]
+
+        results['discovery'] = timed(lambda: get_all_paths(source_dir), args.repeat)
+
+        texts = {}
+        results['read'] = timed(
+            lambda: texts.update({page: engine.read_source(source_dir / page) for page in pages}),
+            args.repeat,
+        )
+
+        snippets = {}
+        results['markdown'] = timed(
+            lambda: snippets.update({page: engine.convert_markdown(texts[page]) for page in pages}),
+            args.repeat,
+        )
+
+        rendered = {}
+        results['templating'] = timed(
+            lambda: rendered.update(
+                {page: engine.render_page(page, snippets[page]) for page in pages}
+            ),
+            args.repeat,
+        )
+
+        processed = {}
+        results['postprocess'] = timed(
+            lambda: processed.update(
+                {page: engine.postprocess_html(rendered[page]) for page in pages}
+            ),
+            args.repeat,
+        )
+
+        def write_pages():
+            for page in pages:
+                target = target_dir / engine.output_paths(page)[0]
+                target.parent.mkdir(parents=True, exist_ok=True)
+                engine.write_output(target, processed[page])
+
+        results['write'] = timed(write_pages, args.repeat)
+
+        def copy_assets():
+            rmtree(target_dir, ignore_errors=True)
+            copier = FileCopier(strategy=args.copy_strategy, workers=args.copy_workers)
+            for asset in assets:
+                copier.submit(source_dir / asset, target_dir / asset)
+            copier.wait()
+
+        results['assets'] = timed(copy_assets, args.repeat)
+
+        def build(incremental: bool):
+            render(
+                engines=[make_engine(args.pretty_html, args.workers, str(cache_dir))],
+                source_dir=str(source_dir),
+                target_dir=str(target_dir),
+                incremental=incremental,
+                copy_strategy=args.copy_strategy,
+                copy_workers=args.copy_workers,
+            )
+
+        rmtree(target_dir, ignore_errors=True)
+        results['build_full'] = timed(lambda: build(incremental=False), args.repeat)
+        results['build_noop'] = timed(lambda: build(incremental=True), args.repeat)
+
+    return {
+        'benchmark': 'render_pipeline',
+        'spec': asdict(spec),
+        'site': site,
+        'settings': {
+            'pretty_html': args.pretty_html,
+            'workers': args.workers,
+            'copy_strategy': args.copy_strategy,
+            'copy_workers': args.copy_workers,
+            'repeat': args.repeat,
+        },
+        'environment': {
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+        },
+        'results': results,
+    }
+
+
+def main() -> None:
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    add_spec_arguments(parser)
+    parser.add_argument('--repeat', type=int, default=3, help='Times to run each phase')
+    parser.add_argument('--pretty-html', default=False, action='store_true')
+    parser.add_argument('--workers', type=int, default=1, help='Worker processes for full builds')
+    parser.add_argument('--copy-strategy', default='copy')
+    parser.add_argument('--copy-workers', type=int, default=4)
+    parser.add_argument('--output', help='File to write the JSON results to')
+    args = parser.parse_args()
+
+    report = run(args)
+    for phase, result in report['results'].items():
+        print(f'{phase:<12} {result["min"] * 1000:10.1f} ms', file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
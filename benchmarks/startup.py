@@ -0,0 +1,190 @@
+"""
+Measures how long the command line tool takes to start, and checks that it only imports what the
+command being run needs.
+
+    python -m benchmarks.startup --repeat 10 --output startup.json
+    python -m benchmarks.compare before.json startup.json
+
+Each command is run in a fresh interpreter with ``python -X importtime``, and these are timed:
+
+- ``import_cli``: Importing :py:mod:`microsite.__main__`, which every command does first.
+- ``help``: Running ``microsite --help`` from start to finish.
+- ``render_noop``: Running ``microsite render`` from start to finish against a small synthetic site
+  which has already been built, so the build itself does almost nothing.
+
+Engines are imported when a project uses them, so none of these should import a publishing engine's
+dependencies, like the Pulumi SDK. Importing the CLI should not import any rendering engine either.
+Exits with status 1 if a command imports a module it should not, or if importing the CLI takes
+longer than ``--max-import-ms``.
+"""
+
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from argparse import ArgumentParser
+from benchmarks.synthetic import SiteSpec, generate_site
+from pathlib import Path
+
+# Packages each command must not import, by the name of the command
+FORBIDDEN_IMPORTS = {
+    'import_cli': ['bs4', 'grpc', 'jinja2', 'markdown', 'pulumi', 'tb_pulumi'],
+    'help': ['bs4', 'grpc', 'jinja2', 'markdown', 'pulumi', 'tb_pulumi'],
+    'render_noop': ['grpc', 'pulumi', 'tb_pulumi'],
+}
+
+PROJECT_FILE = """
+[render]
+source = "site/"
+target = "output/"
+cache_dir = "cache/"
+
+[render.engine.markdown]
+extensions = ["tables", "md_in_html"]
+
+[publish]
+source = "output/"
+
+[publish.targets.production]
+engine = "tbp_s3website"
+pulumi_state_backend = "s3"
+"""
+
+
+def parse_import_times(stderr: str) -> dict:
+    """
+    Reads the report ``python -X importtime`` writes to stderr.
+
+    :return: Dict of every imported module's name to its cumulative import time in microseconds.
+    :rtype: dict[str, int]
+    """
+
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _self, cumulative, name = line[len('import time:') :].split('|')
+        modules[name.strip()] = int(cumulative)
+    return modules
+
+
+def run_command(args: list[str], cwd: str) -> tuple[float, dict]:
+    """
+    Runs the Python interpreter with import timing turned on, against this copy of microsite.
+
+    :return: Tuple of the seconds the process took to run and the modules it imported, as returned
+        by :py:func:`parse_import_times`.
+    :rtype: tuple[float, dict]
+    """
+
+    env = {**os.environ, 'PYTHONPATH': str(Path(__file__).resolve().parent.parent)}
+    start = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', *args],
+        cwd=cwd,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    seconds = time.perf_counter() - start
+    if process.returncode:
+        raise RuntimeError(f'{" ".join(args)} failed:\n{process.stderr[-2000:]}')
+    return seconds, parse_import_times(process.stderr)
+
+
+def summarize(runs: list[float]) -> dict:
+    return {'min': min(runs), 'median': statistics.median(runs), 'runs': runs}
+
+
+def run(args) -> dict:
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='microsite-startup-') as work_dir:
+        generate_site(Path(work_dir) / 'site', SiteSpec(pages=args.pages, assets={}))
+        Path(work_dir, 'project.toml').write_text(PROJECT_FILE)
+
+        # Build the site once, so the timed renders are incremental builds with nothing to do
+        run_command(['-m', 'microsite', 'project.toml', 'render'], cwd=work_dir)
+
+        commands = {
+            'import_cli': ['-c', 'import microsite.__main__'],
+            'help': ['-m', 'microsite', '--help'],
+            'render_noop': ['-m', 'microsite', 'project.toml', 'render'],
+        }
+        for name, command in commands.items():
+            runs = []
+            import_runs = []
+            for _run in range(args.repeat):
+                seconds, modules = run_command(command, cwd=work_dir)
+                runs.append(seconds)
+                import_runs.append(modules.get('microsite.__main__', 0) / 1_000_000)
+            packages = {module.split('.')[0] for module in modules}
+            # Importing the CLI is timed from the import itself, leaving out interpreter startup
+            results[name] = {
+                **summarize(import_runs if name == 'import_cli' else runs),
+                'modules': len(modules),
+                'forbidden_imports': [
+                    package for package in FORBIDDEN_IMPORTS[name] if package in packages
+                ],
+            }
+            print(
+                f'{name:<12} {results[name]["min"] * 1000:8.1f} ms '
+                f'{results[name]["modules"]:6} modules imported',
+                file=sys.stderr,
+            )
+
+    return {
+        'benchmark': 'startup',
+        'spec': {'pages': args.pages},
+        'settings': {'repeat': args.repeat},
+        'environment': {
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+        },
+        'results': results,
+    }
+
+
+def main() -> None:
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pages', type=int, default=20, help='Pages in the synthetic site')
+    parser.add_argument('--repeat', type=int, default=5, help='Times to run each command')
+    parser.add_argument(
+        '--max-import-ms',
+        type=float,
+        help='Fail if importing the CLI takes longer than this many milliseconds at best',
+    )
+    parser.add_argument('--output', help='File to write the JSON results to')
+    args = parser.parse_args()
+
+    report = run(args)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    failed = False
+    for name, result in report['results'].items():
+        if result['forbidden_imports']:
+            print(f'{name} imported {", ".join(result["forbidden_imports"])}', file=sys.stderr)
+            failed = True
+    import_ms = report['results']['import_cli']['min'] * 1000
+    if args.max_import_ms is not None and import_ms > args.max_import_ms:
+        print(
+            f'Importing the CLI took {import_ms:.1f} ms, over the limit of '
+            f'{args.max_import_ms:.1f} ms',
+            file=sys.stderr,
+        )
+        failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+"""
+Generates synthetic source sites for benchmarking. Sites are built from a seeded random number
+generator, so the same settings always produce the same site.
+
+    python -m benchmarks.synthetic /tmp/site --pages 1000 --depth 3
+"""
+
+import json
+import random
+
+from argparse import ArgumentParser
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+WORDS = (
+    'lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut '
+    'labore et dolore magna aliqua enim ad minim veniam quis nostrud exercitation ullamco laboris '
+    'nisi aliquip ex ea commodo consequat duis aute irure in reprehenderit voluptate velit esse '
+    'cillum fugiat nulla pariatur excepteur sint occaecat cupidatat non proident sunt culpa qui '
+    'officia deserunt mollit anim id est laborum'
+).split()
+
+
+@dataclass
+class SiteSpec:
+    """
+    Describes the shape of a synthetic site.
+
+    :param pages: Number of Markdown pages.
+    :param depth: Number of directory levels pages are spread across. 0 puts every page at the top.
+    :param fanout: Number of subdirectories in each directory.
+    :param page_size: Approximate number of words of prose on each page.
+    :param link_density: Links to other pages per 100 words of prose.
+    :param tables: Number of tables on each page.
+    :param md_in_html: Number of ``<div markdown="1">`` blocks on each page.
+    :param assets: Dict of file extensions to a list of ``[count, size in bytes]`` for the binary
+        assets mixed in with the pages.
+    :param seed: Seed for the random number generator.
+    """
+
+    pages: int = 100
+    depth: int = 2
+    fanout: int = 4
+    page_size: int = 500
+    link_density: float = 2.0
+    tables: int = 1
+    md_in_html: int = 1
+    assets: dict = field(default_factory=lambda: {'png': [20, 50_000], 'pdf': [5, 500_000]})
+    seed: int = 1
+
+
+def page_paths(spec: SiteSpec) -> list[str]:
+    """
+    Returns the relative paths of the pages in a site, spread evenly across its directories.
+    """
+
+    directories = ['']
+    level = ['']
+    for _depth in range(spec.depth):
+        level = [f'{parent}dir{n}/' for parent in level for n in range(spec.fanout)]
+        directories.extend(level)
+    return [f'{directories[n % len(directories)]}page{n}.md' for n in range(spec.pages)]
+
+
+def relative_link(from_path: str, to_path: str) -> str:
+    dots = '../' * from_path.count('/')
+    return f'{dots}{to_path}'
+
+
+def make_page(rng: random.Random, spec: SiteSpec, path: str, all_paths: list[str]) -> str:
+    """
+    Returns the Markdown content of one page.
+    """
+
+    lines = [f'# {path}', '']
+    words_left = spec.page_size
+    links_per_word = spec.link_density / 100
+    while words_left > 0:
+        sentence = []
+        for _word in range(min(words_left, rng.randint(8, 20))):
+            word = rng.choice(WORDS)
+            if rng.random() < links_per_word:
+                target = rng.choice(all_paths)
+                word = f'[{word}]({relative_link(path, target)}#section)'
+            elif rng.random() < 0.05:
+                word = f'**{word}**'
+            sentence.append(word)
+        words_left -= len(sentence)
+        lines.extend([' '.join(sentence).capitalize() + '.', ''])
+
+    for n in range(spec.tables):
+        lines.extend([f'## Table {n}', '', '| Key | Value | Notes |', '| --- | ----- | ----- |'])
+        for row in range(10):
+            lines.append(f'| {rng.choice(WORDS)} | {row} | {" ".join(rng.sample(WORDS, 4))} |')
+        lines.append('')
+
+    for n in range(spec.md_in_html):
+        lines.extend(
+            [
+                '<div class="aside" markdown="1">',
+                f'An aside numbered {n} with _emphasis_ and a [link]({relative_link(path, path)}).',
+                '</div>',
+                '',
+            ]
+        )
+
+    return '\n'.join(lines)
+
+
+def generate_site(target_dir: str | Path, spec: SiteSpec) -> dict:
+    """
+    Writes a synthetic site into the target directory.
+
+    :param target_dir: Directory to create the site in. It must not already contain a site.
+    :type target_dir: str | Path
+
+    :param spec: Shape of the site.
+    :type spec: SiteSpec
+
+    :return: Summary of what was generated.
+    :rtype: dict
+    """
+
+    rng = random.Random(spec.seed)
+    target_dir = Path(target_dir)
+    paths = page_paths(spec)
+    total_bytes = 0
+    for path in paths:
+        file = target_dir / path
+        file.parent.mkdir(parents=True, exist_ok=True)
+        content = make_page(rng, spec, path, paths).encode('utf-8')
+        file.write_bytes(content)
+        total_bytes += len(content)
+
+    asset_count = 0
+    for extension, (count, size) in spec.assets.items():
+        for n in range(count):
+            directory = paths[n % len(paths)].rpartition('/')[0] if paths else ''
+            file = target_dir / directory / f'asset{n}.{extension}'
+            file.parent.mkdir(parents=True, exist_ok=True)
+            file.write_bytes(rng.randbytes(size))
+            total_bytes += size
+            asset_count += 1
+
+    return {'pages': len(paths), 'assets': asset_count, 'bytes': total_bytes}
+
+
+def add_spec_arguments(parser: ArgumentParser) -> None:
+    """
+    Adds an argument for each :py:class:`SiteSpec` field to a command line parser.
+    """
+
+    defaults = SiteSpec()
+    parser.add_argument('--pages', type=int, default=defaults.pages)
+    parser.add_argument('--depth', type=int, default=defaults.depth)
+    parser.add_argument('--fanout', type=int, default=defaults.fanout)
+    parser.add_argument('--page-size', type=int, default=defaults.page_size, help='Words per page')
+    parser.add_argument(
+        '--link-density', type=float, default=defaults.link_density, help='Links per 100 words'
+    )
+    parser.add_argument('--tables', type=int, default=defaults.tables, help='Tables per page')
+    parser.add_argument(
+        '--md-in-html', type=int, default=defaults.md_in_html, help='md_in_html blocks per page'
+    )
+    parser.add_argument(
+        '--assets',
+        type=json.loads,
+        default=defaults.assets,
+        help='JSON object of extension to [count, size in bytes], like \'{"png": [20, 50000]}\'',
+    )
+    parser.add_argument('--seed', type=int, default=defaults.seed)
+
+
+def spec_from_args(args) -> SiteSpec:
+    return SiteSpec(
+        **{name: getattr(args, name) for name in asdict(SiteSpec()) if hasattr(args, name)}
+    )
+
+
+def main() -> None:
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('target_dir', help='Directory to create the site in')
+    add_spec_arguments(parser)
+    args = parser.parse_args()
+    print(json.dumps(generate_site(args.target_dir, spec_from_args(args))))
+
+
+if __name__ == '__main__':
+    main()
@@ -3,45 +3,15 @@ Main entrypoint to the microsite command line utility.
 """
 
 import logging
-import tomllib
+import sys
 
 from argparse import ArgumentParser
-from copy import deepcopy
-from microsite.publish.s3 import TbPulumiS3Website
-from microsite.render.markdown import MarkdownRenderEngine
-from microsite.util import AttrDict
-
-
-DEFAULT_PROJECT_CONFIG = {
-    'render': {
-        'source': None,
-        'target': 'output/',
-        'delete_target_dir': True,
-        'engines': ['markdown'],
-        'engine': {
-            'markdown': {
-                'extensions': ['tables', 'md_in_html'],
-                'html_template': 'markdown.html.j2',
-                'pretty_html': False,
-                'rewrite_md_extensions': True,
-                'rewrite_md_urls': True,
-                'stylesheet': 'microsite/render/styles/plain-white.css',
-                'stylesheet_target_name': 'style.css',
-                'title': '',
-            }
-        },
-    }
-}
+from microsite.config import ConfigError, ProjectConfig, load_project
+from microsite.profiling import enable_profiling, get_profiler
+from microsite.registry import PUBLISH_ENGINES, RENDER_ENGINES
 
-MARKDOWN_EXTENSION_DOCS_URL = 'https://github.com/Python-Markdown/markdown/blob/master/docs/extensions/index.md#officially-supported-extensions'
-
-PUBLISH_ENGINE_CLASS_MAP = {
-    'tbp_s3website': TbPulumiS3Website,
-}
 
-RENDER_ENGINE_CLASS_MAP = {
-    'markdown': MarkdownRenderEngine,
-}
+MARKDOWN_EXTENSION_DOCS_URL = 'https://github.com/Python-Markdown/markdown/blob/master/docs/extensions/index.md#officially-supported-extensions'
 
 
 def parse_args() -> None:
@@ -64,10 +34,83 @@ def parse_args() -> None:
         default=False,
         action='store_true',
     )
+    parser.add_argument(
+        '--profile',
+        help=(
+            'Record how long each phase of the run takes, and write a summary to PREFIX.json and a '
+            'Chrome trace to PREFIX.trace.json. PREFIX defaults to "microsite-profile".'
+        ),
+        nargs='?',
+        const='microsite-profile',
+        default=None,
+        metavar='PREFIX',
+    )
+    parser.add_argument(
+        '--profile-top',
+        help='Number of slowest pages to list in the profile summary',
+        type=int,
+        default=10,
+    )
     subparsers = parser.add_subparsers(help='Runmode for the tool', dest='runmode')
-    _render_parser = subparsers.add_parser(
+    render_parser = subparsers.add_parser(
         'render', help='Run in render mode to convert content into web content'
     )
+    render_parser.add_argument(
+        '-f',
+        '--full',
+        help=(
+            'Ignore the output of any previous build, delete the target directory, and render '
+            'everything from scratch.'
+        ),
+        default=False,
+        action='store_true',
+    )
+    render_parser.add_argument(
+        '-j',
+        '--jobs',
+        help=(
+            'Number of worker processes to render pages with. Overrides the "workers" setting in '
+            'the project file.'
+        ),
+        type=int,
+        default=None,
+    )
+    watch_parser = subparsers.add_parser(
+        'watch',
+        help='Render the site, then render it again whenever its source files change',
+    )
+    watch_parser.add_argument(
+        '-j',
+        '--jobs',
+        help=(
+            'Number of worker processes to render pages with. Overrides the "workers" setting in '
+            'the project file.'
+        ),
+        type=int,
+        default=None,
+    )
+    watch_parser.add_argument(
+        '--debounce',
+        help='Milliseconds to wait for a burst of changes to settle before rebuilding',
+        type=int,
+        default=200,
+    )
+    watch_parser.add_argument(
+        '--poll',
+        help='Poll the file system for changes instead of using inotify',
+        default=False,
+        action='store_true',
+    )
+    watch_parser.add_argument(
+        '--interval',
+        help='Seconds between scans for changes when polling',
+        type=float,
+        default=0.5,
+    )
+    subparsers.add_parser(
+        'rollback',
+        help='Replace the rendered site with the build before it, if one was kept',
+    )
     publish_parser = subparsers.add_parser(
         'publish',
         help='Run in publish mode to alter a live site',
@@ -89,16 +132,109 @@ def parse_args() -> None:
         default=False,
         action='store_true',
     )
+    publish_parser.add_argument(
+        '--force-infra',
+        help=(
+            "Update the site's infrastructure even if nothing it is built from has changed since "
+            'the last publish.'
+        ),
+        default=False,
+        action='store_true',
+    )
+    publish_parser.add_argument(
+        '-p',
+        '--parallel',
+        help=(
+            'Publish the targets at the same time instead of one after another, at most N at once. '
+            'N defaults to the "max_parallel" setting in the project file.'
+        ),
+        nargs='?',
+        type=int,
+        const=0,
+        default=None,
+        metavar='N',
+    )
 
     return parser.parse_args()
 
 
-def get_config(config_file: str) -> AttrDict:
-    config = deepcopy(DEFAULT_PROJECT_CONFIG)
-    with open(config_file, 'rb') as fh:
-        config.update(tomllib.load(fh))
+def get_config(config_file: str) -> ProjectConfig:
+    """
+    Loads and checks the project file. See :py:mod:`microsite.config` for the settings it may hold
+    and their defaults.
+
+    :param config_file: Path to the project's TOML file.
+    :type config_file: str
+
+    :raises ConfigError: When the project file or any of its settings is not valid.
+
+    :return: The project configuration.
+    :rtype: ProjectConfig
+    """
+
+    return load_project(config_file)
+
+
+def get_render_engines(project: ProjectConfig, workers: int = None) -> list:
+    """
+    Builds the rendering engines enabled in the project, importing only the engines it uses.
+
+    :param project: The project configuration.
+    :type project: ProjectConfig
+
+    :param workers: Number of worker processes each engine may use. When None, the project's
+        ``render.workers`` setting is used.
+    :type workers: int, optional
+
+    :return: List of rendering engines.
+    :rtype: list[microsite.render.RenderEngine]
+    """
+
+    return [
+        RENDER_ENGINES.load(engine)(
+            config=project.render.engine_config(engine),
+            index=project.render.index,
+            workers=workers or project.render.workers,
+            cache_dir=project.render.cache_dir,
+        )
+        for engine in project.render.engines
+    ]
+
+
+def render_project(project: ProjectConfig, engines: list, full: bool = False) -> None:
+    """
+    Renders the project's source files with the given engines.
+
+    :param project: The project configuration.
+    :type project: ProjectConfig
+
+    :param engines: The rendering engines to use.
+    :type engines: list[microsite.render.RenderEngine]
 
-    return AttrDict(config)
+    :param full: When True, ignore any previous build and render everything. Defaults to False.
+    :type full: bool, optional
+    """
+
+    from microsite.render import render
+
+    settings = project.render
+    render(
+        engines=engines,
+        source_dir=settings.source,
+        target_dir=settings.target,
+        delete_target_dir=settings.delete_target_dir,
+        incremental=settings.incremental and not full,
+        exclude=list(settings.exclude),
+        copy_strategy=settings.copy_strategy,
+        copy_workers=settings.copy_workers,
+        atomic=settings.atomic,
+        keep_builds=settings.keep_builds,
+        compress=list(settings.compress),
+        compress_min_size=settings.compress_min_size,
+        compress_workers=settings.compress_workers,
+        fingerprint_assets=list(settings.fingerprint_assets),
+        cache_dir=settings.cache_dir,
+    )
 
 
 def setup_logging(verbose: bool = False) -> None:
@@ -134,39 +270,101 @@ def main() -> None:
     logging.debug(f'Running in {args.runmode} mode')
 
     # Load the project config file
-    project = get_config(args.project)
+    try:
+        project = get_config(args.project)
+        if args.runmode in ('render', 'watch') and not project.render.source:
+            raise ConfigError('render.source', 'is required to render the site')
+    except ConfigError as ex:
+        logging.error(f'Invalid project file {args.project}: {ex}')
+        sys.exit(1)
+
+    if args.profile:
+        enable_profiling()
+    try:
+        run(args, project)
+    except ConfigError as ex:
+        # Engines from other packages check their own settings when they are built
+        logging.error(f'Invalid project file {args.project}: {ex}')
+        sys.exit(1)
+    finally:
+        if args.profile:
+            get_profiler().write(args.profile, slowest=args.profile_top)
+
+
+def run(args, project: ProjectConfig) -> None:
+    """
+    Does the work of the selected run mode.
+
+    :param args: The parsed command line arguments.
+
+    :param project: The project configuration.
+    :type project: ProjectConfig
+    """
 
     # Render Mode
     if args.runmode == 'render':
-        from microsite.render import render
+        render_engines = get_render_engines(project, workers=args.jobs)
+        render_project(project, render_engines, full=args.full)
 
-        render_engines = [
-            RENDER_ENGINE_CLASS_MAP[engine](
-                config=AttrDict(project.render.engine[engine]),
-                index=project.render.index if project.render.index else {},
-            )
-            for engine in project.render.engines
-        ]
-
-        render(
-            engines=render_engines,
-            source_dir=project.render.source,
-            target_dir=project.render.target,
-            delete_target_dir=project.render.delete_target_dir,
+    # Watch Mode
+    if args.runmode == 'watch':
+        from microsite.render.staging import builds_dir
+        from microsite.watch import watch
+
+        render_engines = get_render_engines(project, workers=args.jobs)
+        watch_paths = [project.render.source]
+        for engine in render_engines:
+            watch_paths.extend(engine.watch_paths())
+        watch(
+            rebuild=lambda: render_project(project, render_engines),
+            paths=watch_paths,
+            ignore=[
+                project.render.target,
+                builds_dir(project.render.target),
+                project.render.cache_dir,
+            ],
+            debounce=args.debounce / 1000,
+            poll=args.poll,
+            interval=args.interval,
         )
 
+    # Rollback Mode
+    if args.runmode == 'rollback':
+        from microsite.render.staging import rollback
+
+        rollback(project.render.target)
+
     # Publish Mode
     if args.runmode == 'publish':
-        for target in project.publish.targets:
-            target_config = AttrDict(project.publish.targets[target])
-            PUBLISH_ENGINE_CLASS_MAP[target_config.engine](
+
+        def publish_target(target: str, target_config) -> None:
+            PUBLISH_ENGINES.load(project.publish.target_engine(target))(
                 name=target,
                 source_dir=project.publish.source,
                 config=target_config,
                 dry_run=args.dry_run,
                 destroy=args.destroy,
+                force_infra=args.force_infra,
             ).publish()
 
+        if args.parallel is None:
+            for target, target_config in project.publish.targets.items():
+                publish_target(target, target_config)
+        elif project.publish.targets:
+            from microsite.publish.parallel import publish_targets
+
+            results = publish_targets(
+                targets=project.publish.targets,
+                publish=publish_target,
+                engines={
+                    target: project.publish.target_engine(target)
+                    for target in project.publish.targets
+                },
+                workers=args.parallel or project.publish.max_parallel,
+            )
+            if not all(result.succeeded for result in results):
+                sys.exit(1)
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,521 @@
+"""
+Module describing the settings a project file may contain. A project file is read and checked once,
+when it is loaded, into a tree of frozen dataclasses. Every setting has its default filled in, so
+the rest of the program reads settings as plain attributes without checking whether they were
+given.
+
+Each table in the project file is merged with its defaults on its own, so leaving one option out of
+a table (like ``[render.engine.markdown]``) does not lose the defaults of its neighbors.
+"""
+
+import tomllib
+import types
+import typing
+
+from collections.abc import Mapping
+from dataclasses import MISSING, asdict, dataclass, field, fields
+from microsite.filecopy import COPY_STRATEGIES
+from microsite.registry import PUBLISH_ENGINES, RENDER_ENGINES
+from typing import Any
+
+
+class ConfigError(ValueError):
+    """
+    Raised when a project's settings are not valid.
+
+    :param path: Dotted path to the setting at fault, such as ``render.engine.markdown.workers``.
+    :type path: str
+
+    :param message: What is wrong with the setting.
+    :type message: str
+    """
+
+    def __init__(self, path: str, message: str):
+        self.path = path
+        self.message = message
+        super().__init__(f'{path}: {message}' if path else message)
+
+
+class FrozenDict(dict):
+    """
+    A dict which cannot be changed once it has been built.
+    """
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError(f'{type(self).__name__} cannot be modified')
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _immutable
+    __ior__ = _immutable
+
+    def __reduce__(self):
+        return (type(self), (dict(self),))
+
+    def __hash__(self):
+        return hash(tuple(sorted(self.items())))
+
+
+class ConfigSection:
+    """
+    Base class of every table in a project's settings.
+    """
+
+    __slots__ = ()
+
+    def as_dict(self) -> dict:
+        """
+        Returns the settings as plain data, suitable for hashing or serializing.
+
+        :return: Dict of the settings.
+        :rtype: dict
+        """
+
+        return asdict(self)
+
+
+def join_path(path: str, key: str) -> str:
+    """
+    Appends a key to a dotted settings path, quoting it if it contains dots or slashes, as TOML
+    would.
+    """
+
+    if not key.replace('_', '').replace('-', '').isalnum():
+        key = f'"{key}"'
+    return f'{path}.{key}' if path else key
+
+
+def describe(value) -> str:
+    """
+    Describes a setting's value for an error message.
+    """
+
+    names = {bool: 'a boolean', int: 'an integer', float: 'a number', str: 'a string'}
+    names.update({list: 'a list', dict: 'a table'})
+    return f'{names.get(type(value), type(value).__name__)} ({value!r})'
+
+
+def load_value(hint, value, path: str, options: Mapping = types.MappingProxyType({})):
+    """
+    Checks a single setting against its type hint, converting lists to tuples and tables to their
+    dataclasses.
+
+    :param hint: Type hint of the setting.
+
+    :param value: The setting's value from the project file.
+
+    :param path: Dotted path to the setting, for error messages.
+    :type path: str
+
+    :param options: Extra constraints from the field's metadata: ``choices``, the values allowed,
+        and ``minimum``, the smallest number allowed.
+    :type options: Mapping, optional
+
+    :raises ConfigError: When the value is not valid.
+
+    :return: The checked value.
+    """
+
+    origin = typing.get_origin(hint)
+    args = typing.get_args(hint)
+
+    if hint is Any:
+        return value
+    if origin in (types.UnionType, typing.Union):
+        if value is None and type(None) in args:
+            return None
+        (hint,) = [arg for arg in args if arg is not type(None)]
+        return load_value(hint, value, path, options)
+    if isinstance(hint, type) and issubclass(hint, ConfigSection):
+        if isinstance(value, hint):
+            return value
+        if not isinstance(value, Mapping):
+            raise ConfigError(path, f'expected a table, got {describe(value)}')
+        return load_section(hint, value, path)
+    if origin is tuple:
+        if not isinstance(value, (list, tuple)):
+            raise ConfigError(path, f'expected a list, got {describe(value)}')
+        return tuple(
+            load_value(args[0], item, f'{path}[{number}]', options)
+            for number, item in enumerate(value)
+        )
+    if origin is Mapping:
+        if not isinstance(value, Mapping):
+            raise ConfigError(path, f'expected a table, got {describe(value)}')
+        return FrozenDict(
+            {key: load_value(args[1], item, join_path(path, key)) for key, item in value.items()}
+        )
+
+    if hint is float and type(value) is int:
+        value = float(value)
+    # bool is a subclass of int, but a boolean is never meant as a number
+    if type(value) is not hint:
+        names = {bool: 'a boolean', int: 'an integer', float: 'a number', str: 'a string'}
+        raise ConfigError(path, f'expected {names[hint]}, got {describe(value)}')
+    if 'choices' in options and value not in options['choices']:
+        choices = ', '.join(repr(choice) for choice in options['choices'])
+        raise ConfigError(path, f'must be one of {choices}, not {value!r}')
+    if 'minimum' in options and value < options['minimum']:
+        raise ConfigError(path, f'must be at least {options["minimum"]}, not {value!r}')
+    return value
+
+
+def load_section(schema: type, data: Mapping, path: str = '') -> ConfigSection:
+    """
+    Builds a settings dataclass from a table of a project file. Options which are left out take
+    their defaults.
+
+    :param schema: The :py:class:`ConfigSection` dataclass describing the table.
+    :type schema: type
+
+    :param data: The table's contents.
+    :type data: Mapping
+
+    :param path: Dotted path to the table, for error messages.
+    :type path: str, optional
+
+    :raises ConfigError: When the table holds an unknown option, is missing a required one, or
+        holds a value of the wrong type.
+
+    :return: An instance of ``schema``.
+    :rtype: ConfigSection
+    """
+
+    if hasattr(schema, 'from_table'):
+        return schema.from_table(data, path)
+
+    hints = typing.get_type_hints(schema)
+    known = {option.name: option for option in fields(schema)}
+    for key in data:
+        if key not in known:
+            raise ConfigError(join_path(path, key), 'is not a recognized option')
+
+    values = {}
+    for name, option in known.items():
+        if name in data:
+            values[name] = load_value(
+                hints[name], data[name], join_path(path, name), option.metadata
+            )
+        elif option.default is MISSING and option.default_factory is MISSING:
+            raise ConfigError(join_path(path, name), 'is required')
+    return schema(**values)
+
+
+@dataclass(frozen=True, slots=True)
+class MarkdownEngineConfig(ConfigSection):
+    """
+    Settings of the Markdown rendering engine, from ``[render.engine.markdown]``. See
+    :py:class:`microsite.render.markdown.MarkdownRenderEngine`.
+    """
+
+    extensions: tuple[str, ...] = ('tables', 'md_in_html')
+    html_template: str | None = None
+    minify_css: bool | None = None
+    pretty_html: bool = False
+    rewrite_md_extensions: bool = True
+    rewrite_md_urls: bool = True
+    search_index: bool = False
+    search_client: bool = False
+    search_dir: str = 'search'
+    search_prefix_length: int = field(default=2, metadata={'minimum': 1})
+    stylesheet: str | None = None
+    stylesheet_target_name: str = 'style.css'
+    title: str = ''
+
+
+@dataclass(frozen=True, slots=True)
+class IndexEntry(ConfigSection):
+    """
+    Settings for a single page, from ``[render.index."path/to/page.md"]``. Besides the options
+    below, an entry may hold any number of template variables named starting with ``md_``, which
+    are kept in ``variables``.
+    """
+
+    title: str | None = None
+    tags: tuple[str, ...] = ()
+    variables: Mapping[str, Any] = field(default_factory=FrozenDict)
+
+    @classmethod
+    def from_table(cls, data: Mapping, path: str) -> 'IndexEntry':
+        variables = {key: value for key, value in data.items() if key.startswith('md_')}
+        options = {key: value for key, value in data.items() if not key.startswith('md_')}
+        if 'variables' in options:
+            raise ConfigError(join_path(path, 'variables'), 'is not a recognized option')
+        hints = typing.get_type_hints(cls)
+        for key in options:
+            if key not in hints:
+                raise ConfigError(join_path(path, key), 'is not a recognized option')
+        values = {
+            key: load_value(hints[key], value, join_path(path, key))
+            for key, value in options.items()
+        }
+        return cls(**values, variables=FrozenDict(variables))
+
+    def as_dict(self) -> dict:
+        """
+        Returns the settings which were given, in the form they take in the project file, with the
+        template variables alongside the other options.
+
+        :return: Dict of the settings.
+        :rtype: dict
+        """
+
+        settings = {}
+        if self.title is not None:
+            settings['title'] = self.title
+        if self.tags:
+            settings['tags'] = list(self.tags)
+        settings.update(self.variables)
+        return settings
+
+
+# Settings dataclasses of the rendering engines built into microsite, by the engine names used in
+# the project file. Settings of engines from other packages are kept as they were given, and checked
+# by the engine against its own config_schema when it is built.
+RENDER_ENGINE_SCHEMAS = {
+    'markdown': MarkdownEngineConfig,
+}
+
+
+@dataclass(frozen=True, slots=True)
+class RenderConfig(ConfigSection):
+    """
+    Settings of the render step, from ``[render]``. See :py:func:`microsite.render.render` for what
+    most of them do.
+    """
+
+    source: str | None = None
+    target: str = 'output/'
+    delete_target_dir: bool = True
+    cache_dir: str = '.microsite-cache/'
+    incremental: bool = True
+    workers: int = field(default=1, metadata={'minimum': 1})
+    exclude: tuple[str, ...] = ()
+    copy_strategy: str = field(default='copy', metadata={'choices': tuple(COPY_STRATEGIES)})
+    copy_workers: int = field(default=4, metadata={'minimum': 1})
+    atomic: bool = True
+    keep_builds: int = field(default=1, metadata={'minimum': 0})
+    compress: tuple[str, ...] = ()
+    compress_min_size: int = field(default=1024, metadata={'minimum': 0})
+    compress_workers: int = field(default=4, metadata={'minimum': 1})
+    fingerprint_assets: tuple[str, ...] = ()
+    engines: tuple[str, ...] = ('markdown',)
+    engine: Mapping[str, ConfigSection] = field(default_factory=FrozenDict)
+    index: Mapping[str, IndexEntry] = field(default_factory=FrozenDict)
+
+    @classmethod
+    def from_table(cls, data: Mapping, path: str) -> 'RenderConfig':
+        data = dict(data)
+        engine_tables = data.pop('engine', {})
+        if not isinstance(engine_tables, Mapping):
+            raise ConfigError(join_path(path, 'engine'), 'expected a table')
+        engine_path = join_path(path, 'engine')
+        engines = {}
+        for name, table in engine_tables.items():
+            if name in RENDER_ENGINE_SCHEMAS:
+                schema = RENDER_ENGINE_SCHEMAS[name]
+            elif name in RENDER_ENGINES:
+                schema = Mapping[str, Any]
+            else:
+                raise ConfigError(join_path(engine_path, name), 'is not a known rendering engine')
+            engines[name] = load_value(schema, table, join_path(engine_path, name))
+
+        hints = typing.get_type_hints(cls)
+        known = {option.name: option for option in fields(cls) if option.name != 'engine'}
+        for key in data:
+            if key not in known:
+                raise ConfigError(join_path(path, key), 'is not a recognized option')
+        values = {
+            key: load_value(hints[key], value, join_path(path, key), known[key].metadata)
+            for key, value in data.items()
+        }
+        for number, name in enumerate(values.get('engines', known['engines'].default)):
+            if name not in RENDER_ENGINE_SCHEMAS and name not in RENDER_ENGINES:
+                raise ConfigError(
+                    f'{join_path(path, "engines")}[{number}]',
+                    f'{name!r} is not a known rendering engine',
+                )
+        return cls(**values, engine=FrozenDict(engines))
+
+    def engine_config(self, name: str) -> ConfigSection | Mapping:
+        """
+        Returns the settings of a rendering engine, which are all defaults when the project file
+        has no table for it.
+
+        :param name: Name of the engine.
+        :type name: str
+
+        :return: The engine's settings. For an engine which is not built into microsite, this is
+            the engine's table as it was given.
+        :rtype: ConfigSection | Mapping
+        """
+
+        if name in self.engine:
+            return self.engine[name]
+        if name in RENDER_ENGINE_SCHEMAS:
+            return RENDER_ENGINE_SCHEMAS[name]()
+        return FrozenDict()
+
+
+@dataclass(frozen=True, slots=True)
+class PulumiTargetConfig(ConfigSection):
+    """
+    Settings common to every Pulumi publishing target. See
+    :py:class:`microsite.publish.PulumiPublishEngine`.
+    """
+
+    engine: str
+    pulumi_state_backend: str = field(metadata={'choices': ('s3', 'cloud')})
+    project_name: str = 'project_name'
+    project_description: str = 'project_description'
+    aws_region: str = 'us-east-1'
+    pulumi_access_token_file: str | None = None
+    pulumi_passphrase_file: str | None = None
+    pulumi_log: str = 'pulumi.log'
+    pulumi_error_log: str = 'pulumi.err'
+    pulumi_event_log: str | None = 'pulumi.events.jsonl'
+    pulumi_stack_name: str | None = None
+    pulumi_state_s3_bucket: str | None = None
+    pulumi_work_dir: str | None = None
+    persist_work_dir: bool | None = None
+    pulumi_env_cache: bool = True
+    pulumi_cache_dir: str | None = None
+
+
+@dataclass(frozen=True, slots=True)
+class S3WebsiteTargetConfig(PulumiTargetConfig):
+    """
+    Settings of a ``tbp_s3website`` publishing target. See
+    :py:class:`microsite.publish.s3.TbPulumiS3Website`.
+    """
+
+    publish_bucket: str | None = None
+    index_document: str = 'index.html'
+    acm_certificate_arn: str | None = None
+    domain: str | None = None
+    subdomain: str | None = None
+    route53_zone_id: str | None = None
+    invalidate_cache: bool = True
+    invalidation_max_paths: int = field(default=1000, metadata={'minimum': 1})
+    invalidation_wildcard_ratio: float = field(default=0.5, metadata={'minimum': 0.0})
+
+
+@dataclass(frozen=True, slots=True)
+class S3SyncTargetConfig(ConfigSection):
+    """
+    Settings of an ``s3sync`` publishing target. See
+    :py:class:`microsite.publish.s3sync.S3SyncPublishEngine`.
+    """
+
+    engine: str
+    bucket: str
+    prefix: str = ''
+    aws_region: str | None = None
+    aws_profile: str | None = None
+    endpoint_url: str | None = None
+    delete: bool = True
+    exclude: tuple[str, ...] = ()
+    workers: int = field(default=16, metadata={'minimum': 1})
+    multipart_threshold: int = field(default=16 * 2**20, metadata={'minimum': 5 * 2**20})
+    multipart_chunk_size: int = field(default=16 * 2**20, metadata={'minimum': 5 * 2**20})
+    content_encoding: str | None = field(default=None, metadata={'choices': ('gzip', 'br')})
+    cache_control: str | None = None
+    immutable_cache_control: str = 'public, max-age=31536000, immutable'
+    cloudfront_distribution_id: str | None = None
+    index_document: str = 'index.html'
+    invalidation_max_paths: int = field(default=1000, metadata={'minimum': 1})
+    invalidation_wildcard_ratio: float = field(default=0.5, metadata={'minimum': 0.0})
+
+
+# Settings dataclasses of the publishing engines built into microsite, by the engine names used in
+# the project file. As with rendering engines, targets of other engines are checked when the engine
+# is built.
+PUBLISH_ENGINE_SCHEMAS = {
+    's3sync': S3SyncTargetConfig,
+    'tbp_s3website': S3WebsiteTargetConfig,
+}
+
+
+@dataclass(frozen=True, slots=True)
+class PublishConfig(ConfigSection):
+    """
+    Settings of the publish step, from ``[publish]``. Each of the ``targets`` is checked against
+    the settings of the publishing engine it names.
+    """
+
+    source: str | None = None
+    max_parallel: int = field(default=4, metadata={'minimum': 1})
+    targets: Mapping[str, ConfigSection | Mapping] = field(default_factory=FrozenDict)
+
+    @classmethod
+    def from_table(cls, data: Mapping, path: str) -> 'PublishConfig':
+        for key in data:
+            if key not in ('source', 'max_parallel', 'targets'):
+                raise ConfigError(join_path(path, key), 'is not a recognized option')
+        source = load_value(str | None, data.get('source'), join_path(path, 'source'))
+        max_parallel = load_value(
+            int, data.get('max_parallel', 4), join_path(path, 'max_parallel'), {'minimum': 1}
+        )
+        target_tables = load_value(
+            Mapping[str, Any], data.get('targets', {}), join_path(path, 'targets')
+        )
+        targets = {}
+        for name, table in target_tables.items():
+            target_path = join_path(join_path(path, 'targets'), name)
+            if not isinstance(table, Mapping):
+                raise ConfigError(target_path, f'expected a table, got {describe(table)}')
+            if table.get('engine') is None:
+                raise ConfigError(join_path(target_path, 'engine'), 'is required')
+            engine = load_value(str, table['engine'], join_path(target_path, 'engine'))
+            if engine in PUBLISH_ENGINE_SCHEMAS:
+                targets[name] = load_section(PUBLISH_ENGINE_SCHEMAS[engine], table, target_path)
+            elif engine in PUBLISH_ENGINES:
+                targets[name] = FrozenDict(table)
+            else:
+                raise ConfigError(
+                    join_path(target_path, 'engine'), f'{engine!r} is not a known publishing engine'
+                )
+        return cls(source=source, max_parallel=max_parallel, targets=FrozenDict(targets))
+
+    def target_engine(self, name: str) -> str:
+        """
+        Returns the name of the publishing engine a target uses.
+
+        :param name: Name of the target.
+        :type name: str
+
+        :return: Name of the engine.
+        :rtype: str
+        """
+
+        target = self.targets[name]
+        return target['engine'] if isinstance(target, Mapping) else target.engine
+
+
+@dataclass(frozen=True, slots=True)
+class ProjectConfig(ConfigSection):
+    """
+    All of a project's settings.
+    """
+
+    render: RenderConfig = field(default_factory=RenderConfig)
+    publish: PublishConfig = field(default_factory=PublishConfig)
+
+
+def load_project(config_file: str) -> ProjectConfig:
+    """
+    Reads and checks a project file.
+
+    :param config_file: Path to the project's TOML file.
+    :type config_file: str
+
+    :raises ConfigError: When the file is not valid TOML, or any of its settings are not valid.
+
+    :return: The project's settings.
+    :rtype: ProjectConfig
+    """
+
+    with open(config_file, 'rb') as file:
+        try:
+            data = tomllib.load(file)
+        except tomllib.TOMLDecodeError as ex:
+            raise ConfigError('', f'{config_file} is not a valid TOML file: {ex}')
+    return load_section(ProjectConfig, data)
@@ -0,0 +1,265 @@
+"""
+Module for copying files into a build using the cheapest method the file system supports.
+"""
+
+import errno
+import fcntl
+import logging
+import os
+import shutil
+import threading
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from microsite.util import hash_file
+from pathlib import Path
+
+log = logging.getLogger(__name__)
+
+COPY_STRATEGIES = ['copy', 'hardlink', 'reflink', 'copy_file_range']
+
+# From <linux/fs.h>; asks the file system to share the source file's blocks with the target
+FICLONE = 0x40049409
+
+# Errors which mean a strategy is not supported here, as opposed to a real failure
+_UNSUPPORTED_ERRNOS = {
+    errno.EXDEV,
+    errno.EPERM,
+    errno.EOPNOTSUPP,
+    errno.ENOTTY,
+    errno.EINVAL,
+    errno.ENOSYS,
+    errno.EMLINK,
+}
+
+
+def is_unchanged(source: Path, target: Path, source_hash: str = None) -> bool:
+    """
+    Determines if the target is already an up to date copy of the source: either the same file
+    (through a hard link) or a file with the same size, modification time, and content hash.
+
+    :param source: The file being copied.
+    :type source: Path
+
+    :param target: Where the file is being copied to.
+    :type target: Path
+
+    :param source_hash: The source file's content hash, if it is already known.
+    :type source_hash: str, optional
+
+    :return: True if the target does not need to be copied again.
+    :rtype: bool
+    """
+
+    try:
+        target_stat = target.stat()
+    except FileNotFoundError:
+        return False
+    source_stat = source.stat()
+    if os.path.samestat(source_stat, target_stat):
+        return True
+    if (
+        source_stat.st_size != target_stat.st_size
+        or source_stat.st_mtime_ns != target_stat.st_mtime_ns
+    ):
+        return False
+    return (source_hash or hash_file(source)) == hash_file(target)
+
+
+def copy_file(
+    source: str | Path,
+    target: str | Path,
+    strategy: str = 'copy',
+    skip_unchanged: bool = True,
+    source_hash: str = None,
+) -> bool:
+    """
+    Copies a file using the given strategy. Strategies which the file system does not support fall
+    back to an ordinary copy. The strategies are:
+
+    - ``copy``: Copy the file's contents.
+    - ``hardlink``: Make the target a hard link to the source. This takes no extra space and no time
+      at all, but the two paths are then the same file, so a later in-place edit to the source also
+      changes the build.
+    - ``reflink``: Make the target a copy-on-write clone of the source, on file systems which
+      support this (like Btrfs and XFS). This is as fast as a hard link, but the two files are
+      independent.
+    - ``copy_file_range``: Copy the file's contents inside the kernel without passing them through
+      this program. Some file systems make this a server-side or copy-on-write copy.
+
+    The target's modification time is set to match the source's. Any existing target is removed
+    before copying rather than overwritten, so a file hard linked from some other build is never
+    changed.
+
+    :param source: The file to copy.
+    :type source: str | Path
+
+    :param target: Where to copy the file to. Parent directories are created as needed.
+    :type target: str | Path
+
+    :param strategy: One of ``COPY_STRATEGIES``. Defaults to ``copy``.
+    :type strategy: str, optional
+
+    :param skip_unchanged: When True, do nothing if the target already has the same size,
+        modification time and content hash as the source. Defaults to True.
+    :type skip_unchanged: bool, optional
+
+    :param source_hash: The source file's content hash, if it is already known.
+    :type source_hash: str, optional
+
+    :raises ValueError: When the strategy is not recognized.
+
+    :return: True if the file was copied, False if it was skipped.
+    :rtype: bool
+    """
+
+    if strategy not in COPY_STRATEGIES:
+        raise ValueError(
+            f'Unknown copy strategy "{strategy}". Choose one of: {", ".join(COPY_STRATEGIES)}'
+        )
+
+    source = Path(source)
+    target = Path(target)
+    if skip_unchanged and is_unchanged(source, target, source_hash=source_hash):
+        log.debug(f'Skipping unchanged file {target}')
+        return False
+
+    target.parent.mkdir(parents=True, exist_ok=True)
+    target.unlink(missing_ok=True)
+
+    try:
+        if strategy == 'hardlink':
+            os.link(source, target)
+            return True
+        if strategy == 'reflink':
+            _reflink(source, target)
+        elif strategy == 'copy_file_range':
+            _copy_file_range(source, target)
+        else:
+            shutil.copy2(source, target)
+            return True
+    except (OSError, AttributeError) as ex:
+        if isinstance(ex, OSError) and ex.errno not in _UNSUPPORTED_ERRNOS:
+            raise
+        log.debug(f'Unable to {strategy} {source} ({ex}); copying it instead.')
+        target.unlink(missing_ok=True)
+        shutil.copy2(source, target)
+        return True
+
+    shutil.copystat(source, target)
+    return True
+
+
+def _reflink(source: Path, target: Path) -> None:
+    with source.open('rb') as src, target.open('wb') as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+
+def _copy_file_range(source: Path, target: Path) -> None:
+    with source.open('rb') as src, target.open('wb') as dst:
+        remaining = os.fstat(src.fileno()).st_size
+        while remaining > 0:
+            copied = os.copy_file_range(src.fileno(), dst.fileno(), remaining)
+            if copied == 0:
+                break
+            remaining -= copied
+
+
+class FileCopier:
+    """
+    Copies files on a pool of threads, so that many copies (which mostly wait on the disk) can be in
+    progress at the same time, and so that copying can go on while other work happens.
+
+    Only a limited number of copies may wait their turn at once. Once that many are waiting,
+    :py:meth:`submit` blocks until one finishes, so the memory held by pending copies stays the same
+    however many files there are to copy.
+
+    :param strategy: One of ``COPY_STRATEGIES``. Defaults to ``copy``.
+    :type strategy: str, optional
+
+    :param workers: Number of copies to run at once. Defaults to 4.
+    :type workers: int, optional
+
+    :param max_pending: Number of copies which may be submitted but unfinished at once. Defaults to
+        64 per worker.
+    :type max_pending: int, optional
+
+    :raises ValueError: When the strategy is not recognized.
+    """
+
+    def __init__(self, strategy: str = 'copy', workers: int = 4, max_pending: int = None):
+        if strategy not in COPY_STRATEGIES:
+            raise ValueError(
+                f'Unknown copy strategy "{strategy}". Choose one of: {", ".join(COPY_STRATEGIES)}'
+            )
+        self.strategy = strategy
+        workers = max(workers, 1)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='copy')
+        self.slots = threading.Semaphore(max_pending or workers * 64)
+        self.copied = 0
+        self.skipped = 0
+        self.error = None
+        self._lock = threading.Lock()
+
+    def submit(self, source: str | Path, target: str | Path, source_hash: str = None) -> Future:
+        """
+        Schedules a file to be copied with :py:func:`copy_file`.
+
+        :param source: The file to copy.
+        :type source: str | Path
+
+        :param target: Where to copy the file to.
+        :type target: str | Path
+
+        :param source_hash: The source file's content hash, if it is already known.
+        :type source_hash: str, optional
+
+        :return: A future which resolves to True if the file was copied or False if it was skipped.
+        :rtype: Future
+        """
+
+        self.slots.acquire()
+        try:
+            future = self.executor.submit(
+                copy_file, source, target, strategy=self.strategy, source_hash=source_hash
+            )
+        except BaseException:
+            self.slots.release()
+            raise
+        future.add_done_callback(self._finished)
+        return future
+
+    def _finished(self, future: Future) -> None:
+        with self._lock:
+            if future.cancelled():
+                pass
+            elif future.exception():
+                self.error = self.error or future.exception()
+            elif future.result():
+                self.copied += 1
+            else:
+                self.skipped += 1
+        self.slots.release()
+
+    def wait(self) -> tuple[int, int]:
+        """
+        Waits for every scheduled copy to finish and shuts down the thread pool.
+
+        :raises OSError: The first error any copy ran into.
+
+        :return: Tuple of the number of files copied and the number skipped because they were
+            unchanged.
+        :rtype: tuple[int, int]
+        """
+
+        self.executor.shutdown(wait=True)
+        if self.error:
+            raise self.error
+        return self.copied, self.skipped
+
+    def cancel(self) -> None:
+        """
+        Abandons any copies which have not started yet, waits for those in progress, and shuts down
+        the thread pool.
+        """
+
+        self.executor.shutdown(wait=True, cancel_futures=True)
@@ -1,22 +1,28 @@
 import logging
+import os
 
+from collections.abc import Iterator
+from fnmatch import fnmatchcase
 from pathlib import Path
 
 log = logging.getLogger(__name__)
 
+IGNORE_FILENAME = '.micrositeignore'
 
-def get_all_paths(source_dir: str | Path, top_dir: str | Path = None) -> list[str]:
+
+def get_all_paths(
+    source_dir: str | Path, top_dir: str | Path = None, exclude: list[str] = None
+) -> list[str]:
     """
     Returns all paths contained within the source directory. All paths in the returned list of paths
-    are relative to the ``top_dir`` set in the initial call to this function. By default, we do not
-    (and in basically every real use case, you **should** not) specify a ``top_dir``. This causes
-    the ``top_dir`` to be the ``source_dir`` and all returned paths to be relative to the
-    ``source_dir``. Changing the ``top_dir`` will typically result in unexpected pathing problems,
-    broken links, etc.
+    are relative to the ``top_dir``. By default, we do not (and in basically every real use case,
+    you **should** not) specify a ``top_dir``. This causes the ``top_dir`` to be the ``source_dir``
+    and all returned paths to be relative to the ``source_dir``. Changing the ``top_dir`` will
+    typically result in unexpected pathing problems, broken links, etc.
 
-    Because this function is recursive and acts on its own findings, it would be mostly redundant to
-    call :py:meth:`validate_dir` on each execution of this function. **It is therefore assumed that
-    ``source_dir`` has already been validated.**
+    This is a convenience wrapper around :py:func:`iter_paths`, which should be preferred when the
+    paths do not all need to be held in memory at once. **It is assumed that ``source_dir`` has
+    already been validated.**
 
     :param source_dir: Path to the directory to list.
     :type source_dir: str | Path
@@ -24,23 +30,149 @@ def get_all_paths(source_dir: str | Path, top_dir: str | Path = None) -> list[st
     :param top_dir: Path to the directory containing the source paths. You should generally never
         change this from the default.
     :type top_dir: str | Path
+
+    :param exclude: List of ignore patterns to apply in addition to any found in the source
+        directory's ``.micrositeignore`` file. See :py:func:`iter_paths`.
+    :type exclude: list[str], optional
+    """
+
+    paths = iter_paths(source_dir, exclude=exclude)
+    if top_dir and Path(top_dir) != Path(source_dir):
+        prefix = Path(os.path.relpath(source_dir, top_dir)).as_posix()
+        return [f'{prefix}/{path}' for path in paths]
+    return list(paths)
+
+
+def iter_paths(source_dir: str | Path, exclude: list[str] = None) -> Iterator[str]:
+    """
+    Lazily yields the path of every file in the source directory, relative to that directory and
+    using forward slashes. Directories are walked with :py:func:`os.scandir`, so the type of each
+    entry is usually known without making another system call. Within each directory, files are
+    yielded in name order before descending into subdirectories, also in name order, so the results
+    are the same from one run to the next.
+
+    Files can be left out using ignore patterns. These come from the ``exclude`` list and from a
+    ``.micrositeignore`` file in the top of the source directory, which has one pattern per line.
+    Blank lines and lines starting with ``#`` are skipped. Patterns are shell-style globs:
+
+    - A pattern without a slash, like ``*.psd``, matches an entry's name at any depth.
+    - A pattern containing a slash, like ``vendor/js/*.map``, matches an entry's whole path relative
+      to the source directory. A leading slash is ignored.
+    - A pattern ending in a slash, like ``drafts/``, only matches directories.
+
+    A directory matching a pattern is skipped entirely without being read. The ``.micrositeignore``
+    file itself is never yielded.
+
+    Symbolic links are handled as follows: links to files are treated like ordinary files, so the
+    linked content ends up in the site. Links to directories are never followed, which prevents
+    cycles and keeps the walk inside the source directory. Broken links are skipped with a warning.
+
+    :param source_dir: Path to the directory to list. It is assumed to have been validated.
+    :type source_dir: str | Path
+
+    :param exclude: List of ignore patterns to apply in addition to any in ``.micrositeignore``.
+    :type exclude: list[str], optional
+
+    :return: Generator of relative file paths.
+    :rtype: Iterator[str]
     """
 
-    # Determine source and top path
-    source_dir = Path(source_dir)  # Even if source_dir is already a Path, this silently succeeds
-    if not top_dir:
-        top_dir = source_dir
+    source_dir = Path(source_dir)
+    ignore = IgnoreRules([*(exclude or []), *read_ignore_file(source_dir / IGNORE_FILENAME)])
     log.debug(f'Looking for files in {source_dir}')
 
-    # Start with all non-directory files
-    all_paths = [path for path in source_dir.iterdir() if path.is_file()]
+    # Depth-first walk with an explicit stack of (directory, path relative to source_dir)
+    stack = [(str(source_dir), '')]
+    while stack:
+        directory, rel_dir = stack.pop()
+        with os.scandir(directory) as scan:
+            entries = sorted(scan, key=lambda entry: entry.name)
+
+        subdirs = []
+        for entry in entries:
+            rel_path = f'{rel_dir}{entry.name}'
+            if entry.is_dir(follow_symlinks=False):
+                if not ignore.matches(rel_path, entry.name, is_dir=True):
+                    subdirs.append((entry.path, f'{rel_path}/'))
+            elif entry.is_file():
+                if rel_path != IGNORE_FILENAME and not ignore.matches(
+                    rel_path, entry.name, is_dir=False
+                ):
+                    yield rel_path
+            elif entry.is_symlink():
+                if entry.is_dir():
+                    log.debug(f'Not following symbolic link to directory {rel_path}')
+                else:
+                    log.warning(f'Skipping broken symbolic link {rel_path}')
+
+        stack.extend(reversed(subdirs))
+
+
+def read_ignore_file(path: Path) -> list[str]:
+    """
+    Returns the ignore patterns listed in an ignore file, or an empty list if there is no such file.
+
+    :param path: Path to the ignore file.
+    :type path: Path
+
+    :return: List of patterns.
+    :rtype: list[str]
+    """
+
+    if not path.is_file():
+        return []
+    with path.open('r') as file:
+        lines = [line.strip() for line in file]
+    return [line for line in lines if line and not line.startswith('#')]
+
 
-    # Then expand on each subdirectory recursively
-    for path in [path for path in source_dir.iterdir() if path.is_dir()]:
-        all_paths.extend(get_all_paths(path, top_dir=top_dir))
+class IgnoreRules:
+    """
+    A set of shell-style ignore patterns, as described in :py:func:`iter_paths`.
+
+    :param patterns: The patterns to match against.
+    :type patterns: list[str]
+    """
 
-    # Convert each path to a string and remove the common top path
-    return [str(path).replace(f'{str(top_dir)}/', '') for path in all_paths]
+    def __init__(self, patterns: list[str]):
+        self.name_patterns = []
+        self.path_patterns = []
+        for pattern in patterns:
+            dir_only = pattern.endswith('/')
+            pattern = pattern.strip('/')
+            if not pattern:
+                continue
+            if '/' in pattern:
+                self.path_patterns.append((pattern, dir_only))
+            else:
+                self.name_patterns.append((pattern, dir_only))
+
+    def matches(self, rel_path: str, name: str, is_dir: bool) -> bool:
+        """
+        Determines if an entry should be ignored.
+
+        :param rel_path: The entry's path relative to the source directory.
+        :type rel_path: str
+
+        :param name: The entry's name.
+        :type name: str
+
+        :param is_dir: Whether the entry is a directory.
+        :type is_dir: bool
+
+        :return: True if any pattern matches the entry.
+        :rtype: bool
+        """
+
+        for pattern, dir_only in self.name_patterns:
+            if (is_dir or not dir_only) and fnmatchcase(name, pattern):
+                log.debug(f'Ignoring {rel_path}, which matches {pattern}')
+                return True
+        for pattern, dir_only in self.path_patterns:
+            if (is_dir or not dir_only) and fnmatchcase(rel_path, pattern):
+                log.debug(f'Ignoring {rel_path}, which matches {pattern}')
+                return True
+        return False
 
 
 def validate_dir(dir: str) -> bool:
@@ -0,0 +1,247 @@
+"""
+Module for measuring how long each phase of a build or deployment takes.
+"""
+
+import functools
+import json
+import logging
+import os
+import threading
+import time
+
+from collections.abc import Callable
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+log = logging.getLogger(__name__)
+
+
+class Profiler:
+    """
+    Records the wall clock and CPU time spent in named phases of work. Phases may be nested and may
+    run on several threads or processes at once. When the profiler is disabled, recording a phase
+    costs next to nothing.
+
+    Each recorded event is a dict with the following keys:
+
+    - ``name``: The phase's name.
+    - ``cat``: A category grouping related phases, such as ``render`` or ``publish``.
+    - ``start``: Start time, in nanoseconds on the system's monotonic clock.
+    - ``wall``: Elapsed wall clock time in nanoseconds.
+    - ``cpu``: CPU time used by the thread running the phase, in nanoseconds.
+    - ``pid`` and ``tid``: The process and thread the phase ran on.
+    - ``args``: Any extra details about the phase, such as which page it was for.
+
+    :param enabled: Whether to record anything. Defaults to False.
+    :type enabled: bool, optional
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.events = []
+        self._lock = threading.Lock()
+
+    def phase(self, name: str, category: str = 'render', **args):
+        """
+        Returns a context manager which records the time spent inside it as a phase.
+
+        :param name: The phase's name.
+        :type name: str
+
+        :param category: Category grouping related phases. Defaults to ``render``.
+        :type category: str, optional
+
+        :param args: Extra details to record about the phase, like ``page='index.md'``.
+        """
+
+        if not self.enabled:
+            return nullcontext()
+        return self._record(name, category, args)
+
+    @contextmanager
+    def _record(self, name: str, category: str, args: dict):
+        start = time.perf_counter_ns()
+        cpu_start = time.thread_time_ns()
+        try:
+            yield
+        finally:
+            event = {
+                'name': name,
+                'cat': category,
+                'start': start,
+                'wall': time.perf_counter_ns() - start,
+                'cpu': time.thread_time_ns() - cpu_start,
+                'pid': os.getpid(),
+                'tid': threading.get_native_id(),
+                'args': args,
+            }
+            with self._lock:
+                self.events.append(event)
+
+    def add_events(self, events: list[dict]) -> None:
+        """
+        Adds events recorded elsewhere, such as by another process's profiler.
+
+        :param events: The events to add.
+        :type events: list[dict]
+        """
+
+        with self._lock:
+            self.events.extend(events)
+
+    def take_events(self) -> list[dict]:
+        """
+        Removes and returns every event recorded so far.
+
+        :return: The recorded events.
+        :rtype: list[dict]
+        """
+
+        with self._lock:
+            events, self.events = self.events, []
+        return events
+
+    def summary(self, slowest: int = 10) -> dict:
+        """
+        Summarizes the recorded events.
+
+        :param slowest: Number of slowest pages to list. Defaults to 10.
+        :type slowest: int, optional
+
+        :return: Dict with a ``phases`` entry giving the count, total wall time, and total CPU time
+            (in seconds) of each phase, and a ``slowest_pages`` entry listing the pages which took
+            longest to render along with the time spent in each of their stages.
+        :rtype: dict
+        """
+
+        phases = {}
+        pages = {}
+        for event in self.events:
+            key = f'{event["cat"]}:{event["name"]}'
+            phase = phases.setdefault(key, {'count': 0, 'wall': 0.0, 'cpu': 0.0})
+            phase['count'] += 1
+            phase['wall'] += event['wall'] / 1e9
+            phase['cpu'] += event['cpu'] / 1e9
+
+            page = event['args'].get('page')
+            if page:
+                record = pages.setdefault(page, {'page': page, 'wall': 0.0, 'stages': {}})
+                if event['name'] == 'page':
+                    record['wall'] += event['wall'] / 1e9
+                else:
+                    stages = record['stages']
+                    stages[event['name']] = stages.get(event['name'], 0.0) + event['wall'] / 1e9
+
+        slowest_pages = sorted(pages.values(), key=lambda page: page['wall'], reverse=True)
+        return {'phases': phases, 'slowest_pages': slowest_pages[:slowest]}
+
+    def trace(self) -> dict:
+        """
+        Converts the recorded events into the Chrome trace event format, which can be loaded into
+        ``chrome://tracing`` or https://ui.perfetto.dev to see how the work was laid out over time.
+
+        :return: Trace data.
+        :rtype: dict
+        """
+
+        origin = min((event['start'] for event in self.events), default=0)
+        return {
+            'traceEvents': [
+                {
+                    'name': event['name'],
+                    'cat': event['cat'],
+                    'ph': 'X',
+                    'ts': (event['start'] - origin) / 1000,
+                    'dur': event['wall'] / 1000,
+                    'pid': event['pid'],
+                    'tid': event['tid'],
+                    'args': {**event['args'], 'cpu_ms': event['cpu'] / 1e6},
+                }
+                for event in self.events
+            ],
+            'displayTimeUnit': 'ms',
+        }
+
+    def write(self, prefix: str, slowest: int = 10) -> None:
+        """
+        Writes a JSON summary to ``<prefix>.json`` and a Chrome trace to ``<prefix>.trace.json``,
+        and logs the slowest phases and pages.
+
+        :param prefix: Path and base name of the files to write.
+        :type prefix: str
+
+        :param slowest: Number of slowest pages to list. Defaults to 10.
+        :type slowest: int, optional
+        """
+
+        summary = self.summary(slowest=slowest)
+        summary_file = Path(f'{prefix}.json')
+        trace_file = Path(f'{prefix}.trace.json')
+        with summary_file.open('w') as file:
+            json.dump(summary, file, indent=2)
+        with trace_file.open('w') as file:
+            json.dump(self.trace(), file)
+
+        log.info(f'Profile written to {summary_file}; trace written to {trace_file}')
+        phases = sorted(summary['phases'].items(), key=lambda item: item[1]['wall'], reverse=True)
+        for name, phase in phases:
+            log.info(
+                f'  {name}: {phase["wall"]:.3f}s wall, {phase["cpu"]:.3f}s CPU '
+                f'over {phase["count"]} call(s)'
+            )
+        if summary['slowest_pages']:
+            log.info('Slowest pages:')
+            for page in summary['slowest_pages']:
+                log.info(f'  {page["page"]}: {page["wall"] * 1000:.1f} ms')
+
+
+# The profiler used throughout the program
+_profiler = Profiler()
+
+
+def get_profiler() -> Profiler:
+    """
+    Returns the profiler shared by the whole program. It is disabled unless
+    :py:func:`enable_profiling` has been called.
+
+    :return: The shared profiler.
+    :rtype: Profiler
+    """
+
+    return _profiler
+
+
+def enable_profiling() -> Profiler:
+    """
+    Turns on the shared profiler.
+
+    :return: The shared profiler.
+    :rtype: Profiler
+    """
+
+    _profiler.enabled = True
+    return _profiler
+
+
+def profiled(name: str = None, category: str = 'render') -> Callable:
+    """
+    Decorator which records each call to a function as a phase of the shared profiler.
+
+    :param name: The phase's name. Defaults to the function's name.
+    :type name: str, optional
+
+    :param category: Category grouping related phases. Defaults to ``render``.
+    :type category: str, optional
+    """
+
+    def decorator(func: Callable) -> Callable:
+        phase_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _profiler.phase(phase_name, category=category):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
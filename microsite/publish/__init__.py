@@ -1,15 +1,76 @@
 import jinja2
 import logging
 import shutil
+import time
 
 from abc import ABC, abstractclassmethod
-from microsite.util import AttrDict, Engine
+from collections.abc import Mapping
+from microsite.config import ConfigSection, PulumiTargetConfig, load_value
+from microsite.path import get_all_paths
+from microsite.profiling import get_profiler, profiled
+from microsite.publish import environment
+from microsite.publish.events import PulumiOperationLog
+from microsite.render.assets import ASSET_MANIFEST_FILENAME
+from microsite.render.compress import ENCODINGS
+from microsite.render.manifest import MANIFEST_FILENAME
+from microsite.util import Engine, hash_data, hash_file
 from pathlib import Path
-from pulumi import automation as pulumi_automation
 from tempfile import TemporaryDirectory
 
 log = logging.getLogger(__name__)
 
+# Files a build writes for microsite's own use, which are never published
+BUILD_FILES = {MANIFEST_FILENAME, ASSET_MANIFEST_FILENAME}
+
+# Stack output recording the fingerprint of the inputs a stack was last deployed from
+FINGERPRINT_OUTPUT = 'microsite_fingerprint'
+
+# Pulumi target settings which only affect how microsite runs Pulumi, not what Pulumi builds
+LOCAL_PULUMI_SETTINGS = {
+    'invalidate_cache',
+    'invalidation_max_paths',
+    'invalidation_wildcard_ratio',
+    'persist_work_dir',
+    'pulumi_access_token_file',
+    'pulumi_cache_dir',
+    'pulumi_env_cache',
+    'pulumi_error_log',
+    'pulumi_event_log',
+    'pulumi_log',
+    'pulumi_passphrase_file',
+    'pulumi_work_dir',
+}
+
+
+def site_files(source_dir: str | Path, exclude: list[str] = None) -> tuple[set[str], set[str]]:
+    """
+    Lists the files of a rendered site which are to be published. The build manifest and the asset
+    manifest (``BUILD_FILES``) are left out, since they describe the build for microsite's benefit
+    and are not part of the site. Compressed copies written by ``render.compress``, which sit next
+    to the files they were made from, are listed apart, since they are only ever served in place of
+    those files.
+
+    :param source_dir: Directory containing the site.
+    :type source_dir: str | Path
+
+    :param exclude: List of ignore patterns of files not to publish. See
+        :py:func:`microsite.path.iter_paths`.
+    :type exclude: list[str], optional
+
+    :return: Tuple of the set of the site's files and the set of their compressed copies, as paths
+        relative to the source directory.
+    :rtype: tuple[set[str], set[str]]
+    """
+
+    paths = set(get_all_paths(source_dir, exclude=exclude)) - BUILD_FILES
+    variants = {
+        path
+        for path in paths
+        for suffix in ENCODINGS.values()
+        if path.endswith(suffix) and path[: -len(suffix)] in paths
+    }
+    return paths - variants, variants
+
 
 class PublishEngine(ABC, Engine):
     """
@@ -22,20 +83,42 @@ class PublishEngine(ABC, Engine):
         output of a previous render step.
     :type source_dir: str
 
-    :param config: A dict containing operating parameters for this engine.
-    :type config: dict
+    :param config: The publishing target's settings. When the engine has a ``config_schema``, a
+        plain dict of settings is checked and converted into it.
+    :type config: microsite.config.ConfigSection | dict
 
     :param dry_run: When True, the engine will not manipulate any live resources, but will instead
         log any actions it would have otherwise taken.
     :type dry_run: bool
+
+    :param destroy: When True, the engine tears the site down instead of publishing it.
+    :type destroy: bool
+
+    :param force_infra: When True, engines which manage infrastructure update it even if nothing it
+        is built from has changed. Defaults to False.
+    :type force_infra: bool, optional
     """
 
-    def __init__(self, name: str, source_dir: str, config: AttrDict, dry_run: bool, destroy: bool):
+    # The ConfigSection dataclass describing the engine's settings
+    config_schema = None
+
+    def __init__(
+        self,
+        name: str,
+        source_dir: str,
+        config: ConfigSection | Mapping,
+        dry_run: bool,
+        destroy: bool,
+        force_infra: bool = False,
+    ):
+        if self.config_schema:
+            config = load_value(self.config_schema, config, f'publish.targets.{name}')
         self.name = name
         self.source_dir = source_dir
         self.config = config
         self.dry_run = dry_run
         self.destroy = destroy
+        self.force_infra = force_infra
 
     @abstractclassmethod
     def publish(self):
@@ -50,11 +133,32 @@ class PulumiPublishEngine(PublishEngine):
     """
     A publishing engine that uses the Pulumi infrastructure-as-code tool to manage a site. This
     manages a working directory where Pulumi can manage its local execution environment.
+
+    Running ``pulumi up`` means refreshing and planning every resource in the stack, which is slow
+    even when nothing has changed. So each deployment records a fingerprint of everything the stack
+    is built from (see :py:meth:`infrastructure_inputs`) as a stack output. When the next publish
+    finds the same fingerprint on the stack, it skips Pulumi's update altogether, unless
+    ``force_infra`` is set.
     """
 
-    def __init__(self, name: str, source_dir: str, config: AttrDict, dry_run: bool, destroy: bool):
+    config_schema = PulumiTargetConfig
+
+    def __init__(
+        self,
+        name: str,
+        source_dir: str,
+        config: PulumiTargetConfig | Mapping,
+        dry_run: bool,
+        destroy: bool,
+        force_infra: bool = False,
+    ):
         super().__init__(
-            name=name, source_dir=source_dir, config=config, dry_run=dry_run, destroy=destroy
+            name=name,
+            source_dir=source_dir,
+            config=config,
+            dry_run=dry_run,
+            destroy=destroy,
+            force_infra=force_infra,
         )
 
         if self.dry_run and self.destroy:
@@ -66,15 +170,17 @@ class PulumiPublishEngine(PublishEngine):
         # specified by the user, default to persisisting it. Always allow the user to override the
         # setting.
         self.use_temp_work_dir = False if self.config.pulumi_work_dir else True
-        default_persist_work_dir = False if self.use_temp_work_dir else True
-        self.persist_work_dir = self.config.get('persist_work_dir', default_persist_work_dir)
+        self.persist_work_dir = self.config.persist_work_dir
+        if self.persist_work_dir is None:
+            self.persist_work_dir = not self.use_temp_work_dir
 
         # Set up a temporary working environment if need be
         if self.use_temp_work_dir:
             self.temp_work_dir = TemporaryDirectory(dir='.', prefix='pulumi_')
-            self.config.pulumi_work_dir = self.temp_work_dir.name
+            pulumi_work_dir = self.temp_work_dir.name
         else:
             self.temp_work_dir = None
+            pulumi_work_dir = self.config.pulumi_work_dir
 
         # Jinja environment for other functions to operate in
         _module_dir = '/'.join(__file__.split('/')[0:-1])
@@ -83,7 +189,7 @@ class PulumiPublishEngine(PublishEngine):
         self.pulumi_templates = jinja2.Environment(loader=_j2_loader)
 
         # Pulumi's operating environment
-        self.work_dir = Path(self.config.pulumi_work_dir).expanduser().resolve()
+        self.work_dir = Path(pulumi_work_dir).expanduser().resolve()
         self.work_dir_str = str(self.work_dir)
         self.pulumi_environment = self.__build_pulumi_environment()
 
@@ -94,6 +200,9 @@ class PulumiPublishEngine(PublishEngine):
         self.filename_pulumi_stack_yaml = f'Pulumi.{self.config.pulumi_stack_name}.yaml'
         self.file_pulumi_stack_yaml = self.work_dir / self.filename_pulumi_stack_yaml
 
+        # The virtual environment Pulumi runs the program in, as named in Pulumi.yaml
+        self.dir_virtualenv = self.work_dir / 'venv'
+
     def __build_pulumi_environment(self) -> dict:
         """
         Returns a dict of environment variables to pass into the Pulumi automation library
@@ -111,10 +220,8 @@ class PulumiPublishEngine(PublishEngine):
                 env_vars['PULUMI_CONFIG_ACCESS_TOKEN'] = file.read().strip()
 
         if self.config.pulumi_passphrase_file:
-            self.config.pulumi_passphrase_file = (
-                Path(self.config.pulumi_passphrase_file).expanduser().resolve()
-            )
-            with self.config.pulumi_passphrase_file.open('r') as file:
+            passphrase_file = Path(self.config.pulumi_passphrase_file).expanduser().resolve()
+            with passphrase_file.open('r') as file:
                 env_vars['PULUMI_CONFIG_PASSPHRASE'] = file.read().strip()
         else:
             env_vars['PULUMI_CONFIG_PASSPHRASE'] = ''
@@ -124,6 +231,7 @@ class PulumiPublishEngine(PublishEngine):
 
         return env_vars
 
+    @profiled(category='publish')
     def ensure_work_dir(self):
         """
         Ensures that the Pulumi working directory exists. If so, determines if it needs to be
@@ -158,6 +266,7 @@ class PulumiPublishEngine(PublishEngine):
             raise IOError(f'No requirements.txt file exists in {self.work_dir_str}')
         return True
 
+    @profiled(category='publish')
     def construct_pulumi_yaml(self):
         """
         Constructs the ``Pulumi.yaml`` file describing the environment.
@@ -171,8 +280,8 @@ class PulumiPublishEngine(PublishEngine):
             state_url = 'https://api.pulumi.com'
         content = template.render(
             {
-                'project_name': self.config.project_name or 'project_name',
-                'project_description': self.config.project_description or 'project_description',
+                'project_name': self.config.project_name,
+                'project_description': self.config.project_description,
                 'state_url': state_url,
             }
         )
@@ -180,6 +289,7 @@ class PulumiPublishEngine(PublishEngine):
         with self.file_pulumi_yaml.open('w') as file:
             file.write(content)
 
+    @profiled(category='publish')
     def construct_pulumi_stack_yaml(self):
         """
         Constructs the ``Pulumi.$stack.yaml`` file describing the stack.
@@ -189,53 +299,222 @@ class PulumiPublishEngine(PublishEngine):
         template = self.pulumi_templates.get_template('Pulumi.stack.yaml.j2')
         content = template.render(
             {
-                'aws_region': self.config.aws_region or 'us-east-1',
+                'aws_region': self.config.aws_region,
             }
         )
 
         with self.file_pulumi_stack_yaml.open('w') as file:
             file.write(content)
 
+    def infrastructure_files(self) -> list[Path]:
+        """
+        Returns the files in the working directory which make up the Pulumi project. Subclasses
+        which write more files should add them.
+
+        :return: List of paths to the files.
+        :rtype: list[Path]
+        """
+
+        return [
+            self.file_pulumi_yaml,
+            self.file_pulumi_stack_yaml,
+            self.file_main_py,
+            self.file_requirements_txt,
+        ]
+
+    def infrastructure_inputs(self) -> dict:
+        """
+        Returns everything which determines what the Pulumi stack builds: digests of the project
+        files in the working directory, and the target's settings other than those which only
+        affect how Pulumi is run. Subclasses whose Pulumi programs read anything else, such as the
+        files being published, must add it here, or changes to it will not be deployed.
+
+        :return: Dict of the inputs, which must be JSON-serializable.
+        :rtype: dict
+        """
+
+        settings = {
+            key: value
+            for key, value in self.config.as_dict().items()
+            if key not in LOCAL_PULUMI_SETTINGS
+        }
+        files = {
+            file.name: hash_file(file) if file.exists() else None
+            for file in self.infrastructure_files()
+        }
+        return {'files': files, 'settings': settings}
+
+    @profiled(category='publish')
+    def infrastructure_fingerprint(self) -> str:
+        """
+        Returns a digest of the stack's inputs, which changes whenever any of them do.
+
+        :return: Hexadecimal digest.
+        :rtype: str
+        """
+
+        return hash_data(self.infrastructure_inputs())
+
+    def prepare_environment(self) -> None:
+        """
+        Links a cached Python environment with the program's requirements installed into the working
+        directory, building it first if it is not in the cache yet, so that Pulumi does not install
+        them all over again. Does nothing if ``pulumi_env_cache`` is turned off, in which case
+        Pulumi builds the environment itself. See :py:mod:`microsite.publish.environment`.
+        """
+
+        if not self.config.pulumi_env_cache:
+            return
+
+        cache_dir = self.config.pulumi_cache_dir or environment.default_cache_dir()
+        start = time.perf_counter()
+        with get_profiler().phase('environment', category='publish', target=self.name):
+            env_dir, cached = environment.ensure_environment(self.file_requirements_txt, cache_dir)
+            environment.link_environment(env_dir, self.dir_virtualenv)
+        log.info(
+            f'{"Reused" if cached else "Built"} the Python environment for Pulumi in '
+            f'{time.perf_counter() - start:.1f}s ({env_dir})'
+        )
+
+    def stack_outputs(self, fingerprint: str) -> dict:
+        """
+        Returns the values microsite records as outputs of the stack, alongside the resources they
+        describe. Subclasses may add more, to compare against on the next deployment.
+
+        :param fingerprint: The stack's fingerprint.
+        :type fingerprint: str
+
+        :return: Dict of output names to values, which must be JSON-serializable.
+        :rtype: dict
+        """
+
+        return {FINGERPRINT_OUTPUT: fingerprint}
+
+    def record_outputs(self, outputs: dict) -> None:
+        """
+        Makes the Pulumi program export the given values as stack outputs.
+
+        :param outputs: Dict of output names to values.
+        :type outputs: dict
+        """
+
+        with self.file_main_py.open('a') as file:
+            file.write(
+                '\n\n# Added by microsite to record what this stack was deployed from\n'
+                'import pulumi  # noqa: E402\n\n'
+            )
+            for name, value in outputs.items():
+                file.write(f'pulumi.export({name!r}, {value!r})\n')
+
+    def on_engine_event(self, event) -> None:
+        """
+        Called with each engine event Pulumi reports while it operates on the stack, to keep track
+        of what the operation changes. Pulumi calls this from a thread of its own. Does nothing
+        unless overridden.
+
+        :param event: The event.
+        :type event: pulumi.automation.events.EngineEvent
+        """
+
+        pass
+
+    def deployed(self, previous: dict, outputs: dict) -> None:
+        """
+        Called after the stack has been deployed, to do anything which depends on what changed.
+        Does nothing unless overridden.
+
+        :param previous: The stack's outputs before the deployment.
+        :type previous: dict
+
+        :param outputs: The stack's outputs after the deployment.
+        :type outputs: dict
+        """
+
+        pass
+
     def publish(self):
         """
         Publishes a site using the Pulumi tool according to the project settings.
         """
 
+        # The Pulumi SDK is slow to import, so only import it once something is published with it
+        from pulumi import automation as pulumi_automation
+
         log.info('Publishing using Pulumi')
         self.construct_pulumi_yaml()
         self.construct_pulumi_stack_yaml()
+        fingerprint = self.infrastructure_fingerprint()
+        self.record_outputs(self.stack_outputs(fingerprint))
 
+        profiler = get_profiler()
         log.debug(f'Getting Pulumi set up on stack {self.config.pulumi_stack_name}')
-        stack = pulumi_automation.create_or_select_stack(
-            stack_name=self.config.pulumi_stack_name,
-            work_dir=self.work_dir,
-            opts=pulumi_automation.LocalWorkspaceOptions(env_vars=self.pulumi_environment),
-        )
+        with profiler.phase('select_stack', category='publish', target=self.name):
+            stack = pulumi_automation.create_or_select_stack(
+                stack_name=self.config.pulumi_stack_name,
+                work_dir=self.work_dir,
+                opts=pulumi_automation.LocalWorkspaceOptions(env_vars=self.pulumi_environment),
+            )
 
-        pulumi_log = self.config.pulumi_log or 'pulumi.log'
-        pulumi_error_log = self.config.pulumi_error_log or 'pulumi.err'
+        previous = {}
+        if not self.destroy:
+            with profiler.phase('read_outputs', category='publish', target=self.name):
+                previous = {name: output.value for name, output in stack.outputs().items()}
+            deployed = previous.get(FINGERPRINT_OUTPUT)
+            if deployed == fingerprint and not self.force_infra:
+                log.info(
+                    f'Nothing the {self.name} stack is built from has changed since it was last '
+                    'deployed, so it will not be updated. Use --force-infra to update it anyway.'
+                )
+                self.cleanup()
+                return
+            log.debug(f'Stack fingerprint {deployed} does not match {fingerprint}')
+
+        self.prepare_environment()
+
+        pulumi_log = self.config.pulumi_log
+        pulumi_error_log = self.config.pulumi_error_log
         if self.dry_run:
+            operation = 'preview'
             log.info(
                 f'Generating a preview of changes in {pulumi_log}. '
                 f'Errors will be shown in {pulumi_error_log}'
             )
-            response = stack.preview()
         elif self.destroy:
+            operation = 'destroy'
             log.info(
                 f'Destroying the site. See {pulumi_log} for progress, '
                 f'{pulumi_error_log} for errors.'
             )
-            response = stack.destroy()
         else:
+            operation = 'up'
             log.info(
                 f'Deploying the site. See {pulumi_log} for progress, {pulumi_error_log} for errors.'
             )
-            response = stack.up()
 
-            with open(pulumi_log, 'w') as file:
-                file.write(response.stdout)
-            with open(pulumi_error_log, 'w') as file:
-                file.write(response.stderr)
+        # Pulumi's output and events are written out as they arrive, not once the operation is over
+        operation_log = PulumiOperationLog(
+            target=self.name,
+            operation=operation,
+            log_file=pulumi_log,
+            error_log_file=pulumi_error_log,
+            event_log_file=self.config.pulumi_event_log,
+        )
+
+        def on_event(event):
+            operation_log.on_event(event)
+            self.on_engine_event(event)
+
+        with operation_log, profiler.phase(operation, category='publish', target=self.name):
+            response = getattr(stack, operation)(
+                on_output=operation_log.on_output,
+                on_error=operation_log.on_error,
+                on_event=on_event,
+            )
+
+        if operation == 'up':
+            self.deployed(
+                previous, {name: output.value for name, output in response.outputs.items()}
+            )
 
         self.cleanup()
 
@@ -259,11 +538,36 @@ class TBPulumiPublishEngine(PulumiPublishEngine):
     tb_pulumi.
     """
 
-    def __init__(self, name: str, source_dir: str, config: AttrDict, dry_run: bool, destroy: bool):
+    def __init__(
+        self,
+        name: str,
+        source_dir: str,
+        config: PulumiTargetConfig | Mapping,
+        dry_run: bool,
+        destroy: bool,
+        force_infra: bool = False,
+    ):
         super().__init__(
-            name=name, source_dir=source_dir, config=config, dry_run=dry_run, destroy=destroy
+            name=name,
+            source_dir=source_dir,
+            config=config,
+            dry_run=dry_run,
+            destroy=destroy,
+            force_infra=force_infra,
         )
 
+    def infrastructure_files(self) -> list[Path]:
+        """
+        Returns the files making up the Pulumi project, including tb_pulumi's
+        ``config.$stack.yaml``.
+
+        :return: List of paths to the files.
+        :rtype: list[Path]
+        """
+
+        config_yaml = self.work_dir / f'config.{self.config.pulumi_stack_name}.yaml'
+        return [*super().infrastructure_files(), config_yaml]
+
     def validate_work_dir(self):
         """
         Ensures the files required to operate a tb_pulumi project are present
@@ -0,0 +1,207 @@
+"""
+Module for invalidating the parts of a CloudFront distribution's cache which a deployment changed,
+so visitors see new pages straight away instead of once their cached copies expire.
+
+Invalidating ``/*`` after every deployment would work, but throws away the whole cache, and every
+file then has to be fetched from the origin again. Instead, only the paths of changed files are
+invalidated. Where most of a directory changed, a single wildcard path like ``/docs/*`` is used in
+place of listing each file, and directories are collapsed into wildcards as needed to stay within
+a budget of paths, since CloudFront charges for each path beyond a monthly allowance.
+"""
+
+import logging
+import posixpath
+import time
+
+from collections import Counter
+from collections.abc import Collection
+from urllib.parse import quote
+
+log = logging.getLogger(__name__)
+
+# Most paths CloudFront accepts in a single invalidation request
+MAX_PATHS_PER_REQUEST = 3000
+
+# Most wildcard paths CloudFront allows to be in progress at once
+MAX_WILDCARDS = 15
+
+
+def parent_dirs(path: str) -> list[str]:
+    """
+    Returns every directory containing a path, from the top of the site (``''``) down.
+    """
+
+    parts = path.split('/')[:-1]
+    return [''] + ['/'.join(parts[: depth + 1]) for depth in range(len(parts))]
+
+
+def url_path(path: str) -> str:
+    """
+    Returns the URL path CloudFront knows a file or directory by.
+    """
+
+    return '/' + quote(path, safe='/~')
+
+
+def wildcard_path(directory: str) -> str:
+    """
+    Returns the wildcard path matching everything in a directory.
+    """
+
+    return f'{url_path(directory)}/*' if directory else '/*'
+
+
+def depth(directory: str) -> int:
+    """
+    Returns how many directories deep a directory is, where the top of the site is 0.
+    """
+
+    return directory.count('/') + 1 if directory else 0
+
+
+def within(path: str, directory: str) -> bool:
+    """
+    Determines if a path is in a directory, or any of its subdirectories.
+    """
+
+    return not directory or path.startswith(f'{directory}/')
+
+
+def invalidation_paths(
+    changed: Collection[str],
+    existing: Collection[str],
+    index_document: str = 'index.html',
+    max_paths: int = 1000,
+    wildcard_ratio: float = 0.5,
+) -> list[str]:
+    """
+    Works out the smallest useful set of paths to invalidate after some of a site's files changed.
+
+    Each changed file's URL is invalidated. A changed index document also has its directory's URL
+    (like ``/docs/`` for ``docs/index.html``) invalidated, since that is how it is usually
+    requested. A directory is invalidated with a wildcard instead when its changed files make up at
+    least ``wildcard_ratio`` of its files, and the wildcard replaces at least two paths. If the
+    result would still have more than ``max_paths`` paths or more than ``MAX_WILDCARDS`` wildcards,
+    the directories whose wildcards would replace the most paths are collapsed until it fits, up to
+    ``/*``.
+
+    :param changed: Paths of the files which were modified or deleted, relative to the top of the
+        site. New files need no invalidation, since nothing could have cached them.
+    :type changed: Collection[str]
+
+    :param existing: Paths of every file in the site, before or after the change. A wildcard also
+        invalidates files which did not change, and these tell how many.
+    :type existing: Collection[str]
+
+    :param index_document: Name of the file served for URLs ending in a slash. Defaults to
+        ``index.html``.
+    :type index_document: str, optional
+
+    :param max_paths: Most paths to invalidate. Defaults to 1000, CloudFront's monthly allowance
+        of free paths.
+    :type max_paths: int, optional
+
+    :param wildcard_ratio: Least fraction of a directory's files which must have changed for it to
+        be invalidated with a wildcard. Defaults to 0.5.
+    :type wildcard_ratio: float, optional
+
+    :return: Sorted list of URL paths to invalidate.
+    :rtype: list[str]
+    """
+
+    changed = set(changed)
+    if not changed:
+        return []
+
+    totals = Counter()
+    for path in set(existing) | changed:
+        totals.update(parent_dirs(path))
+    counts = Counter()
+    for path in changed:
+        counts.update(parent_dirs(path))
+
+    # Collapse directories which mostly changed, deepest first, so a wildcard is only as broad as it
+    # needs to be. A directory's items are its changed files and the wildcards or items of its
+    # subdirectories, and collapsing it only helps when it replaces at least two of them.
+    children = {}
+    for directory in counts:
+        if directory:
+            children.setdefault(posixpath.dirname(directory), []).append(directory)
+    direct = Counter(posixpath.dirname(path) for path in changed)
+    items = {}
+    wildcards = set()
+    for directory in sorted(counts, key=depth, reverse=True):
+        items[directory] = direct[directory] + sum(
+            1 if child in wildcards else items[child] for child in children.get(directory, [])
+        )
+        ratio = counts[directory] / totals[directory]
+        if items[directory] >= 2 and ratio >= wildcard_ratio:
+            wildcards = {wildcard for wildcard in wildcards if not within(wildcard, directory)}
+            wildcards.add(directory)
+
+    # Each changed file outside a wildcard is invalidated by the URLs it can be requested by
+    entries = []
+    for path in changed:
+        if any(within(path, wildcard) for wildcard in wildcards):
+            continue
+        entries.append((path, url_path(path)))
+        directory, name = posixpath.split(path)
+        if name == index_document:
+            entries.append((path, f'{url_path(directory)}/' if directory else '/'))
+
+    def collapse(directory: str) -> None:
+        nonlocal entries, wildcards
+        entries = [entry for entry in entries if not within(entry[0], directory)]
+        wildcards = {wildcard for wildcard in wildcards if not within(wildcard, directory)}
+        wildcards.add(directory)
+
+    while len(entries) + len(wildcards) > max_paths or len(wildcards) > MAX_WILDCARDS:
+        # Collapse whichever directory replaces the most paths with a single wildcard
+        covered = Counter()
+        for path, _url in entries:
+            covered.update(parent_dirs(path))
+        for wildcard in wildcards:
+            covered.update(parent_dirs(wildcard) if wildcard else [])
+        directory = max(covered, key=lambda directory: (covered[directory], depth(directory)))
+        collapse(directory)
+
+    return sorted({wildcard_path(wildcard) for wildcard in wildcards} | {url for _, url in entries})
+
+
+def invalidate(client, distribution_id: str, paths: list[str]) -> list[str]:
+    """
+    Submits invalidations of the given paths, in as many requests as CloudFront's limits require.
+
+    :param client: A boto3 CloudFront client.
+    :type client: botocore.client.CloudFront
+
+    :param distribution_id: ID of the CloudFront distribution.
+    :type distribution_id: str
+
+    :param paths: URL paths to invalidate, as returned by :py:func:`invalidation_paths`.
+    :type paths: list[str]
+
+    :return: IDs of the invalidations created.
+    :rtype: list[str]
+    """
+
+    batches = [
+        paths[start : start + MAX_PATHS_PER_REQUEST]
+        for start in range(0, len(paths), MAX_PATHS_PER_REQUEST)
+    ]
+    reference = time.time_ns()
+    ids = []
+    for number, batch in enumerate(batches):
+        response = client.create_invalidation(
+            DistributionId=distribution_id,
+            InvalidationBatch={
+                'Paths': {'Quantity': len(batch), 'Items': batch},
+                'CallerReference': f'microsite-{reference}-{number}',
+            },
+        )
+        ids.append(response['Invalidation']['Id'])
+    log.info(
+        f'Invalidated {len(paths)} paths in CloudFront distribution {distribution_id} '
+        f'({", ".join(ids)})'
+    )
+    return ids
@@ -0,0 +1,206 @@
+"""
+Module for keeping the Python environments Pulumi programs run in between publishes.
+
+Pulumi runs a Python program in a virtual environment in its working directory, and installs the
+program's requirements into it when it does not exist yet. Since the working directory is usually
+thrown away after each publish, every publish would install the same packages again, which can take
+longer than the deployment itself. Instead, each environment is built once in a cache, in a
+directory named for a digest of the requirements and the Python version it was built for (see
+:py:func:`environment_key`), and linked into the working directory wherever Pulumi expects it. Any
+target whose program has the same requirements shares the environment, and a new one is only built
+when the requirements change.
+
+Pulumi keeps the provider plugins it downloads in its own home directory (``~/.pulumi/plugins``,
+or ``$PULUMI_HOME/plugins``), which is reused by every run already.
+"""
+
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import threading
+import venv
+
+from microsite.util import hash_data
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+log = logging.getLogger(__name__)
+
+# File written into an environment once it has been built completely
+READY_FILE = '.microsite-ready'
+
+# Serializes building environments between threads on systems without file locks
+_build_lock = threading.Lock()
+
+
+def default_cache_dir() -> Path:
+    """
+    Returns the directory environments are cached in when a target does not name one:
+    ``microsite/pulumi`` in ``$XDG_CACHE_HOME``, or in ``~/.cache`` if that is not set.
+
+    :return: Path to the cache directory.
+    :rtype: Path
+    """
+
+    cache_home = os.environ.get('XDG_CACHE_HOME') or Path('~/.cache').expanduser()
+    return Path(cache_home) / 'microsite' / 'pulumi'
+
+
+def environment_key(requirements: str) -> str:
+    """
+    Returns the digest naming the environment which satisfies a set of requirements. Blank lines,
+    comments, and the order of the requirements do not change it, but the Python version and
+    platform the environment is built for do.
+
+    :param requirements: Contents of a ``requirements.txt`` file.
+    :type requirements: str
+
+    :return: Hexadecimal digest.
+    :rtype: str
+    """
+
+    lines = sorted({line.strip() for line in requirements.splitlines()} - {''})
+    return hash_data(
+        {
+            'requirements': [line for line in lines if not line.startswith('#')],
+            'python': sys.version,
+            'implementation': sys.implementation.cache_tag,
+            'platform': [sys.platform, platform.machine()],
+        }
+    )
+
+
+def python_executable(env_dir: Path) -> Path:
+    """
+    Returns the path to an environment's Python interpreter.
+    """
+
+    return env_dir / ('Scripts/python.exe' if os.name == 'nt' else 'bin/python')
+
+
+class _EnvironmentLock:
+    """
+    Holds an exclusive lock on a cached environment, so that separate threads or processes
+    publishing at the same time do not build the same environment at once.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.file = None
+
+    def __enter__(self):
+        if fcntl is None:
+            _build_lock.acquire()
+            return self
+        self.file = self.path.open('a')
+        fcntl.flock(self.file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is None:
+            _build_lock.release()
+            return
+        fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.file.close()
+
+
+def build_environment(env_dir: Path, requirements_file: Path) -> None:
+    """
+    Creates a virtual environment and installs a set of requirements into it.
+
+    :param env_dir: Directory to create the environment in.
+    :type env_dir: Path
+
+    :param requirements_file: Path to the ``requirements.txt`` file to install.
+    :type requirements_file: Path
+
+    :raises RuntimeError: When the requirements cannot be installed.
+    """
+
+    venv.create(env_dir, with_pip=True)
+    process = subprocess.run(
+        [
+            str(python_executable(env_dir)),
+            '-m',
+            'pip',
+            'install',
+            '--disable-pip-version-check',
+            '-r',
+            str(requirements_file),
+        ],
+        capture_output=True,
+        text=True,
+    )
+    log.debug(process.stdout)
+    if process.returncode:
+        raise RuntimeError(
+            f'Unable to install the requirements in {requirements_file}:\n{process.stderr[-2000:]}'
+        )
+    shutil.copyfile(requirements_file, env_dir / 'requirements.txt')
+
+
+def ensure_environment(requirements_file: Path, cache_dir: Path) -> tuple[Path, bool]:
+    """
+    Returns a cached environment with the given requirements installed, building it first if there
+    is not one yet. An environment left half built, such as by a publish which was interrupted, is
+    built again.
+
+    :param requirements_file: Path to the ``requirements.txt`` file the environment must satisfy.
+    :type requirements_file: Path
+
+    :param cache_dir: Directory the environments are cached in.
+    :type cache_dir: Path
+
+    :raises RuntimeError: When the requirements cannot be installed.
+
+    :return: Tuple of the environment's directory, and whether it was already in the cache.
+    :rtype: tuple[Path, bool]
+    """
+
+    key = environment_key(requirements_file.read_text())
+    envs_dir = Path(cache_dir).expanduser().resolve() / 'envs'
+    envs_dir.mkdir(parents=True, exist_ok=True)
+    env_dir = envs_dir / key
+
+    with _EnvironmentLock(envs_dir / f'{key}.lock'):
+        if (env_dir / READY_FILE).exists():
+            return env_dir, True
+        if env_dir.exists():
+            log.debug(f'Removing the incomplete environment in {env_dir}')
+            shutil.rmtree(env_dir)
+        log.info(f'Building a Python environment for Pulumi in {env_dir}')
+        try:
+            build_environment(env_dir, requirements_file)
+        except Exception:
+            shutil.rmtree(env_dir, ignore_errors=True)
+            raise
+        (env_dir / READY_FILE).touch()
+    return env_dir, False
+
+
+def link_environment(env_dir: Path, link: Path) -> None:
+    """
+    Makes ``link`` point to a cached environment, replacing whatever environment was there before.
+
+    :param env_dir: The cached environment.
+    :type env_dir: Path
+
+    :param link: Path where Pulumi expects the environment.
+    :type link: Path
+    """
+
+    if link.is_symlink():
+        if link.resolve() == env_dir:
+            return
+        link.unlink()
+    elif link.exists():
+        log.debug(f'Replacing the environment in {link} with the cached one in {env_dir}')
+        shutil.rmtree(link)
+    link.symlink_to(env_dir, target_is_directory=True)
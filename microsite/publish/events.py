@@ -0,0 +1,296 @@
+"""
+Module for following a Pulumi operation while it runs. Pulumi's output is written to the target's
+log files line by line as it arrives, rather than all at once when the operation is over, and the
+engine events Pulumi reports are used to show progress, time each resource, and keep a structured
+record of the operation.
+
+The event log holds one JSON object per line, for each event Pulumi reported. Every object has an
+``event`` naming its kind (like ``resource_pre`` or ``diagnostic``), and the ``sequence`` number,
+Unix ``timestamp``, and seconds ``elapsed`` since the operation started. Resource events add the
+``op``, ``urn``, and resource ``type``, and those which finish a step add the ``seconds`` the step
+took, so slow resources can be found with a tool like ``jq``:
+
+.. code-block:: shell
+
+    jq -s 'map(select(.seconds)) | sort_by(-.seconds) | .[:10]' pulumi.events.jsonl
+
+Resource properties are left out of the event log, since they may include secrets.
+"""
+
+import json
+import logging
+import sys
+import threading
+import time
+
+from dataclasses import dataclass
+from pathlib import Path
+
+log = logging.getLogger(__name__)
+
+# Seconds between progress messages when progress is logged rather than shown on a live line
+PROGRESS_INTERVAL = 10
+
+# Seconds between redraws of a live progress line
+REDRAW_INTERVAL = 0.1
+
+# Number of slowest resources to log when an operation finishes
+SLOWEST_RESOURCES = 5
+
+# Attributes of an engine event, mapped to the name of the kind of event each one holds
+EVENT_KINDS = {
+    'cancel_event': 'cancel',
+    'stdout_event': 'stdout',
+    'diagnostic_event': 'diagnostic',
+    'prelude_event': 'prelude',
+    'summary_event': 'summary',
+    'resource_pre_event': 'resource_pre',
+    'res_outputs_event': 'resource_outputs',
+    'res_op_failed_event': 'resource_failed',
+    'policy_event': 'policy',
+    'start_debugging_event': 'start_debugging',
+}
+
+
+@dataclass(slots=True)
+class ResourceStep:
+    """
+    The time Pulumi spent on one step of one resource, such as creating or updating it.
+    """
+
+    urn: str
+    type: str
+    op: str
+    start: float
+    seconds: float | None = None
+    failed: bool = False
+
+    @property
+    def name(self) -> str:
+        return self.urn.rsplit('::', 1)[-1]
+
+
+def op_name(op) -> str:
+    """
+    Returns the name of a step's operation, which the Pulumi SDK gives as an ``OpType``.
+    """
+
+    return getattr(op, 'value', op)
+
+
+class PulumiOperationLog:
+    """
+    Follows one Pulumi operation. Pass the ``on_output``, ``on_error``, and ``on_event`` methods to
+    the Automation API's ``up``, ``preview``, or ``destroy``, inside a ``with`` block:
+
+    .. code-block:: python
+
+        with PulumiOperationLog('production', 'up', 'pulumi.log', 'pulumi.err') as operation:
+            stack.up(
+                on_output=operation.on_output,
+                on_error=operation.on_error,
+                on_event=operation.on_event,
+            )
+
+    Pulumi calls these from threads of its own, so each keeps to its own file, and the state they
+    share is guarded by a lock.
+
+    :param target: Name of the publishing target, shown on the live progress line.
+    :type target: str
+
+    :param operation: Name of the operation, such as ``up``.
+    :type operation: str
+
+    :param log_file: File to write Pulumi's standard output to.
+    :type log_file: str
+
+    :param error_log_file: File to write Pulumi's error output to.
+    :type error_log_file: str
+
+    :param event_log_file: File to write the event log to. When None, no event log is kept.
+    :type event_log_file: str, optional
+
+    :param live: When True, progress is shown on a single line of the terminal which is redrawn as
+        events arrive. When False, a progress message is logged every ``PROGRESS_INTERVAL`` seconds.
+        Defaults to True only when standard error is a terminal and this is the program's main
+        thread, since several targets published at once would share the line.
+    :type live: bool, optional
+    """
+
+    def __init__(
+        self,
+        target: str,
+        operation: str,
+        log_file: str,
+        error_log_file: str,
+        event_log_file: str = None,
+        live: bool = None,
+    ):
+        self.target = target
+        self.operation = operation
+        self.log_file = log_file
+        self.error_log_file = error_log_file
+        self.event_log_file = event_log_file
+        if live is None:
+            live = sys.stderr.isatty() and threading.current_thread() is threading.main_thread()
+        self.live = live
+        self.steps = {}
+        self.finished = []
+        self._files = {}
+        self._lock = threading.Lock()
+        self._start = None
+        self._last_progress = 0.0
+
+    def __enter__(self) -> 'PulumiOperationLog':
+        self._start = time.perf_counter()
+        self._last_progress = self._start
+        files = {'output': self.log_file, 'error': self.error_log_file}
+        if self.event_log_file:
+            files['event'] = self.event_log_file
+        for kind, path in files.items():
+            Path(path).expanduser().parent.mkdir(parents=True, exist_ok=True)
+            self._files[kind] = Path(path).expanduser().open('w', buffering=1)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        for file in self._files.values():
+            file.close()
+        if self.live:
+            sys.stderr.write(f'\r[{self.target}] {self.progress()}\x1b[K\n')
+            sys.stderr.flush()
+        self.log_summary()
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._start
+
+    def on_output(self, line: str) -> None:
+        """
+        Writes a line of Pulumi's standard output to the log file.
+        """
+
+        self._files['output'].write(f'{line}\n')
+
+    def on_error(self, line: str) -> None:
+        """
+        Writes a line of Pulumi's error output to the error log file.
+        """
+
+        self._files['error'].write(f'{line}\n')
+
+    def on_event(self, event) -> None:
+        """
+        Records an engine event: times the resource step it starts or finishes, if any, adds it to
+        the event log, and updates the progress shown.
+
+        :param event: The event.
+        :type event: pulumi.automation.events.EngineEvent
+        """
+
+        now = time.perf_counter()
+        kind = next(
+            (name for attr, name in EVENT_KINDS.items() if getattr(event, attr, None)), 'unknown'
+        )
+        record = {
+            'event': kind,
+            'sequence': event.sequence,
+            'timestamp': event.timestamp,
+            'elapsed': round(now - self._start, 3),
+        }
+
+        with self._lock:
+            if kind == 'resource_pre':
+                metadata = event.resource_pre_event.metadata
+                step = ResourceStep(metadata.urn, metadata.type, op_name(metadata.op), now)
+                self.steps[(step.urn, step.op)] = step
+                record.update(op=step.op, urn=step.urn, type=step.type, diffs=metadata.diffs)
+            elif kind in ('resource_outputs', 'resource_failed'):
+                payload = getattr(event, 'res_outputs_event', None) or event.res_op_failed_event
+                metadata = payload.metadata
+                record.update(op=op_name(metadata.op), urn=metadata.urn, type=metadata.type)
+                step = self.steps.pop((metadata.urn, op_name(metadata.op)), None)
+                if step:
+                    step.seconds = now - step.start
+                    step.failed = kind == 'resource_failed'
+                    self.finished.append(step)
+                    record['seconds'] = round(step.seconds, 3)
+                if kind == 'resource_failed':
+                    record['status'] = payload.status
+            elif kind == 'diagnostic':
+                diagnostic = event.diagnostic_event
+                record.update(
+                    severity=diagnostic.severity, urn=diagnostic.urn, message=diagnostic.message
+                )
+            elif kind == 'summary':
+                summary = event.summary_event
+                record.update(
+                    resource_changes={
+                        op_name(op): count for op, count in summary.resource_changes.items()
+                    },
+                    duration_seconds=summary.duration_seconds,
+                )
+
+            if 'event' in self._files:
+                self._files['event'].write(json.dumps(record, default=str) + '\n')
+            self.show_progress(now)
+
+    def progress(self) -> str:
+        """
+        Returns a one line description of how far the operation has got.
+
+        :return: The description.
+        :rtype: str
+        """
+
+        failed = sum(step.failed for step in self.finished)
+        message = (
+            f'Pulumi {self.operation}: {len(self.finished)} resources done, '
+            f'{len(self.steps)} in progress'
+        )
+        if failed:
+            message += f', {failed} failed'
+        message += f' ({self.elapsed():.0f}s)'
+        if self.steps:
+            latest = max(self.steps.values(), key=lambda step: step.start)
+            message += f' {latest.op} {latest.name}'
+        return message
+
+    def show_progress(self, now: float) -> None:
+        if self.live and now - self._last_progress >= REDRAW_INTERVAL:
+            sys.stderr.write(f'\r[{self.target}] {self.progress()}\x1b[K')
+            sys.stderr.flush()
+            self._last_progress = now
+        elif not self.live and now - self._last_progress >= PROGRESS_INTERVAL:
+            # Events arrive on Pulumi's own thread, which TargetLogFilter cannot tell the target of
+            log.info(f'[{self.target}] {self.progress()}', extra={'publish_target': self.target})
+            self._last_progress = now
+
+    def slowest(self, count: int = SLOWEST_RESOURCES) -> list[ResourceStep]:
+        """
+        Returns the resource steps which took longest.
+
+        :param count: Number of steps to return. Defaults to ``SLOWEST_RESOURCES``.
+        :type count: int, optional
+
+        :return: The slowest finished steps, slowest first.
+        :rtype: list[ResourceStep]
+        """
+
+        return sorted(self.finished, key=lambda step: step.seconds, reverse=True)[:count]
+
+    def log_summary(self) -> None:
+        """
+        Logs how long the operation took, and which resources it spent longest on.
+        """
+
+        failed = [step.name for step in self.finished if step.failed]
+        log.info(
+            f'Pulumi {self.operation} of {self.target} took {self.elapsed():.1f}s, over '
+            f'{len(self.finished)} resource steps'
+            + (f', of which {len(failed)} failed: {", ".join(failed)}' if failed else '')
+        )
+        slowest = [step for step in self.slowest() if step.seconds >= 0.1]
+        if slowest:
+            log.info(
+                'Slowest resources: '
+                + ', '.join(f'{step.name} ({step.op}, {step.seconds:.1f}s)' for step in slowest)
+            )
@@ -0,0 +1,221 @@
+"""
+Module for publishing several targets at once. Publishing a target is mostly spent waiting, whether
+on Pulumi or on uploads, so publishing each target in its own thread brings the time it takes to
+publish them all down to about that of the slowest one.
+
+Targets published side by side must not write to the same files. Any of the settings listed in
+``PER_TARGET_SETTINGS`` which more than one target shares is changed to a path of each target's own
+(see :py:func:`isolate_targets`), so that, for instance, each target gets its own ``pulumi.log``.
+"""
+
+import dataclasses
+import logging
+import threading
+import time
+
+from collections.abc import Callable, Mapping
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from microsite.config import ConfigSection
+from pathlib import Path
+
+log = logging.getLogger(__name__)
+
+# Target settings naming files or directories which targets published at once must not share, mapped
+# to whether they name a directory
+PER_TARGET_SETTINGS = {
+    'pulumi_log': False,
+    'pulumi_error_log': False,
+    'pulumi_event_log': False,
+    'pulumi_work_dir': True,
+}
+
+# Name of the target the current thread is publishing
+_current = threading.local()
+
+
+@dataclass(frozen=True, slots=True)
+class TargetResult:
+    """
+    The outcome of publishing one target.
+    """
+
+    name: str
+    engine: str
+    seconds: float
+    error: str | None = None
+
+    @property
+    def succeeded(self) -> bool:
+        return self.error is None
+
+
+class TargetLogFilter(logging.Filter):
+    """
+    Prefixes log messages logged while publishing a target with the target's name, so the messages
+    of targets published at once can be told apart.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        target = getattr(_current, 'target', None)
+        if target and not getattr(record, 'publish_target', None):
+            record.publish_target = target
+            record.msg = f'[{target}] {record.msg}'
+        return True
+
+
+def get_setting(config: ConfigSection | Mapping, key: str):
+    """
+    Returns a target's setting, or None if it has no such setting.
+    """
+
+    if isinstance(config, Mapping):
+        return config.get(key)
+    return getattr(config, key, None)
+
+
+def replace_settings(config: ConfigSection | Mapping, changes: dict) -> ConfigSection | Mapping:
+    """
+    Returns a copy of a target's settings with some of them changed.
+    """
+
+    if isinstance(config, Mapping):
+        return type(config)({**config, **changes})
+    return dataclasses.replace(config, **changes)
+
+
+def target_path(path: str, target: str, is_dir: bool) -> str:
+    """
+    Returns a target's own version of a path: a subdirectory named for the target when the path is
+    a directory, or the file with the target's name added before its extension otherwise.
+
+    :param path: The shared path.
+    :type path: str
+
+    :param target: Name of the target.
+    :type target: str
+
+    :param is_dir: Whether the path is a directory.
+    :type is_dir: bool
+
+    :return: The target's path.
+    :rtype: str
+    """
+
+    path = Path(path)
+    if is_dir:
+        return str(path / target)
+    return str(path.with_name(f'{path.stem}.{target}{path.suffix}'))
+
+
+def isolate_targets(targets: Mapping[str, ConfigSection | Mapping]) -> dict:
+    """
+    Gives each target its own copy of any of the ``PER_TARGET_SETTINGS`` it shares with another
+    target. Settings which are not shared, or which a target does not have, are left alone.
+
+    :param targets: Dict of target names to their settings.
+    :type targets: Mapping[str, ConfigSection | Mapping]
+
+    :return: Dict of target names to their settings, changed as needed.
+    :rtype: dict
+    """
+
+    isolated = dict(targets)
+    for key, is_dir in PER_TARGET_SETTINGS.items():
+        users = {}
+        for name, config in targets.items():
+            value = get_setting(config, key)
+            if value:
+                users.setdefault(Path(value).expanduser().resolve(), []).append(name)
+        for names in users.values():
+            if len(names) < 2:
+                continue
+            for name in names:
+                path = target_path(get_setting(targets[name], key), name, is_dir)
+                log.debug(f'Target {name} will use {path} for {key} while publishing in parallel')
+                isolated[name] = replace_settings(isolated[name], {key: path})
+    return isolated
+
+
+def publish_targets(
+    targets: Mapping[str, ConfigSection | Mapping],
+    publish: Callable[[str, ConfigSection | Mapping], None],
+    engines: Mapping[str, str],
+    workers: int,
+) -> list[TargetResult]:
+    """
+    Publishes targets side by side, each in its own thread, after giving them their own copies of
+    any files they would otherwise share (see :py:func:`isolate_targets`). A target failing does
+    not stop the others; every target is published and its outcome reported.
+
+    :param targets: Dict of target names to their settings.
+    :type targets: Mapping[str, ConfigSection | Mapping]
+
+    :param publish: Function which builds the target's publishing engine and publishes it, given
+        the target's name and settings.
+    :type publish: Callable[[str, ConfigSection | Mapping], None]
+
+    :param engines: Dict of target names to the names of their publishing engines.
+    :type engines: Mapping[str, str]
+
+    :param workers: Most targets to publish at once.
+    :type workers: int
+
+    :return: The outcome of each target, in the order the targets were given.
+    :rtype: list[TargetResult]
+    """
+
+    targets = isolate_targets(targets)
+    workers = max(1, min(workers, len(targets)))
+    log.info(f'Publishing {len(targets)} targets, {workers} at a time')
+
+    def run(name: str) -> TargetResult:
+        _current.target = name
+        start = time.perf_counter()
+        try:
+            publish(name, targets[name])
+            error = None
+        except Exception as ex:
+            log.error(f'Publishing failed: {ex}', exc_info=log.isEnabledFor(logging.DEBUG))
+            error = str(ex) or type(ex).__name__
+        finally:
+            _current.target = None
+        return TargetResult(
+            name=name, engine=engines[name], seconds=time.perf_counter() - start, error=error
+        )
+
+    log_filter = TargetLogFilter()
+    handlers = logging.getLogger().handlers
+    for handler in handlers:
+        handler.addFilter(log_filter)
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='publish') as executor:
+            results = list(executor.map(run, targets))
+    finally:
+        for handler in handlers:
+            handler.removeFilter(log_filter)
+
+    log_summary(results)
+    return results
+
+
+def log_summary(results: list[TargetResult]) -> None:
+    """
+    Logs a table of each target's engine, how long it took to publish, and whether it succeeded.
+
+    :param results: The outcomes of publishing the targets.
+    :type results: list[TargetResult]
+    """
+
+    name_width = max(len('Target'), *(len(result.name) for result in results))
+    engine_width = max(len('Engine'), *(len(result.engine) for result in results))
+    lines = [f'{"Target":<{name_width}}  {"Engine":<{engine_width}}  {"Time":>8}  Result']
+    for result in results:
+        outcome = 'ok' if result.succeeded else f'failed: {result.error}'
+        lines.append(
+            f'{result.name:<{name_width}}  {result.engine:<{engine_width}}  '
+            f'{result.seconds:7.1f}s  {outcome}'
+        )
+    failed = sum(not result.succeeded for result in results)
+    lines.append(f'{len(results) - failed} of {len(results)} targets published')
+    log.log(logging.ERROR if failed else logging.INFO, 'Publish summary:\n' + '\n'.join(lines))
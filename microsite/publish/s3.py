@@ -1,21 +1,73 @@
 import jinja2
 import logging
+import os
+import shutil
 
-from microsite.util import AttrDict
-from microsite.publish import TBPulumiPublishEngine
+from collections.abc import Mapping
+from microsite.config import S3WebsiteTargetConfig
+from microsite.filecopy import FileCopier
+from microsite.profiling import get_profiler, profiled
+from microsite.publish import TBPulumiPublishEngine, cloudfront, environment, site_files
+from microsite.publish.events import op_name
+from microsite.util import hash_data, hash_file
 from pathlib import Path
 
+try:
+    import boto3
+except ImportError:
+    boto3 = None
+
 log = logging.getLogger(__name__)
 
+# Stack output naming the site's CloudFront distribution
+DISTRIBUTION_OUTPUT = 'cloudfront_distribution_id'
+
+# Types of the resources tb_pulumi makes for each published file
+BUCKET_OBJECT_TYPES = {
+    'aws:s3/bucketObject:BucketObject',
+    'aws:s3/bucketObjectv2:BucketObjectv2',
+}
+
+# Files linked into a site's upload directory at once
+LINK_WORKERS = 8
+
+# Steps which change or remove a published file, so that its cached copies are out of date
+STALE_OPS = {'update', 'replace', 'delete', 'delete-replaced'}
+
 
 class TbPulumiS3Website(TBPulumiPublishEngine):
     """
     Publishes a site using Thunderbird Pulumi's S3Website pattern.
+
+    tb_pulumi uploads every file in the directory it is given, so it is given an upload directory
+    holding only the site's files (see :py:meth:`construct_upload_dir`) rather than the source
+    directory, which also holds the files a build writes for microsite's own use.
+
+    tb_pulumi makes each published file a bucket object resource of the stack. The bucket objects
+    which a deployment updates, replaces, or deletes are noted from Pulumi's engine events, and
+    after the deployment their paths are invalidated in the CloudFront distribution's cache (see
+    :py:func:`microsite.publish.cloudfront.invalidation_paths`), unless ``invalidate_cache`` is
+    turned off. This requires the boto3 package.
     """
 
-    def __init__(self, name: str, source_dir: str, config: AttrDict, dry_run: bool, destroy: bool):
+    config_schema = S3WebsiteTargetConfig
+
+    def __init__(
+        self,
+        name: str,
+        source_dir: str,
+        config: S3WebsiteTargetConfig | Mapping,
+        dry_run: bool,
+        destroy: bool,
+        force_infra: bool = False,
+    ):
         super().__init__(
-            name=name, source_dir=source_dir, config=config, dry_run=dry_run, destroy=destroy
+            name=name,
+            source_dir=source_dir,
+            config=config,
+            dry_run=dry_run,
+            destroy=destroy,
+            force_infra=force_infra,
         )
 
         # These variables change when developers can test the changes and generally shouldn't be
@@ -38,24 +90,70 @@ class TbPulumiS3Website(TBPulumiPublishEngine):
         self.file_config_stack_yaml = self.work_dir / self.filename_config_stack_yaml
         self.file_main_py = self.work_dir / '__main__.py'
         self.file_requirements_txt = self.work_dir / 'requirements.txt'
+        self._content = None
+
+        # The upload directory is kept between publishes, so only files which changed are relinked
+        source_key = hash_data(
+            {'source_dir': str(Path(source_dir).expanduser().absolute()), 'target': name}
+        )
+        cache_dir = self.config.pulumi_cache_dir or environment.default_cache_dir()
+        self.upload_dir = Path(cache_dir).expanduser().resolve() / 'sites' / source_key[:16]
+        self._stale = set()
 
+    @profiled(category='publish')
     def construct_config_stack_yaml(self):
         """
         Constructs the ``config.$stack.yaml`` file required by tb_pulumi.
         """
 
         template = self.microsite_templates.get_template('config.stack.yaml.j2')
-        source_dir = str(Path(self.source_dir).expanduser().resolve())
         content = template.render(
             {
                 's3_bucket_name': self.config.publish_bucket,
-                'source_dir': source_dir,
+                'object_dir': str(self.upload_dir),
             }
         )
 
         with self.file_config_stack_yaml.open('w') as file:
             file.write(content)
 
+    @profiled(category='publish')
+    def construct_upload_dir(self):
+        """
+        Fills the upload directory tb_pulumi publishes from with the files listed by
+        :py:meth:`content`, leaving out the build and asset manifests and compressed copies of
+        files. Files are hard linked in where the file system allows it, which takes neither time
+        nor space, and files which are already in place are left alone. Files which are no longer
+        part of the site are removed.
+        """
+
+        source_dir = Path(self.source_dir).expanduser().resolve()
+        content = self.content()
+        self.upload_dir.mkdir(parents=True, exist_ok=True)
+        copier = FileCopier(strategy='hardlink', workers=LINK_WORKERS)
+        try:
+            for path, digest in content.items():
+                copier.submit(source_dir / path, self.upload_dir / path, source_hash=digest)
+        except BaseException:
+            copier.cancel()
+            raise
+        linked, unchanged = copier.wait()
+
+        removed = 0
+        for directory, _subdirs, files in os.walk(self.upload_dir, topdown=False):
+            rel_dir = Path(directory).relative_to(self.upload_dir)
+            for file in files:
+                if (rel_dir / file).as_posix() not in content:
+                    os.unlink(os.path.join(directory, file))
+                    removed += 1
+            if Path(directory) != self.upload_dir and not os.listdir(directory):
+                os.rmdir(directory)
+        log.debug(
+            f'Linked {linked} files into {self.upload_dir} and removed {removed}. '
+            f'{unchanged} were already in place.'
+        )
+
+    @profiled(category='publish')
     def construct_main_py(self):
         """
         Constructs the __main__.py file that defines the build pattern.
@@ -74,6 +172,7 @@ class TbPulumiS3Website(TBPulumiPublishEngine):
         with self.file_main_py.open('w') as file:
             file.write(content)
 
+    @profiled(category='publish')
     def construct_requirements_txt(self):
         """
         Constructs the ``requirements.txt`` file that installs the right providers.
@@ -82,13 +181,89 @@ class TbPulumiS3Website(TBPulumiPublishEngine):
         with self.file_requirements_txt.open('w') as file:
             file.write('\n'.join(self.python_dependencies))
 
+    def infrastructure_inputs(self) -> dict:
+        """
+        Returns the stack's inputs. tb_pulumi's S3 website makes each file in the source directory a
+        resource of the stack, so this includes a digest of every file being published, and the
+        stack is updated whenever the site's content changes.
+
+        :return: Dict of the inputs.
+        :rtype: dict
+        """
+
+        return {**super().infrastructure_inputs(), 'content': self.content()}
+
+    def content(self) -> dict:
+        """
+        Returns the digest of every file being published, as listed by
+        :py:func:`microsite.publish.site_files`.
+
+        :return: Dict of paths, relative to the source directory, to their SHA-256 digests.
+        :rtype: dict[str, str]
+        """
+
+        if self._content is None:
+            source_dir = Path(self.source_dir).expanduser().resolve()
+            paths, _variants = site_files(source_dir)
+            self._content = {path: hash_file(source_dir / path) for path in sorted(paths)}
+        return self._content
+
+    def on_engine_event(self, event) -> None:
+        """
+        Notes the path of each published file which the operation updates, replaces, or deletes.
+        """
+
+        metadata = getattr(event.resource_pre_event, 'metadata', None)
+        if not metadata or metadata.type not in BUCKET_OBJECT_TYPES:
+            return
+        if op_name(metadata.op) not in STALE_OPS or not metadata.old:
+            return
+        key = (metadata.old.inputs or {}).get('key')
+        if isinstance(key, str):
+            self._stale.add(key.lstrip('/'))
+        else:
+            log.debug(f'Unable to tell which file {metadata.urn} holds')
+
+    def deployed(self, previous: dict, outputs: dict) -> None:
+        """
+        Invalidates the paths of the files the deployment changed or removed in the CloudFront
+        distribution's cache.
+        """
+
+        distribution_id = outputs.get(DISTRIBUTION_OUTPUT)
+        if not self.config.invalidate_cache or not self._stale or not distribution_id:
+            return
+
+        paths = cloudfront.invalidation_paths(
+            self._stale,
+            existing=[*self._stale, *self.content()],
+            index_document=self.config.index_document,
+            max_paths=self.config.invalidation_max_paths,
+            wildcard_ratio=self.config.invalidation_wildcard_ratio,
+        )
+        if not paths:
+            return
+        if boto3 is None:
+            log.warning(
+                f'The boto3 package is not installed, so the {len(paths)} changed paths will not '
+                f'be invalidated in CloudFront distribution {distribution_id}.'
+            )
+            return
+        client = boto3.client('cloudfront', region_name=self.config.aws_region)
+        with get_profiler().phase('invalidate', category='publish', target=self.name):
+            cloudfront.invalidate(client, distribution_id, paths)
+
     def publish(self):
         """
         Publishes the site as a ``tb_pulumi.s3.S3Website``.
         """
         self.ensure_work_dir()
+        if not self.destroy:
+            self.construct_upload_dir()
         self.construct_requirements_txt()
         self.construct_config_stack_yaml()
         self.construct_main_py()
         self.validate_work_dir()
         super().publish()
+        if self.destroy:
+            shutil.rmtree(self.upload_dir, ignore_errors=True)
@@ -0,0 +1,597 @@
+"""
+Module for publishing a site by syncing its files straight into an S3 bucket, without managing any
+other infrastructure. Only files which have changed since the last publish are uploaded, and files
+which are no longer part of the site are deleted, so publishing a small change to a large site takes
+seconds.
+"""
+
+import hashlib
+import json
+import logging
+import mimetypes
+
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from microsite.config import S3SyncTargetConfig
+from microsite.profiling import get_profiler
+from microsite.publish import PublishEngine, cloudfront, site_files
+from microsite.render.assets import ASSET_MANIFEST_FILENAME
+from microsite.render.compress import COMPRESSIBLE_EXTENSIONS, ENCODINGS
+from microsite.util import HASH_CHUNK_SIZE
+from pathlib import Path, PurePosixPath
+
+try:
+    import boto3
+
+    from boto3.s3.transfer import TransferConfig
+    from botocore.config import Config as BotocoreConfig
+except ImportError:
+    boto3 = None
+
+log = logging.getLogger(__name__)
+
+# Object in the bucket, under the target's prefix, recording what was last published
+SYNC_MANIFEST_KEY = '.microsite-sync.json'
+SYNC_MANIFEST_VERSION = 1
+
+# Most parts S3 allows in a multipart upload
+MAX_PARTS = 10_000
+
+# Most keys S3 deletes in a single request
+MAX_DELETE_KEYS = 1000
+
+# Threads each multipart upload uses to send its parts
+MULTIPART_CONCURRENCY = 4
+
+# Content types of file extensions which Python's mimetypes module does not know, or gets wrong
+CONTENT_TYPES = {
+    '.js': 'text/javascript',
+    '.md': 'text/markdown',
+    '.mjs': 'text/javascript',
+    '.wasm': 'application/wasm',
+    '.webmanifest': 'application/manifest+json',
+}
+
+# Non-text content types which hold text, and so need a character set
+TEXT_CONTENT_TYPES = {
+    'application/javascript',
+    'application/json',
+    'application/manifest+json',
+    'application/xml',
+    'image/svg+xml',
+}
+
+
+def content_type(path: str) -> str:
+    """
+    Determines the ``Content-Type`` of a file from its extension.
+
+    :param path: Path to the file.
+    :type path: str
+
+    :return: The content type, with a character set for text.
+    :rtype: str
+    """
+
+    suffix = PurePosixPath(path).suffix.lower()
+    mime_type = CONTENT_TYPES.get(suffix) or mimetypes.guess_type(path, strict=False)[0]
+    if not mime_type:
+        return 'application/octet-stream'
+    if mime_type.startswith('text/') or mime_type in TEXT_CONTENT_TYPES:
+        return f'{mime_type}; charset=utf-8'
+    return mime_type
+
+
+def s3_etag(path: str | Path, size: int, multipart_threshold: int, chunk_size: int) -> str:
+    """
+    Computes the ETag S3 gives a file uploaded with the given multipart settings. A file smaller
+    than the threshold is uploaded in one piece, and its ETag is the MD5 digest of its contents. A
+    larger file is uploaded in parts, and its ETag is the MD5 digest of the parts' digests, followed
+    by the number of parts. As boto3 does, the part size is doubled until the file fits in the most
+    parts S3 allows.
+
+    S3 only computes ETags this way for objects which are not encrypted with KMS keys. The ETags of
+    other objects never match, so those objects are compared using the sync manifest instead.
+
+    :param path: Path to the file.
+    :type path: str | Path
+
+    :param size: Size of the file in bytes.
+    :type size: int
+
+    :param multipart_threshold: Size in bytes at which files are uploaded in parts.
+    :type multipart_threshold: int
+
+    :param chunk_size: Size in bytes of each part.
+    :type chunk_size: int
+
+    :return: The ETag, without the quotes S3 surrounds it with.
+    :rtype: str
+    """
+
+    if size < multipart_threshold:
+        digest = hashlib.md5(usedforsecurity=False)
+        with open(path, 'rb') as file:
+            while chunk := file.read(HASH_CHUNK_SIZE):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    while -(-size // chunk_size) > MAX_PARTS:
+        chunk_size *= 2
+    part_digests = []
+    with open(path, 'rb') as file:
+        while part := file.read(chunk_size):
+            part_digests.append(hashlib.md5(part, usedforsecurity=False).digest())
+    combined = hashlib.md5(b''.join(part_digests), usedforsecurity=False).hexdigest()
+    return f'{combined}-{len(part_digests)}'
+
+
+class S3SyncPublishEngine(PublishEngine):
+    """
+    Publishes a site by syncing the source directory into an S3 bucket with boto3. The bucket (and
+    anything serving it, like a CloudFront distribution) must already exist; this engine only
+    manages the objects in it.
+
+    Each publish compares the site's files against the bucket's contents, found by listing the
+    objects under the target's prefix:
+
+    - A file is uploaded when no object has its ETag, or when its headers have changed since it was
+      last published. Files are uploaded concurrently, and large files are uploaded in parts.
+    - An object is deleted when no file maps to it any longer, unless ``delete`` is turned off.
+    - Everything else is left alone.
+
+    After a successful publish, a sync manifest is written to the bucket recording each object's
+    ETag and headers. This lets the next publish recognize objects whose ETags are not MD5 digests,
+    such as those encrypted with KMS keys, and notice changes to headers like ``Cache-Control``.
+
+    Other files are uploaded before HTML pages, and objects are only deleted after every upload has
+    finished, so a page is never live before the files it refers to.
+
+    Each object is given a ``Content-Type`` based on its file extension. Files which were
+    fingerprinted during rendering (see ``render.fingerprint_assets``) never change in place, so
+    they are given the ``immutable_cache_control`` header. Other files are given ``cache_control``,
+    when it is set. The build and asset manifests and any compressed copies written by
+    ``render.compress`` are never uploaded as objects of their own (see
+    :py:func:`microsite.publish.site_files`). When ``content_encoding`` is set, the compressed copy
+    of a file in that encoding is uploaded in place of the file, with a matching
+    ``Content-Encoding`` header.
+
+    When ``cloudfront_distribution_id`` is set, the paths of objects which were replaced or deleted
+    are invalidated in the distribution's cache once the sync is done (see
+    :py:func:`microsite.publish.cloudfront.invalidation_paths`). The paths are relative to the
+    target's prefix, as when the distribution's origin path is the prefix.
+
+    :param name: The name of the publishing target.
+    :type name: str
+
+    :param source_dir: Directory containing the files to publish.
+    :type source_dir: str
+
+    :param config: The target's settings.
+    :type config: microsite.config.S3SyncTargetConfig | dict
+
+    :param dry_run: When True, log what would change in the bucket without changing anything.
+    :type dry_run: bool
+
+    :param destroy: When True, delete every object under the target's prefix instead of publishing.
+    :type destroy: bool
+
+    :param force_infra: Has no effect, since this engine manages no infrastructure.
+    :type force_infra: bool, optional
+
+    :param client: An S3 client to use instead of creating one from the target's settings.
+    :type client: botocore.client.S3, optional
+
+    :param cloudfront_client: A CloudFront client to use instead of creating one from the target's
+        settings.
+    :type cloudfront_client: botocore.client.CloudFront, optional
+    """
+
+    config_schema = S3SyncTargetConfig
+
+    def __init__(
+        self,
+        name: str,
+        source_dir: str,
+        config: S3SyncTargetConfig | Mapping,
+        dry_run: bool,
+        destroy: bool,
+        force_infra: bool = False,
+        client=None,
+        cloudfront_client=None,
+    ):
+        super().__init__(
+            name=name,
+            source_dir=source_dir,
+            config=config,
+            dry_run=dry_run,
+            destroy=destroy,
+            force_infra=force_infra,
+        )
+        if boto3 is None and client is None:
+            raise ImportError(
+                'The s3sync publishing engine requires the boto3 package. Install it with '
+                '"pip install microsite[s3]".'
+            )
+
+        prefix = self.config.prefix.strip('/')
+        self.prefix = f'{prefix}/' if prefix else ''
+        self.manifest_key = f'{self.prefix}{SYNC_MANIFEST_KEY}'
+        self._client = client
+        self._cloudfront_client = cloudfront_client
+        self._session = None
+
+    @property
+    def session(self) -> 'boto3.session.Session':
+        """
+        The boto3 session clients are created from, using the target's AWS profile and region.
+        """
+
+        if self._session is None:
+            self._session = boto3.session.Session(
+                profile_name=self.config.aws_profile, region_name=self.config.aws_region
+            )
+        return self._session
+
+    @property
+    def client(self):
+        """
+        The S3 client used to talk to the bucket. It is shared by every thread, with enough pooled
+        connections for each of them.
+        """
+
+        if self._client is None:
+            self._client = self.session.client(
+                's3',
+                endpoint_url=self.config.endpoint_url,
+                config=BotocoreConfig(
+                    max_pool_connections=self.config.workers * MULTIPART_CONCURRENCY
+                ),
+            )
+        return self._client
+
+    @property
+    def cloudfront_client(self):
+        """
+        The CloudFront client used to invalidate the distribution's cache.
+        """
+
+        if self._cloudfront_client is None:
+            self._cloudfront_client = self.session.client('cloudfront')
+        return self._cloudfront_client
+
+    @property
+    def transfer_config(self) -> 'TransferConfig':
+        """
+        Settings for boto3's managed uploads, which split large files into parts.
+        """
+
+        return TransferConfig(
+            multipart_threshold=self.config.multipart_threshold,
+            multipart_chunksize=self.config.multipart_chunk_size,
+            max_concurrency=MULTIPART_CONCURRENCY,
+        )
+
+    def run_all(self, func, items: list) -> list:
+        """
+        Calls a function on each of the items using a pool of ``workers`` threads. If any call
+        fails, calls which have not started yet are cancelled and the exception is raised.
+
+        :return: List of the results, in the order of the items.
+        :rtype: list
+        """
+
+        if not items:
+            return []
+        with ThreadPoolExecutor(max_workers=self.config.workers) as executor:
+            futures = {executor.submit(func, item): number for number, item in enumerate(items)}
+            results = [None] * len(items)
+            try:
+                for future in as_completed(futures):
+                    results[futures[future]] = future.result()
+            except BaseException:
+                executor.shutdown(wait=True, cancel_futures=True)
+                raise
+        return results
+
+    def list_remote(self) -> dict:
+        """
+        Lists the objects under the target's prefix.
+
+        :return: Dict of object keys, relative to the prefix, to their ETags without quotes.
+        :rtype: dict[str, str]
+        """
+
+        objects = {}
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.config.bucket, Prefix=self.prefix):
+            for item in page.get('Contents', []):
+                objects[item['Key'][len(self.prefix) :]] = item['ETag'].strip('"')
+        return objects
+
+    def load_manifest(self) -> dict:
+        """
+        Reads the sync manifest left in the bucket by the last publish.
+
+        :return: Dict of object keys, relative to the prefix, to dicts of the ``etag`` S3 gave the
+            object, the ``local_etag`` of the file it was uploaded from, and its ``headers``. Empty
+            if there is no usable manifest.
+        :rtype: dict
+        """
+
+        try:
+            response = self.client.get_object(Bucket=self.config.bucket, Key=self.manifest_key)
+        except self.client.exceptions.NoSuchKey:
+            return {}
+        try:
+            manifest = json.loads(response['Body'].read())
+        except ValueError as ex:
+            log.warning(f'Ignoring unreadable sync manifest {self.manifest_key}: {ex}')
+            return {}
+        if manifest.get('version') != SYNC_MANIFEST_VERSION:
+            log.info(f'Ignoring sync manifest {self.manifest_key} from a different version')
+            return {}
+        return manifest.get('objects', {})
+
+    def save_manifest(self, objects: dict) -> None:
+        """
+        Writes the sync manifest into the bucket.
+
+        :param objects: The manifest's objects, as returned by :py:meth:`load_manifest`.
+        :type objects: dict
+        """
+
+        body = json.dumps(
+            {'version': SYNC_MANIFEST_VERSION, 'objects': objects}, indent=2, sort_keys=True
+        )
+        self.client.put_object(
+            Bucket=self.config.bucket,
+            Key=self.manifest_key,
+            Body=body.encode(),
+            ContentType='application/json',
+            CacheControl='no-store',
+        )
+
+    def immutable_paths(self, source_dir: Path) -> set[str]:
+        """
+        Returns the paths of the files fingerprinted during rendering, from the asset manifest.
+        """
+
+        manifest_file = source_dir / ASSET_MANIFEST_FILENAME
+        if not manifest_file.is_file():
+            return set()
+        with manifest_file.open('r') as file:
+            return set(json.load(file).values())
+
+    def local_files(self, source_dir: Path) -> dict:
+        """
+        Determines which file each object should be uploaded from, and with which headers.
+
+        :param source_dir: The directory being published.
+        :type source_dir: Path
+
+        :return: Dict of object keys, relative to the prefix, to dicts of the ``file`` to upload
+            and the object's ``headers``.
+        :rtype: dict
+        """
+
+        paths, variants = site_files(source_dir, exclude=list(self.config.exclude))
+        immutable = self.immutable_paths(source_dir)
+        encoding = self.config.content_encoding
+
+        files = {}
+        for path in sorted(paths):
+            headers = {'ContentType': content_type(path)}
+            if path in immutable:
+                headers['CacheControl'] = self.config.immutable_cache_control
+            elif self.config.cache_control:
+                headers['CacheControl'] = self.config.cache_control
+            file = path
+            variant = f'{path}{ENCODINGS[encoding]}' if encoding else None
+            compressible = PurePosixPath(path).suffix.lower() in COMPRESSIBLE_EXTENSIONS
+            if compressible and variant in variants:
+                file = variant
+                headers['ContentEncoding'] = encoding
+            files[path] = {'file': file, 'headers': headers}
+        return files
+
+    def plan(self, source_dir: Path) -> tuple[dict, list[str], dict]:
+        """
+        Compares the site's files against the bucket to decide what to upload and delete.
+
+        :param source_dir: The directory being published.
+        :type source_dir: Path
+
+        :return: A tuple of three things:
+
+            - Dict of the objects to upload, by key, as returned by :py:meth:`local_files` with the
+              file's ``size`` and ``local_etag`` added, and ``replaces`` set when an object with
+              the key already exists.
+            - Sorted list of the keys of objects to delete.
+            - The sync manifest entries of every object which is already up to date.
+        :rtype: tuple[dict, list[str], dict]
+        """
+
+        files = self.local_files(source_dir)
+        remote = self.list_remote()
+        manifest = self.load_manifest() if remote else {}
+
+        def measure(key: str) -> None:
+            local = files[key]
+            local_file = source_dir / local['file']
+            local['size'] = local_file.stat().st_size
+            local['local_etag'] = s3_etag(
+                local_file,
+                local['size'],
+                self.config.multipart_threshold,
+                self.config.multipart_chunk_size,
+            )
+
+        self.run_all(measure, list(files))
+
+        uploads = {}
+        unchanged = {}
+        for key, local in files.items():
+            etag = remote.get(key)
+            recorded = manifest.get(key)
+            if recorded and recorded.get('etag') == etag:
+                current = (
+                    recorded.get('local_etag') == local['local_etag']
+                    and recorded.get('headers') == local['headers']
+                )
+            else:
+                # Objects the manifest knows nothing about are compared by content alone
+                current = etag == local['local_etag']
+            if current:
+                unchanged[key] = {
+                    'etag': etag,
+                    'local_etag': local['local_etag'],
+                    'headers': local['headers'],
+                }
+            else:
+                uploads[key] = {**local, 'replaces': etag is not None}
+
+        deletes = []
+        if self.config.delete:
+            deletes = sorted(key for key in remote if key not in files and key != SYNC_MANIFEST_KEY)
+        return uploads, deletes, unchanged
+
+    def upload(self, source_dir: Path, key: str, local: dict) -> dict:
+        """
+        Uploads a single file, splitting it into parts if it is large.
+
+        :return: The object's entry in the sync manifest.
+        :rtype: dict
+        """
+
+        log.debug(f'Uploading {local["file"]} to s3://{self.config.bucket}/{self.prefix}{key}')
+        self.client.upload_file(
+            Filename=str(source_dir / local['file']),
+            Bucket=self.config.bucket,
+            Key=f'{self.prefix}{key}',
+            ExtraArgs=local['headers'],
+            Config=self.transfer_config,
+        )
+        response = self.client.head_object(Bucket=self.config.bucket, Key=f'{self.prefix}{key}')
+        return {
+            'etag': response['ETag'].strip('"'),
+            'local_etag': local['local_etag'],
+            'headers': local['headers'],
+        }
+
+    def delete(self, keys: list[str]) -> None:
+        """
+        Deletes objects under the target's prefix, in as few requests as possible.
+
+        :param keys: Keys of the objects, relative to the prefix.
+        :type keys: list[str]
+
+        :raises RuntimeError: When S3 fails to delete any of the objects.
+        """
+
+        batches = [
+            keys[start : start + MAX_DELETE_KEYS] for start in range(0, len(keys), MAX_DELETE_KEYS)
+        ]
+
+        def delete_batch(batch: list[str]) -> None:
+            response = self.client.delete_objects(
+                Bucket=self.config.bucket,
+                Delete={
+                    'Objects': [{'Key': f'{self.prefix}{key}'} for key in batch],
+                    'Quiet': True,
+                },
+            )
+            errors = response.get('Errors', [])
+            if errors:
+                raise RuntimeError(
+                    f'Unable to delete {len(errors)} objects from {self.config.bucket}, such as '
+                    f'{errors[0]["Key"]}: {errors[0].get("Message")}'
+                )
+
+        self.run_all(delete_batch, batches)
+
+    def invalidation_paths(self, uploads: dict, deletes: list[str], unchanged: dict) -> list[str]:
+        """
+        Works out which paths to invalidate in the CloudFront distribution, as returned by
+        :py:meth:`plan`.
+
+        :return: List of URL paths, which is empty when no distribution is configured.
+        :rtype: list[str]
+        """
+
+        if not self.config.cloudfront_distribution_id:
+            return []
+        changed = [key for key, local in uploads.items() if local['replaces']] + deletes
+        return cloudfront.invalidation_paths(
+            changed,
+            existing=[*uploads, *deletes, *unchanged],
+            index_document=self.config.index_document,
+            max_paths=self.config.invalidation_max_paths,
+            wildcard_ratio=self.config.invalidation_wildcard_ratio,
+        )
+
+    def publish(self):
+        """
+        Syncs the source directory into the bucket, or deletes everything under the target's prefix
+        when destroying the site.
+        """
+
+        profiler = get_profiler()
+        bucket = self.config.bucket
+        location = f's3://{bucket}/{self.prefix}'
+
+        if self.destroy:
+            with profiler.phase('plan', category='publish', target=self.name):
+                keys = sorted(self.list_remote())
+            if self.dry_run:
+                log.info(f'Would delete {len(keys)} objects from {location}')
+                return
+            log.info(f'Deleting {len(keys)} objects from {location}')
+            with profiler.phase('delete', category='publish', target=self.name):
+                self.delete(keys)
+            return
+
+        if not self.source_dir or not Path(self.source_dir).expanduser().is_dir():
+            raise IOError(f'Publish source directory {self.source_dir} does not exist')
+        source_dir = Path(self.source_dir).expanduser().resolve()
+
+        with profiler.phase('plan', category='publish', target=self.name):
+            uploads, deletes, unchanged = self.plan(source_dir)
+        upload_size = sum(local['size'] for local in uploads.values())
+        summary = (
+            f'{len(uploads)} files ({upload_size / 2**20:.1f} MiB) to upload, {len(deletes)} '
+            f'objects to delete, and {len(unchanged)} unchanged in {location}'
+        )
+        invalidations = self.invalidation_paths(uploads, deletes, unchanged)
+        if self.dry_run:
+            log.info(f'Dry run: {summary}')
+            for key in sorted(uploads):
+                log.info(f'Would upload {key}')
+            for key in deletes:
+                log.info(f'Would delete {key}')
+            for path in invalidations:
+                log.info(f'Would invalidate {path}')
+            return
+        log.info(f'Publishing: {summary}')
+
+        # Upload pages last, so no page goes live before the files it refers to
+        pages = [key for key in uploads if content_type(key).startswith('text/html')]
+        others = [key for key in uploads if key not in pages]
+        objects = dict(unchanged)
+        with profiler.phase('upload', category='publish', target=self.name):
+            for wave in (others, pages):
+                results = self.run_all(lambda key: self.upload(source_dir, key, uploads[key]), wave)
+                objects.update(zip(wave, results))
+
+        if deletes:
+            with profiler.phase('delete', category='publish', target=self.name):
+                self.delete(deletes)
+
+        self.save_manifest(objects)
+        log.info(f'Published {len(uploads)} files and deleted {len(deletes)} objects in {location}')
+
+        if invalidations:
+            with profiler.phase('invalidate', category='publish', target=self.name):
+                cloudfront.invalidate(
+                    self.cloudfront_client, self.config.cloudfront_distribution_id, invalidations
+                )
@@ -0,0 +1,174 @@
+"""
+Module for finding the rendering and publishing engines a project names. Engines are registered by
+name against the ``module:Class`` path of the class which implements them, and the module is only
+imported when a project actually uses the engine. This keeps the cost of engines a run does not need
+(like the Pulumi SDK, which publishing engines depend on) out of every other run.
+
+Besides the engines built into microsite, other packages can provide engines by declaring entry
+points in the ``microsite.render_engines`` and ``microsite.publish_engines`` groups. For example, in
+a package's ``pyproject.toml``:
+
+.. code-block:: toml
+
+    [project.entry-points."microsite.publish_engines"]
+    rsync = "microsite_rsync:RsyncPublishEngine"
+
+A project could then publish a target with ``engine = "rsync"``. Engines can also be registered at
+runtime with :py:meth:`EngineRegistry.register`. An engine built into microsite cannot be replaced
+by an entry point of the same name, but can be replaced by registering it explicitly.
+"""
+
+import importlib
+import logging
+
+log = logging.getLogger(__name__)
+
+# Entry point groups other packages can register engines in
+RENDER_ENGINE_ENTRY_POINT_GROUP = 'microsite.render_engines'
+PUBLISH_ENGINE_ENTRY_POINT_GROUP = 'microsite.publish_engines'
+
+# Engines built into microsite, mapped to the "module:Class" paths of their classes
+RENDER_ENGINE_CLASS_MAP = {
+    'markdown': 'microsite.render.markdown:MarkdownRenderEngine',
+}
+
+PUBLISH_ENGINE_CLASS_MAP = {
+    's3sync': 'microsite.publish.s3sync:S3SyncPublishEngine',
+    'tbp_s3website': 'microsite.publish.s3:TbPulumiS3Website',
+}
+
+
+def import_object(target: str):
+    """
+    Imports an object given its ``module:attribute`` path, as entry points are written.
+
+    :param target: Path to the object, such as ``microsite.render.markdown:MarkdownRenderEngine``.
+    :type target: str
+
+    :raises ValueError: When the path is not of the form ``module:attribute``.
+
+    :return: The object.
+    """
+
+    module_name, _, attribute = target.partition(':')
+    if not module_name or not attribute:
+        raise ValueError(f'{target!r} is not of the form "module:attribute"')
+    obj = importlib.import_module(module_name)
+    for part in attribute.split('.'):
+        obj = getattr(obj, part)
+    return obj
+
+
+class EngineRegistry:
+    """
+    Maps the names of one kind of engine to the classes which implement them, importing each class
+    only when it is first asked for.
+
+    :param kind: Kind of engine registered here, such as ``rendering``, used in error messages.
+    :type kind: str
+
+    :param group: Entry point group other packages register engines of this kind in.
+    :type group: str
+
+    :param builtins: Engines built into microsite, mapped to their classes or the
+        ``module:Class`` paths of their classes.
+    :type builtins: dict[str, str | type]
+    """
+
+    def __init__(self, kind: str, group: str, builtins: dict[str, str | type]):
+        self.kind = kind
+        self.group = group
+        self.targets = dict(builtins)
+        self.classes = {}
+        self._entry_points = None
+
+    def register(self, name: str, target: str | type) -> None:
+        """
+        Registers an engine, replacing any engine already registered with the same name.
+
+        :param name: Name projects refer to the engine by.
+        :type name: str
+
+        :param target: The engine's class, or the ``module:Class`` path of it.
+        :type target: str | type
+        """
+
+        self.targets[name] = target
+        self.classes.pop(name, None)
+
+    def entry_points(self) -> dict:
+        """
+        Returns the entry points installed packages have registered in this registry's group. They
+        are only looked up once, and only when an engine is asked for which is not registered any
+        other way.
+
+        :return: Dict of engine names to entry points.
+        :rtype: dict[str, importlib.metadata.EntryPoint]
+        """
+
+        if self._entry_points is None:
+            from importlib.metadata import entry_points
+
+            self._entry_points = {ep.name: ep for ep in entry_points(group=self.group)}
+        return self._entry_points
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.targets or name in self.entry_points()
+
+    def names(self) -> list[str]:
+        """
+        Returns the names of every engine in the registry, including those from entry points.
+
+        :return: Sorted list of engine names.
+        :rtype: list[str]
+        """
+
+        return sorted(set(self.targets) | set(self.entry_points()))
+
+    def load(self, name: str) -> type:
+        """
+        Returns the class implementing an engine, importing it if it has not been already.
+
+        :param name: Name of the engine.
+        :type name: str
+
+        :raises KeyError: When no engine of this kind has the name.
+        :raises ImportError: When the engine's module cannot be imported, such as when a package it
+            depends on is not installed.
+
+        :return: The engine's class.
+        :rtype: type
+        """
+
+        if name in self.classes:
+            return self.classes[name]
+
+        if name in self.targets:
+            target = self.targets[name]
+            source = target if isinstance(target, str) else None
+        elif name in self.entry_points():
+            target = self.entry_points()[name]
+            source = target.value
+        else:
+            raise KeyError(f'{name!r} is not a known {self.kind} engine')
+
+        log.debug(f'Loading the {name} {self.kind} engine from {source or target}')
+        try:
+            if source is None:
+                cls = target
+            elif isinstance(target, str):
+                cls = import_object(target)
+            else:
+                cls = target.load()
+        except ImportError as ex:
+            raise ImportError(f'Unable to load the {name} {self.kind} engine from {source}: {ex}')
+        self.classes[name] = cls
+        return cls
+
+
+RENDER_ENGINES = EngineRegistry(
+    'rendering', RENDER_ENGINE_ENTRY_POINT_GROUP, RENDER_ENGINE_CLASS_MAP
+)
+PUBLISH_ENGINES = EngineRegistry(
+    'publishing', PUBLISH_ENGINE_ENTRY_POINT_GROUP, PUBLISH_ENGINE_CLASS_MAP
+)
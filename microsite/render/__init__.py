@@ -3,11 +3,19 @@ Module for rendering HTML files from source Markdown files.
 """
 
 import logging
-import shutil
 
-from abc import ABC, abstractclassmethod
+from abc import ABC, abstractclassmethod, abstractmethod
+from collections.abc import Collection, Mapping
+from concurrent.futures import ThreadPoolExecutor
 from microsite import path as ms_path
-from microsite.util import AttrDict, Engine
+from microsite.config import ConfigSection, IndexEntry, load_value
+from microsite.filecopy import FileCopier, copy_file
+from microsite.profiling import get_profiler
+from microsite.render import staging
+from microsite.render.assets import ASSET_MANIFEST_FILENAME, AssetMap
+from microsite.render.compress import Compressor
+from microsite.render.manifest import BuildManifest
+from microsite.util import Engine, hash_data
 from shutil import rmtree
 from pathlib import Path
 
@@ -21,24 +29,75 @@ class RenderEngine(ABC, Engine):
     :param name: The name of the rendering engine.
     :type name: str
 
-    :param config: A dict containing operating parameters for this rendering engine.
-    :type config: dict
+    :param config: The engine's settings. When the engine has a ``config_schema``, a plain dict of
+        settings is checked and converted into it, and any settings left out take their defaults.
+    :type config: microsite.config.ConfigSection | dict
 
-    :param index: Dict where the keys are paths to source files and the values are dicts with
-        the following optional settings:
+    :param index: Dict where the keys are paths to source files and the values are the per-page
+        settings from the project's ``render.index``, as
+        :py:class:`microsite.config.IndexEntry` objects or plain dicts with these optional keys:
 
         - ``tags``: List of terms relevant to the content of the page.
         - ``title``: Used to override the ``<title>`` text for the page.
+    :type index: dict, optional
+
+    :param workers: Number of worker processes the engine may spread its work across. Defaults to 1,
+        which does all work in the current process.
+    :type workers: int, optional
+
+    :param cache_dir: Directory in which the engine may keep data between builds, such as compiled
+        templates. When None, the engine does not cache anything on disk. Defaults to None.
+    :type cache_dir: str, optional
+
+    :param assets: Map of the build's fingerprinted assets. This is normally set by
+        :py:func:`render` for the duration of a build, and only needs to be passed in when building
+        a copy of the engine for a worker process. Defaults to None.
+    :type assets: microsite.render.assets.AssetMap, optional
     """
 
-    def __init__(self, name: str, config: AttrDict, index: dict = {}):
+    # The ConfigSection dataclass describing the engine's settings
+    config_schema = None
+
+    def __init__(
+        self,
+        name: str,
+        config: ConfigSection | Mapping,
+        index: Mapping = {},
+        workers: int = 1,
+        cache_dir: str = None,
+        assets: AssetMap = None,
+    ):
+        if self.config_schema:
+            config = load_value(self.config_schema, config, f'render.engine.{name}')
         super().__init__(name=name, config=config)
-        self.index = index
+        self.index = load_value(Mapping[str, IndexEntry], index, 'render.index')
+        self.workers = workers
+        self.cache_dir = Path(cache_dir) / name if cache_dir else None
+        self.assets = assets
+
+        # Set by render() for the duration of a build
+        self.copier = None
         log.debug(f'Created rendering engine {name} with options: {config}')
         log.debug(f'Document index: {self.index}')
 
+    @abstractmethod
+    def claims(self, path: str) -> bool:
+        """
+        Determines whether this engine handles a source file. Each source file may be claimed by at
+        most one engine; files no engine claims are copied into the build as they are.
+
+        :param path: Source path relative to the source directory.
+        :type path: str
+
+        :return: True if the engine renders the file.
+        :rtype: bool
+        """
+        pass
+
     @abstractclassmethod
-    def render(self, source_dir: str, target_dir: str, paths: list[str]) -> list[str]:
+    def render(
+        self, source_dir: str, target_dir: str, paths: list[str], dirty_paths: set[str] = None
+    ) -> list[str]:
         """
         Abstract function representing a RenderEngine's rendering process.
 
@@ -48,23 +107,217 @@ class RenderEngine(ABC, Engine):
         :param target_dir: Top-level directory to render files into.
         :type target_dir: str | Path
 
-        :param paths: List of all paths in the source directory to be processed. Not every path in
-            this list will be rendered.
+        :param paths: List of the paths in the source directory which this engine claimed. See
+            :py:meth:`claims`.
+        :type paths: list[str]
+
+        :param dirty_paths: When rendering incrementally, the set of paths which have changed since
+            the last build. Paths the engine handles which are not in this set still belong to the
+            engine and must be returned, but their output is already up to date and they should not
+            be rendered again. When None, every path must be rendered. Defaults to None.
+        :type dirty_paths: set[str], optional
+
+        :return: List of paths this RenderEngine handles. Any claimed path which is not returned is
+            copied into the build as it is.
+        :rtype: list[str]
+        """
+        pass
+
+    def copy_file(self, source: str | Path, target: str | Path) -> None:
+        """
+        Copies a file into the build using the build's copy strategy. When the engine is rendering
+        as part of :py:func:`render`, the copy happens on the build's copy threads and may not have
+        finished by the time this returns.
+
+        :param source: The file to copy.
+        :type source: str | Path
+
+        :param target: Where to copy the file to.
+        :type target: str | Path
+        """
+
+        if self.copier:
+            self.copier.submit(source, target)
+        else:
+            copy_file(source, target)
+
+    def worker_kwargs(self) -> dict:
+        """
+        Returns the keyword arguments needed to build a copy of this engine inside a worker process.
+        The values must be picklable.
+
+        :return: Dict of arguments for this engine's constructor.
+        :rtype: dict
+        """
+
+        return {
+            'name': self.name,
+            'config': self.config,
+            'index': self.index,
+            'cache_dir': str(self.cache_dir.parent) if self.cache_dir else None,
+            'assets': self.assets,
+        }
+
+    def prepare(self, source_dir: str, paths: list[str], manifest: BuildManifest) -> None:
+        """
+        Gathers whatever the engine needs to know about the files it claimed before any of them are
+        rendered, such as metadata pages declare about themselves. This is called once per build,
+        after the source files have been scanned and claimed but before working out which of them
+        have changed, so an engine may register virtual dependencies here with
+        :py:meth:`microsite.render.manifest.BuildManifest.set_dependency`.
+
+        :param source_dir: Top-level directory containing the source files.
+        :type source_dir: str
+
+        :param paths: List of the paths in the source directory which this engine claimed.
         :type paths: list[str]
+
+        :param manifest: The current build's manifest, holding the content hash of every source
+            file.
+        :type manifest: microsite.render.manifest.BuildManifest
         """
+
         pass
 
+    def register_assets(self, assets: AssetMap) -> None:
+        """
+        Adds any assets the engine produces itself (rather than copying from the source directory),
+        such as a shared stylesheet, to the build's asset map. This is called once per build, before
+        anything is rendered, so that every page can refer to the fingerprinted files.
+
+        :param assets: The build's asset map.
+        :type assets: microsite.render.assets.AssetMap
+        """
+
+        pass
+
+    def fingerprint(self) -> str:
+        """
+        Returns a digest of every engine-wide setting which affects the output of this engine. When
+        this changes between builds, all files handled by the engine are rendered again.
+
+        :return: Hexadecimal digest.
+        :rtype: str
+        """
+
+        return hash_data(
+            {
+                'engine': type(self).__name__,
+                'config': (
+                    self.config.as_dict() if isinstance(self.config, ConfigSection) else self.config
+                ),
+                'fingerprint_assets': self.assets.extensions if self.assets else [],
+            }
+        )
+
+    def page_fingerprint(self, path: str) -> str:
+        """
+        Returns a digest of the per-file settings (the file's ``index`` entry) which affect the
+        output rendered from the given path.
+
+        :param path: Source path relative to the source directory.
+        :type path: str
+
+        :return: Hexadecimal digest.
+        :rtype: str
+        """
+
+        entry = self.index.get(path)
+        return hash_data(entry.as_dict() if entry else {})
+
+    def dependencies(self, path: str) -> list[str]:
+        """
+        Returns paths to files other than the source file itself which the output rendered from the
+        given path depends on, such as templates. When any of these change between builds, the path
+        is rendered again.
+
+        :param path: Source path relative to the source directory.
+        :type path: str
+
+        :return: List of paths to dependency files.
+        :rtype: list[str]
+        """
+
+        return []
+
+    def output_paths(self, path: str) -> list[str]:
+        """
+        Returns the paths, relative to the target directory, which rendering the given source path
+        produces.
+
+        :param path: Source path relative to the source directory.
+        :type path: str
+
+        :return: List of output paths.
+        :rtype: list[str]
+        """
+
+        return [path]
+
+    def watch_paths(self) -> list[str]:
+        """
+        Returns paths to files and directories outside of the source directory which affect this
+        engine's output. Watch mode rebuilds the site when any of these change.
+
+        :return: List of paths to watch.
+        :rtype: list[str]
+        """
+
+        return []
+
+    def static_outputs(self) -> list[str]:
+        """
+        Returns the paths, relative to the target directory, which this engine produces regardless
+        of which source files it renders, such as a shared stylesheet. This is called after the
+        engine has rendered, so it may include files whose names depend on what was rendered.
+
+        :return: List of output paths.
+        :rtype: list[str]
+        """
+
+        return []
+
 
 def render(
     engines: list[RenderEngine],
     source_dir: str,
     target_dir: str,
     delete_target_dir: bool = True,
+    incremental: bool = False,
+    exclude: list[str] = None,
+    copy_strategy: str = 'copy',
+    copy_workers: int = 4,
+    atomic: bool = True,
+    keep_builds: int = 1,
+    compress: list[str] = None,
+    compress_min_size: int = 1024,
+    compress_workers: int = 4,
+    cache_dir: str = None,
+    fingerprint_assets: list[str] = None,
 ) -> None:
     """
-    Discover all files contained within ``source_dir``. Pass all files into each rendering engine.
-    Track whether each file has been altered by one of these rendering processes. Copy any unaltered
-    files into the target location directly.
+    Discover all files contained within ``source_dir`` and work out which rendering engine, if any,
+    claims each one (see :py:meth:`RenderEngine.claims`). The engines then render the files they
+    claimed, all at once, while the files no engine claimed are copied into the target location
+    directly.
+
+    Every build writes a :py:class:`microsite.render.manifest.BuildManifest` into the target
+    directory. When ``incremental`` is True and such a manifest exists, only the files which have
+    changed since that build are rendered or copied. Outputs belonging to source files which no
+    longer exist are removed.
+
+    When ``atomic`` is True, the site is built in a staging directory next to the target directory
+    and swapped into place only once the build has succeeded, so the target directory always holds a
+    complete build. Incremental builds start from hard links to the files of the previous build. The
+    builds replaced this way are kept for :py:func:`microsite.render.staging.rollback`.
+
+    When ``compress`` lists any encodings, a compressed copy of each compressible file in the build
+    is written alongside it by a :py:class:`microsite.render.compress.Compressor`.
+
+    When ``fingerprint_assets`` lists any file extensions, files with those extensions are written
+    under names containing a hash of their contents, and every reference to them in rendered pages
+    is rewritten to match. The mapping is written to the build as ``asset-manifest.json``. See
+    :py:class:`microsite.render.assets.AssetMap`.
 
     :param source_dir: The top level directory containing all source files.
     :type source_dir: str
@@ -77,46 +330,444 @@ def render(
         This ensures a clean build environment. Defaults to True.
     :type delete_target_dir: bool, optional
 
+    :param incremental: When True, reuse the output of the previous build where its build manifest
+        shows that nothing has changed. Defaults to False.
+    :type incremental: bool, optional
+
+    :param exclude: List of ignore patterns for source files which should not be part of the site,
+        in addition to any listed in the source directory's ``.micrositeignore`` file. See
+        :py:func:`microsite.path.iter_paths` for the pattern syntax.
+    :type exclude: list[str], optional
+
+    :param copy_strategy: How to copy files which are not rendered (and other files engines copy,
+        like stylesheets) into the target directory. One of
+        :py:data:`microsite.filecopy.COPY_STRATEGIES`. Copies are skipped when the target already
+        holds an identical file. Defaults to ``copy``.
+    :type copy_strategy: str, optional
+
+    :param copy_workers: Number of files to copy at once. Defaults to 4.
+    :type copy_workers: int, optional
+
+    :param atomic: When True, build in a staging directory and swap it into place when the build
+        succeeds. When False, build directly in the target directory. Defaults to True.
+    :type atomic: bool, optional
+
+    :param keep_builds: When building atomically, the number of replaced builds to keep for
+        rollback. Defaults to 1.
+    :type keep_builds: int, optional
+
+    :param compress: Encodings to write compressed copies of compressible files in, from
+        :py:data:`microsite.render.compress.ENCODINGS`. Defaults to None, which compresses nothing.
+    :type compress: list[str], optional
+
+    :param compress_min_size: Size in bytes below which files are not compressed. Defaults to 1024.
+    :type compress_min_size: int, optional
+
+    :param compress_workers: Number of files to compress at once. Defaults to 4.
+    :type compress_workers: int, optional
+
+    :param cache_dir: Directory in which compressed copies are kept between builds. When None,
+        nothing is cached. Defaults to None.
+    :type cache_dir: str, optional
+
+    :param fingerprint_assets: Extensions of the files to fingerprint, such as ``css`` or ``png``.
+        Defaults to None, which fingerprints nothing.
+    :type fingerprint_assets: list[str], optional
+
     :raises IOError: When the target directory exists, but you have provided
         ``delete_target_dir=False``.
-    :raises ValueError: When the stylesheet's target filename conflicts with a filename in the
-        source content.
+    :raises ValueError: When more than one engine claims the same source file, when two source
+        files or engines would write the same file in the build (as when the stylesheet's target
+        filename matches a file in the source content), when a compression encoding is not
+        recognized, or when the source content contains a file named like the asset manifest while
+        fingerprinting assets.
     """
 
+    compressor = None
+    if compress:
+        compressor = Compressor(
+            encodings=compress,
+            min_size=compress_min_size,
+            workers=compress_workers,
+            cache_dir=Path(cache_dir) / 'compress' if cache_dir else None,
+        )
+
     # Prepare target directory
     log.debug(f'Preparing target directory: {target_dir}')
     target_path = Path(target_dir)
-    if target_path.exists():
-        if delete_target_dir:
-            log.info('Target directory already exists. Deleting it now to ensure a clean build.')
-            rmtree(target_path)
-        else:
+    previous = BuildManifest.load(target_path) if incremental and target_path.exists() else None
+    if previous:
+        log.info('Target directory contains a build manifest. Rendering incrementally.')
+    elif target_path.exists():
+        if not delete_target_dir:
             raise IOError(
                 'Target directory already exists, but project settings specified not to delete it.'
             )
+        if not atomic:
+            log.info('Target directory already exists. Deleting it now to ensure a clean build.')
+            rmtree(target_path)
+
+    if not atomic:
+        if not previous:
+            log.info(f'Creating target directory {target_dir}')
+            target_path.mkdir()
+        build(
+            engines,
+            source_dir,
+            target_path,
+            previous,
+            exclude,
+            copy_strategy,
+            copy_workers,
+            compressor,
+            fingerprint_assets,
+        )
+        return
+
+    with get_profiler().phase('stage'):
+        build_path = staging.prepare_staging(target_path, seed=previous is not None)
+    log.info(f'Building in {build_path}')
+    try:
+        build(
+            engines,
+            source_dir,
+            build_path,
+            previous,
+            exclude,
+            copy_strategy,
+            copy_workers,
+            compressor,
+            fingerprint_assets,
+        )
+    except BaseException:
+        log.error(f'The build failed; leaving the previous build in {target_dir} in place.')
+        staging.discard_staging(target_path)
+        raise
+    with get_profiler().phase('swap'):
+        staging.publish_build(build_path, target_path, keep_builds=keep_builds)
+    log.info(f'Moved the new build into {target_dir}')
+
 
-    log.info(f'Creating target directory {target_dir}')
-    target_path.mkdir()
+def build(
+    engines: list[RenderEngine],
+    source_dir: str,
+    target_path: Path,
+    previous: BuildManifest | None,
+    exclude: list[str] | None,
+    copy_strategy: str,
+    copy_workers: int,
+    compressor: Compressor | None = None,
+    fingerprint_assets: list[str] | None = None,
+) -> None:
+    """
+    Renders the source files into a prepared target directory and writes its build manifest. See
+    :py:func:`render` for the meaning of the arguments.
 
+    :param previous: The manifest of the build already in the target directory when building
+        incrementally, otherwise None.
+    :type previous: BuildManifest | None
+
+    :param compressor: Writes compressed copies of the finished build's files. When None, nothing is
+        compressed.
+    :type compressor: Compressor, optional
+
+    :param fingerprint_assets: Extensions of the files to fingerprint. When empty or None, nothing
+        is fingerprinted.
+    :type fingerprint_assets: list[str], optional
+    """
+
+    target_dir = str(target_path)
+    profiler = get_profiler()
     log.debug(f'Rendering the contents of {source_dir} into {target_dir}')
     ms_path.validate_dir(source_dir)
-    source_files = ms_path.get_all_paths(source_dir=source_dir)
+    # Record the state of the sources as they are found, then work out what has to be done. The
+    # manifest's records double as the list of source files, so it is not held twice.
+    manifest = BuildManifest()
+    with profiler.phase('scan'):
+        paths = ms_path.iter_paths(source_dir, exclude=exclude)
+        manifest.scan(source_dir, paths, previous=previous)
+    source_files = manifest.files.keys()
+
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug('Found the following files:')
+        for file in source_files:
+            log.debug(file)
+    with profiler.phase('assets'):
+        assets = build_asset_map(engines, source_files, manifest, fingerprint_assets)
+    engines_by_name = {engine.name: engine for engine in engines}
+    manifest.engines = {
+        engine.name: {'fingerprint': engine.fingerprint(), 'outputs': []} for engine in engines
+    }
+    with profiler.phase('claim'):
+        claims, unclaimed = claim_paths(engines, source_files)
+        check_outputs(engines, claims, unclaimed, manifest)
+    with profiler.phase('prepare'):
+        for engine in engines:
+            engine.prepare(source_dir, claims[engine.name], manifest)
 
-    log.debug('Found the following files:')
-    for file in source_files:
-        log.debug(str(file))
+    dirty_paths = None
+    if previous:
+        if set(previous.engines) == set(engines_by_name):
+            dirty_paths = previous.dirty_paths(manifest, engines_by_name, target_path)
+            log.info(f'{len(dirty_paths)} of {len(source_files)} files have changed.')
+        else:
+            log.info('The set of rendering engines has changed. Rendering everything.')
 
-    rendered_paths = []
+    copier = FileCopier(strategy=copy_strategy, workers=copy_workers)
     for engine in engines:
-        rendered_paths.extend(
-            engine.render(source_dir=source_dir, target_dir=target_dir, paths=source_files)
+        engine.copier = copier
+
+    def copy_unrendered(paths: list[str]) -> None:
+        for path in paths:
+            if dirty_paths is not None and path not in dirty_paths:
+                continue
+            log.info(f'Copying unrendered file {path}')
+            copier.submit(
+                Path(source_dir) / path,
+                target_path / manifest.files[path]['outputs'][0],
+                source_hash=manifest.files[path]['hash'],
+            )
+
+    try:
+        # Files no engine claimed can be copied while the engines are still rendering
+        with profiler.phase('copy_assets'):
+            copy_unrendered(unclaimed)
+
+        rendered_paths = run_engines(engines, claims, source_dir, target_dir, dirty_paths, manifest)
+        for engine in engines:
+            manifest.engines[engine.name]['outputs'] = engine.static_outputs()
+        check_outputs(engines, claims, unclaimed, manifest)
+
+        # Claimed files an engine chose not to render are copied as they are
+        copy_unrendered(
+            [path for paths in claims.values() for path in paths if path not in rendered_paths]
+        )
+    except BaseException:
+        copier.cancel()
+        raise
+    finally:
+        for engine in engines:
+            engine.copier = None
+            engine.assets = None
+    with profiler.phase('copy_wait'):
+        copied, skipped = copier.wait()
+    log.debug(f'Copied {copied} files; {skipped} were already up to date.')
+
+    if compressor:
+        with profiler.phase('compress'):
+            manifest.variants = compressor.compress_build(
+                target_path,
+                sorted(manifest.output_paths()),
+                previous=previous.variants if previous else {},
+            )
+        log.debug(f'Compressed copies cover {len(manifest.variants)} files.')
+
+    asset_manifest = target_path / ASSET_MANIFEST_FILENAME
+    if assets:
+        assets.save(target_path)
+    elif ASSET_MANIFEST_FILENAME not in manifest.output_paths():
+        asset_manifest.unlink(missing_ok=True)
+
+    # Clean up after files which were deleted or renamed since the last build
+    if previous:
+        for path in sorted(previous.stale_outputs(manifest)):
+            log.info(f'Removing stale output {path}')
+            remove_output(target_path, path)
+
+    manifest.save(target_path)
+
+
+def build_asset_map(
+    engines: list[RenderEngine],
+    source_files: Collection[str],
+    manifest: BuildManifest,
+    extensions: list[str] | None,
+) -> AssetMap | None:
+    """
+    Builds the map of fingerprinted assets for a build and hands it to each engine. Source files
+    which are copied into the build are fingerprinted using the content hashes already recorded in
+    the build manifest, and their outputs in the manifest are updated to match.
+
+    :param extensions: Extensions of the files to fingerprint.
+    :type extensions: list[str] | None
+
+    :raises ValueError: When the source content contains a file named like the asset manifest.
+
+    :return: The asset map, or None if nothing is to be fingerprinted.
+    :rtype: AssetMap | None
+    """
+
+    if not extensions:
+        return None
+    if ASSET_MANIFEST_FILENAME in source_files:
+        raise ValueError(
+            f'The asset manifest ({ASSET_MANIFEST_FILENAME}) conflicts with a filename in the '
+            'source content.'
         )
-    # Remove duplicates from the list
-    rendered_paths = set(rendered_paths)
 
-    # Determine what was not affected
-    missed_paths = [path for path in source_files if path not in rendered_paths]
+    assets = AssetMap(extensions)
+    for path in source_files:
+        if assets.wants(path):
+            manifest.files[path]['outputs'] = [assets.add(path, manifest.files[path]['hash'])]
+    for engine in engines:
+        engine.assets = assets
+        engine.register_assets(assets)
+    log.debug(f'Fingerprinted {len(assets.paths)} assets.')
+    return assets
+
+
+def claim_paths(
+    engines: list[RenderEngine], source_files: Collection[str]
+) -> tuple[dict[str, list[str]], list[str]]:
+    """
+    Works out which engine owns each source file.
+
+    :param engines: The build's rendering engines.
+    :type engines: list[RenderEngine]
+
+    :param source_files: Every source path in the build.
+    :type source_files: Collection[str]
+
+    :raises ValueError: When more than one engine claims the same file.
+
+    :return: Tuple of a dict mapping each engine's name to the list of paths it claimed, and a list
+        of the paths no engine claimed.
+    :rtype: tuple[dict[str, list[str]], list[str]]
+    """
+
+    claims = {engine.name: [] for engine in engines}
+    unclaimed = []
+    for path in source_files:
+        owners = [engine.name for engine in engines if engine.claims(path)]
+        if len(owners) > 1:
+            raise ValueError(
+                f'The source file {path} is claimed by more than one rendering engine: '
+                f'{", ".join(owners)}. Exclude it, or configure the engines so only one claims it.'
+            )
+        if owners:
+            claims[owners[0]].append(path)
+        else:
+            unclaimed.append(path)
+    log.debug(
+        'Claimed files: '
+        + ', '.join(f'{name}: {len(paths)}' for name, paths in claims.items())
+        + f'; unclaimed: {len(unclaimed)}'
+    )
+    return claims, unclaimed
+
+
+def check_outputs(
+    engines: list[RenderEngine],
+    claims: dict[str, list[str]],
+    unclaimed: list[str],
+    manifest: BuildManifest,
+) -> None:
+    """
+    Makes sure that no two source files or engines would write the same file in the build, as when
+    both ``page.md`` and ``page.html`` exist in the source content, or when an engine's stylesheet
+    has the same name as a source file.
+
+    :raises ValueError: When two writers of the same file are found.
+    """
+
+    writers = {}
+
+    def add(output: str, writer: str) -> None:
+        if writers.setdefault(output, writer) != writer:
+            raise ValueError(
+                f'Both {writers[output]} and {writer} would be written to {output} in the build. '
+                'Rename one of them, or exclude it from the site.'
+            )
+
+    engines_by_name = {engine.name: engine for engine in engines}
+    for name, paths in claims.items():
+        for path in paths:
+            for output in engines_by_name[name].output_paths(path):
+                add(output, f'the source file {path}')
+    for path in unclaimed:
+        for output in manifest.files[path]['outputs']:
+            add(output, f'the source file {path}')
+    for engine in engines:
+        for output in engine.static_outputs():
+            add(output, f'the {engine.name} rendering engine')
+
+
+def run_engines(
+    engines: list[RenderEngine],
+    claims: dict[str, list[str]],
+    source_dir: str,
+    target_dir: str,
+    dirty_paths: set[str] | None,
+    manifest: BuildManifest,
+) -> set[str]:
+    """
+    Runs the rendering engines over the files they claimed, recording what each one rendered in the
+    build manifest. When there is more than one engine, they all run at once on separate threads.
+    Engines which render with worker processes keep those busy while the others work.
+
+    :param claims: Dict mapping each engine's name to the paths it claimed. See
+        :py:func:`claim_paths`.
+    :type claims: dict[str, list[str]]
+
+    :raises ValueError: When an engine reports rendering a path it did not claim.
+
+    :return: Set of source paths handled by any engine.
+    :rtype: set[str]
+    """
+
+    def run(engine: RenderEngine) -> list[str]:
+        with get_profiler().phase(f'engine:{engine.name}'):
+            return engine.render(
+                source_dir=source_dir,
+                target_dir=target_dir,
+                paths=claims[engine.name],
+                dirty_paths=dirty_paths,
+            )
+
+    if len(engines) > 1:
+        with ThreadPoolExecutor(max_workers=len(engines), thread_name_prefix='engine') as pool:
+            results = list(pool.map(run, engines))
+    else:
+        results = [run(engine) for engine in engines]
+
+    rendered_paths = set()
+    for engine, engine_paths in zip(engines, results):
+        unexpected = set(engine_paths) - set(claims[engine.name])
+        if unexpected:
+            raise ValueError(
+                f'The {engine.name} rendering engine rendered {sorted(unexpected)[0]}, which it '
+                'did not claim.'
+            )
+        rendered_paths.update(engine_paths)
+        for path in engine_paths:
+            if dirty_paths is None or path in dirty_paths:
+                manifest.files[path].update(
+                    {
+                        'engine': engine.name,
+                        'meta': engine.page_fingerprint(path),
+                        'deps': {
+                            dep: manifest.hash_dependency(dep) for dep in engine.dependencies(path)
+                        },
+                        'outputs': engine.output_paths(path),
+                    }
+                )
+    return rendered_paths
+
+
+def remove_output(target_dir: Path, path: str) -> None:
+    """
+    Removes a file from the target directory, along with any directories left empty by its removal.
+
+    :param target_dir: The top level directory of the build.
+    :type target_dir: Path
+
+    :param path: Path of the file to remove, relative to ``target_dir``.
+    :type path: str
+    """
 
-    for path in missed_paths:
-        log.info(f'Copying unrendered file {path}')
-        shutil.copy(f'{source_dir}/{path}', f'{target_dir}/{path}')
+    output = target_dir / path
+    output.unlink(missing_ok=True)
+    parent = output.parent
+    while parent != target_dir and parent.is_dir() and not any(parent.iterdir()):
+        parent.rmdir()
+        parent = parent.parent
@@ -0,0 +1,183 @@
+"""
+Module for giving assets like stylesheets and images fingerprinted filenames, which change whenever
+their contents do, so that browsers and CDNs can cache them indefinitely.
+"""
+
+import json
+import logging
+import posixpath
+
+from pathlib import Path
+from urllib.parse import quote, unquote, urlsplit, urlunsplit
+
+log = logging.getLogger(__name__)
+
+ASSET_MANIFEST_FILENAME = 'asset-manifest.json'
+
+# Number of hex digits of an asset's content hash to put in its filename
+FINGERPRINT_LENGTH = 10
+
+
+def fingerprinted_path(path: str, digest: str) -> str:
+    """
+    Returns a path with part of a content hash inserted before the file extension, so that
+    ``img/logo.svg`` becomes ``img/logo.0123456789.svg``.
+
+    :param path: Path relative to the target directory.
+    :type path: str
+
+    :param digest: Hexadecimal content hash of the file.
+    :type digest: str
+
+    :return: The fingerprinted path.
+    :rtype: str
+    """
+
+    directory, _, name = path.rpartition('/')
+    stem, dot, extension = name.rpartition('.')
+    if dot and stem:
+        name = f'{stem}.{digest[:FINGERPRINT_LENGTH]}.{extension}'
+    else:
+        name = f'{name}.{digest[:FINGERPRINT_LENGTH]}'
+    return f'{directory}/{name}' if directory else name
+
+
+class AssetMap:
+    """
+    Maps the paths of assets in a site to their fingerprinted paths. The map is built before any
+    pages are rendered, so that every reference to an asset can be rewritten as the page is
+    produced.
+
+    :param extensions: File extensions (like ``css`` or ``png``) of the assets to fingerprint.
+    :type extensions: list[str]
+    """
+
+    def __init__(self, extensions: list[str]):
+        self.extensions = sorted({extension.lower().lstrip('.') for extension in extensions})
+        self.paths = {}
+
+    def wants(self, path: str) -> bool:
+        """
+        Determines whether a file should be fingerprinted, based on its extension.
+
+        :param path: Path relative to the target directory.
+        :type path: str
+
+        :return: True if the file should be fingerprinted.
+        :rtype: bool
+        """
+
+        return path.rpartition('.')[2].lower() in self.extensions
+
+    def add(self, path: str, digest: str) -> str:
+        """
+        Adds an asset to the map.
+
+        :param path: Path of the asset relative to the target directory.
+        :type path: str
+
+        :param digest: Hexadecimal content hash of the asset.
+        :type digest: str
+
+        :return: The asset's fingerprinted path.
+        :rtype: str
+        """
+
+        self.paths[path] = fingerprinted_path(path, digest)
+        return self.paths[path]
+
+    def get(self, path: str) -> str:
+        """
+        Returns the path an asset is written to: its fingerprinted path if it has one, or else the
+        path unchanged.
+
+        :param path: Path relative to the target directory.
+        :type path: str
+
+        :return: Path relative to the target directory.
+        :rtype: str
+        """
+
+        return self.paths.get(path, path)
+
+    def resolve(self, url: str, page: str) -> str | None:
+        """
+        Works out which asset in the map a URL found on a page refers to.
+
+        :param url: The URL, which may be relative to the page.
+        :type url: str
+
+        :param page: Path of the page relative to the target directory.
+        :type page: str
+
+        :return: Path of the asset relative to the target directory, or None if the URL does not
+            refer to an asset in the map.
+        :rtype: str | None
+        """
+
+        parts = urlsplit(url)
+        if parts.scheme or parts.netloc or not parts.path:
+            return None
+        path = unquote(parts.path)
+        if path.startswith('/'):
+            path = path.lstrip('/')
+        else:
+            path = posixpath.normpath(posixpath.join(posixpath.dirname(page), path))
+        return path if path in self.paths else None
+
+    def url(self, path: str, page: str) -> str:
+        """
+        Returns a URL, relative to a page, pointing to the file an asset is written to.
+
+        :param path: Path of the asset relative to the target directory.
+        :type path: str
+
+        :param page: Path of the page relative to the target directory.
+        :type page: str
+
+        :return: The relative URL.
+        :rtype: str
+        """
+
+        return quote(posixpath.relpath(self.get(path), posixpath.dirname(page) or '.'))
+
+    def rewrite_url(self, url: str, page: str) -> str:
+        """
+        Rewrites a URL found on a page to point to the fingerprinted asset it refers to. Any
+        ``?query`` or ``#fragment`` is kept. URLs which do not refer to an asset in the map are
+        returned unchanged.
+
+        :param url: The URL, which may be relative to the page.
+        :type url: str
+
+        :param page: Path of the page relative to the target directory.
+        :type page: str
+
+        :return: The rewritten URL.
+        :rtype: str
+        """
+
+        asset = self.resolve(url, page)
+        if asset is None:
+            return url
+        parts = urlsplit(url)
+        if parts.path.startswith('/'):
+            new_path = f'/{quote(self.get(asset))}'
+        else:
+            new_path = self.url(asset, page)
+        return urlunsplit(parts._replace(path=new_path))
+
+    def save(self, target_dir: str | Path) -> None:
+        """
+        Writes the map into the target directory as a JSON object of asset paths to their
+        fingerprinted paths, for use by other tools such as deployment scripts.
+
+        :param target_dir: The top level directory of the build.
+        :type target_dir: str | Path
+        """
+
+        manifest_file = Path(target_dir) / ASSET_MANIFEST_FILENAME
+        log.debug(f'Writing asset manifest {manifest_file}')
+        manifest_file.unlink(missing_ok=True)
+        with manifest_file.open('w') as file:
+            json.dump(self.paths, file, indent=2, sort_keys=True)
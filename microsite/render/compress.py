@@ -0,0 +1,261 @@
+"""
+Module for writing precompressed copies of a build's files, so that web servers can send compressed
+files to browsers which accept them without compressing anything on the fly.
+"""
+
+import gzip
+import hashlib
+import logging
+import os
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from microsite.filecopy import copy_file
+from pathlib import Path
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+log = logging.getLogger(__name__)
+
+# Supported encodings, mapped to the file extension added to their compressed copies
+ENCODINGS = {'gzip': '.gz', 'br': '.br'}
+
+# Extensions of text-based file types which are worth compressing; images, fonts, archives and
+# other binary formats are already compressed
+COMPRESSIBLE_EXTENSIONS = {
+    '.atom',
+    '.css',
+    '.csv',
+    '.htm',
+    '.html',
+    '.ico',
+    '.js',
+    '.json',
+    '.map',
+    '.md',
+    '.mjs',
+    '.rss',
+    '.svg',
+    '.txt',
+    '.wasm',
+    '.webmanifest',
+    '.xml',
+}
+
+
+def compress_data(data: bytes, encoding: str) -> bytes:
+    """
+    Compresses data at the highest level the encoding supports. The output only depends on the
+    input, so compressing the same file twice produces the same bytes.
+
+    :param data: The data to compress.
+    :type data: bytes
+
+    :param encoding: One of the keys of ``ENCODINGS``.
+    :type encoding: str
+
+    :return: The compressed data.
+    :rtype: bytes
+    """
+
+    if encoding == 'br':
+        return brotli.compress(data, quality=11)
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+class Compressor:
+    """
+    Writes a compressed copy of each compressible file in a build next to the original, as
+    ``page.html.gz`` and ``page.html.br`` for example. Files smaller than ``min_size`` are left
+    alone, as are compressed copies which turn out no smaller than the original.
+
+    Compressed copies are reused wherever possible. A file whose size and modification time have not
+    changed since the last build, or whose contents have not changed, keeps its existing copies.
+    When a cache directory is given, every compressed copy is also kept there under the hash of the
+    original's contents, so that even a full rebuild only compresses files with new contents.
+
+    Compression happens on a pool of threads. Both ``zlib`` and ``brotli`` release Python's global
+    interpreter lock while they work, so the threads can keep several processor cores busy.
+
+    :param encodings: Encodings to produce copies in. Each must be a key of ``ENCODINGS``. Brotli
+        requires the optional ``brotli`` package; without it, ``br`` is skipped with a warning.
+    :type encodings: list[str]
+
+    :param min_size: Size in bytes below which files are not compressed. Defaults to 1024.
+    :type min_size: int, optional
+
+    :param workers: Number of files to compress at once. Defaults to 4.
+    :type workers: int, optional
+
+    :param cache_dir: Directory to keep compressed copies in between builds. When None, nothing is
+        cached. Defaults to None.
+    :type cache_dir: str | Path, optional
+
+    :raises ValueError: When an encoding is not recognized.
+    """
+
+    def __init__(
+        self,
+        encodings: list[str],
+        min_size: int = 1024,
+        workers: int = 4,
+        cache_dir: str | Path = None,
+    ):
+        unknown = [encoding for encoding in encodings if encoding not in ENCODINGS]
+        if unknown:
+            raise ValueError(
+                f'Unknown compression encoding "{unknown[0]}". Choose from: {", ".join(ENCODINGS)}'
+            )
+        if 'br' in encodings and brotli is None:
+            log.warning('The brotli package is not installed, so no .br files will be written.')
+            encodings = [encoding for encoding in encodings if encoding != 'br']
+
+        self.encodings = list(encodings)
+        self.min_size = min_size
+        self.workers = max(workers, 1)
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+
+    @property
+    def settings(self) -> list:
+        """
+        The settings which affect which compressed copies are produced, as recorded in the build
+        manifest.
+        """
+
+        return [self.encodings, self.min_size]
+
+    def is_compressible(self, path: str) -> bool:
+        return Path(path).suffix.lower() in COMPRESSIBLE_EXTENSIONS
+
+    def compress_build(self, target_dir: str | Path, paths: list[str], previous: dict) -> dict:
+        """
+        Writes compressed copies of the compressible files among ``paths``.
+
+        :param target_dir: The top level directory of the build.
+        :type target_dir: str | Path
+
+        :param paths: Paths of every file in the build, relative to ``target_dir``.
+        :type paths: list[str]
+
+        :param previous: The ``variants`` recorded in the previous build's manifest.
+        :type previous: dict
+
+        :return: Dict of the paths which were considered for compression, mapped to records of their
+            size, modification time, content hash, the settings used, and the compressed copies
+            they have. See :py:class:`microsite.render.manifest.BuildManifest`.
+        :rtype: dict
+        """
+
+        target_dir = Path(target_dir)
+        taken = set(paths)
+        candidates = []
+        for path in paths:
+            if not self.is_compressible(path):
+                continue
+            variants = [f'{path}{ENCODINGS[encoding]}' for encoding in self.encodings]
+            clashes = [variant for variant in variants if variant in taken]
+            if clashes:
+                log.warning(f'Not compressing {path}, since the site already contains {clashes[0]}')
+                continue
+            candidates.append(path)
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='compress') as pool:
+            records = pool.map(
+                lambda path: self.compress_file(target_dir, path, previous.get(path)), candidates
+            )
+            return dict(zip(candidates, records))
+
+    def compress_file(self, target_dir: Path, path: str, previous: dict = None) -> dict:
+        """
+        Writes the compressed copies of a single file, reusing existing ones where possible.
+
+        :param target_dir: The top level directory of the build.
+        :type target_dir: Path
+
+        :param path: Path of the file relative to ``target_dir``.
+        :type path: str
+
+        :param previous: The file's record from the previous build's manifest, if any.
+        :type previous: dict, optional
+
+        :return: The file's record for the current build's manifest.
+        :rtype: dict
+        """
+
+        source = target_dir / path
+        stat = source.stat()
+        record = {
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'hash': None,
+            'settings': self.settings,
+            'variants': [],
+        }
+        reusable = (
+            previous is not None
+            and previous['settings'] == self.settings
+            and all((target_dir / variant).is_file() for variant in previous['variants'])
+        )
+        if (
+            reusable
+            and previous['size'] == stat.st_size
+            and previous['mtime_ns'] == stat.st_mtime_ns
+        ):
+            return previous
+
+        if stat.st_size < self.min_size:
+            return record
+
+        data = source.read_bytes()
+        record['hash'] = hashlib.sha256(data).hexdigest()
+        if reusable and previous['hash'] == record['hash']:
+            record['variants'] = previous['variants']
+            return record
+
+        for encoding in self.encodings:
+            variant = f'{path}{ENCODINGS[encoding]}'
+            if self.write_variant(data, record['hash'], encoding, target_dir / variant):
+                record['variants'].append(variant)
+            else:
+                log.debug(f'Skipping {variant}, since it would be no smaller than {path}')
+        return record
+
+    def write_variant(self, data: bytes, digest: str, encoding: str, target: Path) -> bool:
+        """
+        Writes one compressed copy of a file, taking it from the cache if it is there.
+
+        :return: True if the copy was written, False if compressing the file did not make it any
+            smaller.
+        :rtype: bool
+        """
+
+        cached = None
+        if self.cache_dir:
+            cached = self.cache_dir / digest[:2] / f'{digest}{ENCODINGS[encoding]}'
+            if cached.is_file():
+                log.debug(f'Reusing {cached} for {target}')
+                copy_file(cached, target, strategy='hardlink', skip_unchanged=False)
+                return True
+
+        compressed = compress_data(data, encoding)
+        if len(compressed) >= len(data):
+            return False
+
+        log.debug(f'Writing {target}')
+        if cached:
+            # Write the cache entry under a temporary name first, so that an interrupted build
+            # never leaves a truncated entry behind
+            cached.parent.mkdir(parents=True, exist_ok=True)
+            partial = cached.with_name(
+                f'{cached.name}.{os.getpid()}.{threading.get_native_id()}.tmp'
+            )
+            partial.write_bytes(compressed)
+            partial.replace(cached)
+            copy_file(cached, target, strategy='hardlink', skip_unchanged=False)
+        else:
+            target.unlink(missing_ok=True)
+            target.write_bytes(compressed)
+        return True
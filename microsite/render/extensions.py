@@ -0,0 +1,195 @@
+"""
+Extensions to the Python-Markdown library used by the Markdown rendering engine.
+"""
+
+import logging
+import re
+import xml.etree.ElementTree as etree
+
+from collections.abc import Callable
+from markdown import Markdown
+from markdown.extensions import Extension
+from markdown.treeprocessors import Treeprocessor
+from microsite.render.assets import AssetMap
+from urllib.parse import urlsplit, urlunsplit
+
+log = logging.getLogger(__name__)
+
+# Attributes holding URLs which may point to files within the site, by the tag they belong to
+URL_ATTRIBUTES = {
+    'a': ('href',),
+    'audio': ('src',),
+    'embed': ('src',),
+    'iframe': ('src',),
+    'img': ('src',),
+    'link': ('href',),
+    'script': ('src',),
+    'source': ('src',),
+    'track': ('src',),
+    'video': ('src', 'poster'),
+}
+
+# Matches a start tag in raw HTML which may hold URLs, capturing the tag name
+RAW_TAG_PATTERN = re.compile(
+    rf'<({"|".join(URL_ATTRIBUTES)})\b(?:"[^"]*"|\'[^\']*\'|[^\'">])*>', re.IGNORECASE
+)
+
+# Matches an attribute within a start tag, capturing everything before the value, the attribute's
+# name, and the value along with any quotes around it
+RAW_ATTRIBUTE_PATTERN = re.compile(r'(\s([^\s"\'>/=]+)\s*=\s*)("[^"]*"|\'[^\']*\'|[^\s"\'>]+)')
+
+
+def rewrite_md_url(url: str) -> str:
+    """
+    Returns a URL pointing to a ``*.md`` file within the site with the extension changed to
+    ``*.html``. Any ``?query`` or ``#fragment`` is preserved. URLs with a scheme or host (like
+    ``https://example.com/README.md``) point outside of the site and are returned unchanged, as are
+    URLs which do not point to a ``*.md`` file.
+
+    :param url: The URL to rewrite.
+    :type url: str
+
+    :return: The rewritten URL.
+    :rtype: str
+    """
+
+    parts = urlsplit(url)
+    if parts.scheme or parts.netloc or not parts.path.endswith('.md'):
+        return url
+    return urlunsplit(parts._replace(path=f'{parts.path[:-3]}.html'))
+
+
+def rewrite_tag_urls(match: re.Match, rewrite_url: Callable[[str, str], str]) -> str:
+    """
+    Rewrites the URLs held by a start tag in raw HTML.
+
+    :param match: The start tag, as matched by ``RAW_TAG_PATTERN``.
+    :type match: re.Match
+
+    :param rewrite_url: Function given the tag's name and each of its URLs, which returns the URL
+        to use in its place.
+    :type rewrite_url: Callable[[str, str], str]
+
+    :return: The start tag with its URLs rewritten.
+    :rtype: str
+    """
+
+    tag = match.group(1).lower()
+
+    def rewrite_attribute(attribute: re.Match) -> str:
+        prefix, name, value = attribute.groups()
+        if name.lower() not in URL_ATTRIBUTES[tag]:
+            return attribute.group()
+        quote = value[0] if value[0] in '"\'' else ''
+        url = value[1:-1] if quote else value
+        return f'{prefix}{quote}{rewrite_url(tag, url)}{quote}'
+
+    return RAW_ATTRIBUTE_PATTERN.sub(rewrite_attribute, match.group())
+
+
+def rewrite_md_links(html: str) -> str:
+    """
+    Rewrites the ``href`` of every link to a ``*.md`` file in a piece of raw HTML, as
+    :py:func:`rewrite_md_url` does.
+
+    :param html: The HTML.
+    :type html: str
+
+    :return: The HTML with its links rewritten.
+    :rtype: str
+    """
+
+    def rewrite_url(tag: str, url: str) -> str:
+        return rewrite_md_url(url) if tag == 'a' else url
+
+    return RAW_TAG_PATTERN.sub(lambda match: rewrite_tag_urls(match, rewrite_url), html)
+
+
+class RewriteUrlsTreeprocessor(Treeprocessor):
+    """
+    Rewrites the URLs in a converted document in a single pass over its elements. Depending on how
+    its :py:class:`RewriteUrlsExtension` is configured, this:
+
+    - Rewrites the ``href`` of every link to a ``*.md`` file so that it points to the ``*.html``
+      file that Markdown file is rendered into.
+    - Rewrites every reference to an asset in an :py:class:`microsite.render.assets.AssetMap` (such
+      as ``<img src>`` or ``<link href>``) to point to the asset's fingerprinted file.
+
+    This covers elements written in Markdown as well as tags written as raw HTML inside the
+    document.
+    """
+
+    def __init__(self, md: Markdown, extension: 'RewriteUrlsExtension'):
+        super().__init__(md)
+        self.extension = extension
+
+    def run(self, root: etree.Element) -> None:
+        self.rewrite_element(root)
+
+        # Raw HTML is held aside until the document is serialized; rewrite it in place
+        stash = self.md.htmlStash.rawHtmlBlocks
+        for i, block in enumerate(stash):
+            if isinstance(block, str):
+                stash[i] = RAW_TAG_PATTERN.sub(self.rewrite_tag, block)
+            else:
+                self.rewrite_element(block)
+
+    def rewrite_element(self, element: etree.Element) -> None:
+        for child in element.iter():
+            for attribute in URL_ATTRIBUTES.get(child.tag, ()):
+                url = child.get(attribute)
+                if url:
+                    new_url = self.rewrite_url(child.tag, url)
+                    if new_url != url:
+                        child.set(attribute, new_url)
+
+    def rewrite_tag(self, match: re.Match) -> str:
+        return rewrite_tag_urls(match, self.rewrite_url)
+
+    def rewrite_url(self, tag: str, url: str) -> str:
+        new_url = url
+        if self.extension.md_links and tag == 'a':
+            new_url = rewrite_md_url(new_url)
+        assets = self.extension.assets
+        if assets:
+            asset = assets.resolve(new_url, self.extension.page)
+            if asset:
+                self.extension.referenced.add(asset)
+                new_url = assets.rewrite_url(new_url, self.extension.page)
+        if new_url != url:
+            log.debug(f'Rewriting {url} as {new_url}')
+        return new_url
+
+
+class RewriteUrlsExtension(Extension):
+    """
+    Markdown extension which rewrites URLs as part of the conversion, so the output never needs to
+    be parsed again to fix them up. See :py:class:`RewriteUrlsTreeprocessor`.
+
+    Asset URLs relative to the page are resolved against the path set in ``page`` before each
+    conversion. The assets a page refers to are collected in ``referenced``, which is emptied along
+    with the converter by ``Markdown.reset()``.
+
+    :param md_links: When True, rewrite links to ``*.md`` files into links to ``*.html`` files.
+        Defaults to True.
+    :type md_links: bool, optional
+
+    :param assets: Map of assets to rewrite references to. When None, asset URLs are left alone.
+        Defaults to None.
+    :type assets: microsite.render.assets.AssetMap, optional
+    """
+
+    def __init__(self, md_links: bool = True, assets: AssetMap = None):
+        super().__init__()
+        self.md_links = md_links
+        self.assets = assets
+        self.page = ''
+        self.referenced = set()
+
+    def extendMarkdown(self, md: Markdown) -> None:
+        md.registerExtension(self)
+        # Run after inline processing so that links produced by inline patterns exist
+        md.treeprocessors.register(RewriteUrlsTreeprocessor(md, self), 'rewrite_urls', 1)
+
+    def reset(self) -> None:
+        self.referenced = set()
@@ -0,0 +1,291 @@
+"""
+Module for tracking what a previous build produced so that later builds can render incrementally.
+"""
+
+import json
+import logging
+import os
+
+from collections.abc import Iterable
+from microsite.util import hash_file
+from pathlib import Path
+
+log = logging.getLogger(__name__)
+
+MANIFEST_FILENAME = '.microsite-manifest.json'
+MANIFEST_VERSION = 1
+
+
+class BuildManifest:
+    """
+    A record of the inputs and outputs of a single build. The manifest is stored in the target
+    directory and compared against the current state of the source directory during the next build
+    to determine which files actually need to be processed again.
+
+    :param files: Dict where the keys are source paths relative to the source directory and the
+        values are dicts with the following keys:
+
+        - ``size``: Size of the source file in bytes.
+        - ``mtime_ns``: Modification time of the source file in nanoseconds.
+        - ``hash``: SHA-256 digest of the source file's contents.
+        - ``engine``: Name of the rendering engine which rendered the file, or None if the file was
+          copied as-is.
+        - ``meta``: Digest of any per-file settings (such as ``render.index`` entries) which affect
+          the file's output.
+        - ``deps``: Dict of other files (like templates) the output depends on, mapped to the
+          digests of their contents.
+        - ``outputs``: List of paths, relative to the target directory, produced from the file.
+    :type files: dict, optional
+
+    :param engines: Dict where the keys are rendering engine names and the values are dicts with
+        the following keys:
+
+        - ``fingerprint``: Digest of the engine's settings at build time.
+        - ``outputs``: List of paths, relative to the target directory, which the engine produced
+          independently of any one source file (such as a stylesheet).
+    :type engines: dict, optional
+
+    :param variants: Dict where the keys are compressible output paths relative to the target
+        directory and the values are dicts with the following keys:
+
+        - ``size``: Size of the output file in bytes.
+        - ``mtime_ns``: Modification time of the output file in nanoseconds.
+        - ``hash``: SHA-256 digest of the output file's contents, or None if it was too small to
+          compress.
+        - ``settings``: The compression settings in use when the variants were made.
+        - ``variants``: List of paths, relative to the target directory, of the compressed copies
+          of the output.
+    :type variants: dict, optional
+    """
+
+    def __init__(self, files: dict = None, engines: dict = None, variants: dict = None):
+        self.files = files if files is not None else {}
+        self.engines = engines if engines is not None else {}
+        self.variants = variants if variants is not None else {}
+        self._dependency_hashes = {}
+
+    @classmethod
+    def load(cls, target_dir: str | Path) -> 'BuildManifest | None':
+        """
+        Loads the manifest from a previous build out of the target directory.
+
+        :param target_dir: The directory a previous build was rendered into.
+        :type target_dir: str | Path
+
+        :return: The previous build's manifest, or None if there is no usable manifest.
+        :rtype: BuildManifest | None
+        """
+
+        manifest_file = Path(target_dir) / MANIFEST_FILENAME
+        if not manifest_file.is_file():
+            log.debug(f'No build manifest found at {manifest_file}')
+            return None
+
+        try:
+            with manifest_file.open('r') as file:
+                data = json.load(file)
+        except (OSError, ValueError) as ex:
+            log.warning(f'Ignoring unreadable build manifest {manifest_file}: {ex}')
+            return None
+
+        if data.get('version') != MANIFEST_VERSION:
+            log.info(f'Ignoring build manifest {manifest_file} from a different microsite version')
+            return None
+
+        return cls(
+            files=data.get('files', {}),
+            engines=data.get('engines', {}),
+            variants=data.get('variants', {}),
+        )
+
+    def save(self, target_dir: str | Path) -> None:
+        """
+        Writes this manifest into the target directory. Any existing manifest is removed first
+        rather than overwritten, since it may be hard linked into an earlier build.
+
+        :param target_dir: The directory this build was rendered into.
+        :type target_dir: str | Path
+        """
+
+        manifest_file = Path(target_dir) / MANIFEST_FILENAME
+        log.debug(f'Writing build manifest {manifest_file}')
+        manifest_file.unlink(missing_ok=True)
+        with manifest_file.open('w') as file:
+            json.dump(
+                {
+                    'version': MANIFEST_VERSION,
+                    'engines': self.engines,
+                    'files': self.files,
+                    'variants': self.variants,
+                },
+                file,
+                sort_keys=True,
+            )
+
+    def scan(self, source_dir: str | Path, paths: Iterable[str], previous: 'BuildManifest' = None):
+        """
+        Records the size, modification time, and content hash of each source file. When a previous
+        manifest is supplied and a file's size and modification time have not changed, the hash from
+        the previous build is reused instead of reading the file again.
+
+        :param source_dir: Top-level directory containing the source files.
+        :type source_dir: str | Path
+
+        :param paths: Source paths relative to ``source_dir``. These may be generated as the source
+            directory is walked.
+        :type paths: Iterable[str]
+
+        :param previous: The manifest of the previous build, if any.
+        :type previous: BuildManifest, optional
+        """
+
+        source_dir = Path(source_dir)
+        for path in paths:
+            stat = os.stat(source_dir / path)
+            old = previous.files.get(path) if previous else None
+            if old and old['size'] == stat.st_size and old['mtime_ns'] == stat.st_mtime_ns:
+                file_hash = old['hash']
+            else:
+                file_hash = hash_file(source_dir / path)
+            self.files[path] = {
+                'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns,
+                'hash': file_hash,
+                'engine': None,
+                'meta': None,
+                'deps': {},
+                'outputs': [path],
+            }
+
+    def set_dependency(self, name: str, digest: str) -> None:
+        """
+        Registers a virtual dependency: something other than a file which outputs can depend on,
+        such as the metadata of every page in the site. Engines list the name among a file's
+        dependencies like any other, and the file is rendered again whenever the digest changes.
+
+        :param name: Name of the dependency. It should not be mistakable for a file path.
+        :type name: str
+
+        :param digest: Digest of the dependency's current state.
+        :type digest: str
+        """
+
+        self._dependency_hashes[name] = digest
+
+    def hash_dependency(self, path: str | Path) -> str | None:
+        """
+        Returns the content hash of a file some output depends on, such as a template, or the digest
+        of a virtual dependency registered with :py:meth:`set_dependency`. Each dependency is only
+        hashed once per build.
+
+        :param path: Path to the dependency.
+        :type path: str | Path
+
+        :return: Hexadecimal SHA-256 digest of the file, or None if the file does not exist.
+        :rtype: str | None
+        """
+
+        path = str(path)
+        if path not in self._dependency_hashes:
+            self._dependency_hashes[path] = hash_file(path) if Path(path).is_file() else None
+        return self._dependency_hashes[path]
+
+    def dirty_paths(
+        self, current: 'BuildManifest', engines: dict, target_dir: str | Path = None
+    ) -> set[str]:
+        """
+        Compares this (previous) manifest against the manifest of the current build and returns the
+        source paths which must be processed again.
+
+        A path is dirty when it is new, when its content has changed, when the settings of the
+        engine which rendered it have changed, when its per-file settings have changed, when any
+        file it depends on has changed, when a copied file is to be written under a new name, or
+        when any of the outputs it produced last time is missing from the target directory.
+
+        :param current: The manifest being built for the current build. It must already have been
+            populated by :py:meth:`scan`.
+        :type current: BuildManifest
+
+        :param engines: Dict of the current build's rendering engines keyed by name.
+        :type engines: dict
+
+        :param target_dir: Directory holding the previous build's outputs. When None, outputs are
+            assumed to still be in place.
+        :type target_dir: str | Path, optional
+
+        :return: Set of source paths which need processing.
+        :rtype: set[str]
+        """
+
+        target_dir = Path(target_dir) if target_dir is not None else None
+        dirty = set()
+        for path, record in current.files.items():
+            old = self.files.get(path)
+            if not old or old['hash'] != record['hash']:
+                dirty.add(path)
+                continue
+
+            engine = engines.get(old['engine']) if old['engine'] else None
+            if old['engine'] and not engine:
+                dirty.add(path)
+                continue
+
+            if engine:
+                old_fingerprint = self.engines.get(engine.name, {}).get('fingerprint')
+                new_fingerprint = current.engines[engine.name]['fingerprint']
+                page_fingerprint = engine.page_fingerprint(path)
+                if old_fingerprint != new_fingerprint or old['meta'] != page_fingerprint:
+                    dirty.add(path)
+                    continue
+
+            if any(current.hash_dependency(dep) != digest for dep, digest in old['deps'].items()):
+                dirty.add(path)
+                continue
+
+            # A copied file must be copied again when it is to be written under a new name, as
+            # happens when assets start or stop being fingerprinted
+            if not old['engine'] and old['outputs'] != record['outputs']:
+                dirty.add(path)
+                continue
+
+            # An output removed from the target by hand must be written again
+            if target_dir and not all((target_dir / output).exists() for output in old['outputs']):
+                dirty.add(path)
+                continue
+
+            # Carry the clean file's record forward until the engines say otherwise
+            record.update({key: old[key] for key in ('engine', 'meta', 'deps', 'outputs')})
+
+        return dirty
+
+    def output_paths(self) -> set[str]:
+        """
+        Returns every path this build produced, including compressed variants.
+
+        :return: Set of paths relative to the target directory.
+        :rtype: set[str]
+        """
+
+        outputs = set()
+        for record in self.files.values():
+            outputs.update(record['outputs'])
+        for record in self.engines.values():
+            outputs.update(record['outputs'])
+        for record in self.variants.values():
+            outputs.update(record['variants'])
+        return outputs
+
+    def stale_outputs(self, current: 'BuildManifest') -> set[str]:
+        """
+        Returns the outputs of this (previous) manifest which the current build did not produce.
+        These belong to deleted or renamed source files, or to engine settings which have since
+        changed, and should be removed from the target directory.
+
+        :param current: The manifest of the completed current build.
+        :type current: BuildManifest
+
+        :return: Set of paths relative to the target directory.
+        :rtype: set[str]
+        """
+
+        return self.output_paths() - current.output_paths()
@@ -1,29 +1,481 @@
+import hashlib
 import jinja2
+import jinja2.meta
+import json
 import logging
-import shutil
+import tempfile
 
 from bs4 import BeautifulSoup
-from markdown import markdown
+from collections.abc import Iterator
+from markdown import Markdown
+from microsite.config import MarkdownEngineConfig
 from microsite.render import RenderEngine
-from microsite.util import AttrDict
+from microsite.profiling import get_profiler
+from microsite.render.assets import AssetMap
+from microsite.render.extensions import RewriteUrlsExtension, rewrite_md_links, rewrite_md_url
+from microsite.render.manifest import BuildManifest
+from microsite.render.metadata import MetadataStore, Pages, read_front_matter, split_front_matter
+from microsite.render.minify import HTMLMinifier, minify_css, minify_html
+from microsite.render.pool import iter_jobs
+from microsite.render.search import SearchIndex, index_document
+from microsite.util import hash_data
 from pathlib import Path
 
 log = logging.getLogger(__name__)
 
+SEARCH_CLIENT = Path(__file__).parent / 'scripts' / 'search.js'
+
+# Used when the project does not name a template or stylesheet of its own
+DEFAULT_HTML_TEMPLATE = Path(__file__).parent / 'templates' / 'markdown.html.j2'
+DEFAULT_STYLESHEET = Path(__file__).parent / 'styles' / 'plain-white.css'
+
+# Virtual dependency of every page whose template uses ``pages``, which changes whenever the
+# metadata of any page in the site does
+PAGES_DEPENDENCY = 'markdown:pages'
+
+
+class RewriteMdLinksLoader(jinja2.FileSystemLoader):
+    """
+    Loads templates from the file system with every link to a ``*.md`` file in them rewritten to
+    point to the ``*.html`` file, as links are in converted Markdown. Each template is rewritten as
+    it is loaded, so rendering pages with it costs nothing extra.
+    """
+
+    def get_source(self, environment: jinja2.Environment, template: str) -> tuple:
+        source, filename, uptodate = super().get_source(environment, template)
+        return rewrite_md_links(source), filename, uptodate
+
 
 class MarkdownRenderEngine(RenderEngine):
-    def __init__(self, config: AttrDict, index: dict = {}):
-        super().__init__(name='markdown', config=config, index=index)
+    """
+    Renders Markdown files into HTML pages. See :py:class:`microsite.render.RenderEngine` for the
+    common parameters, and :py:class:`microsite.config.MarkdownEngineConfig` for the settings.
 
-        # Convert template path string to proper Path
-        self.html_template = Path(
-            self.config.html_template or 'microsite/render/templates/markdown.html.j2'
+    :param metadata_file: File to keep the page metadata store in. Defaults to ``metadata.sqlite3``
+        in the engine's cache directory, or a temporary file when there is no cache directory. This
+        only needs to be passed in when building a copy of the engine for a worker process.
+    :type metadata_file: str, optional
+    """
+
+    config_schema = MarkdownEngineConfig
+
+    def __init__(
+        self,
+        config: MarkdownEngineConfig | dict,
+        index: dict = {},
+        workers: int = 1,
+        cache_dir: str = None,
+        assets: AssetMap = None,
+        metadata_file: str = None,
+    ):
+        super().__init__(
+            name='markdown',
+            config=config,
+            index=index,
+            workers=workers,
+            cache_dir=cache_dir,
+            assets=assets,
         )
 
+        # Convert template path string to proper Path
+        self.html_template = Path(self.config.html_template or DEFAULT_HTML_TEMPLATE)
+
         # Resolve any pathing complications like symlinks into "real" paths
         self.html_template = Path.resolve(self.html_template)
+        self.stylesheet = self.config.stylesheet or str(DEFAULT_STYLESHEET)
+
+        # The converter and template environment are built on first use, once per process
+        self._markdown = None
+        self._url_rewriter = None
+        self._environment = None
+        self._template_files = None
+
+        # Source directory and the assets each page refers to, as of the last build
+        self._source_dir = None
+        self._page_assets = {}
+
+        # The search index, and the files it was written to in the last build
+        self._search_index = None
+        self._search_files = []
+
+        # The page metadata store, opened on first use
+        self._metadata = None
+        self._metadata_file = metadata_file
+        self._metadata_dir = None
+
+    def worker_kwargs(self) -> dict:
+        """
+        Returns the keyword arguments needed to build a copy of this engine inside a worker process.
+
+        :return: Dict of arguments for this engine's constructor.
+        :rtype: dict
+        """
+
+        kwargs = super().worker_kwargs()
+        del kwargs['name']
+        kwargs['metadata_file'] = str(self.metadata.db_file)
+        return kwargs
+
+    @property
+    def metadata(self) -> MetadataStore:
+        """
+        The store of every page's metadata. See :py:class:`microsite.render.metadata.MetadataStore`.
+        """
+
+        if not self._metadata:
+            if not self._metadata_file:
+                if self.cache_dir:
+                    self._metadata_file = str(self.cache_dir / 'metadata.sqlite3')
+                else:
+                    # Worker processes need a file to read the store from
+                    self._metadata_dir = tempfile.TemporaryDirectory(prefix='microsite-metadata-')
+                    self._metadata_file = str(Path(self._metadata_dir.name) / 'metadata.sqlite3')
+            self._metadata = MetadataStore(self._metadata_file)
+        return self._metadata
+
+    def prepare(self, source_dir: str, paths: list[str], manifest: BuildManifest) -> None:
+        """
+        Brings the page metadata store up to date. Each page's metadata is its front matter, with
+        the settings from its ``render.index`` entry, if any, taking precedence. A file is only read
+        when the store does not already have front matter for its current contents. Registers the
+        virtual dependency on the metadata of the whole site, which pages whose template uses
+        ``pages`` depend on.
+
+        :param source_dir: Top-level directory containing the source files.
+        :type source_dir: str
+
+        :param paths: List of the Markdown files in the source directory.
+        :type paths: list[str]
+
+        :param manifest: The current build's manifest.
+        :type manifest: microsite.render.manifest.BuildManifest
+
+        :raises ValueError: When a page cannot be decoded as text, or its front matter cannot be
+            parsed.
+        """
+
+        store = self.metadata
+        read = 0
+        for path in paths:
+            file_hash = manifest.files[path]['hash']
+            front_matter = store.front_matter(path, file_hash)
+            if front_matter is None:
+                log.debug(f'Reading the front matter of {path}')
+                # Store and compare metadata as it will be read back, with dates and such as strings
+                front_matter = json.loads(
+                    json.dumps(read_front_matter(Path(source_dir) / path), default=str)
+                )
+                read += 1
+            store.update(
+                path,
+                file_hash,
+                front_matter,
+                self.output_paths(path)[0],
+                {**front_matter, **self.index_settings(path)},
+            )
+        store.retain(paths)
+        store.commit()
+        log.debug(f'Read the front matter of {read} of {len(paths)} pages.')
+        manifest.set_dependency(PAGES_DEPENDENCY, store.digest())
+
+    def index_settings(self, path: str) -> dict:
+        """
+        Returns the settings for a page from the project's ``render.index``.
+
+        :param path: Source path relative to the source directory.
+        :type path: str
+
+        :return: Dict of the page's settings, which is empty if it has no ``index`` entry.
+        :rtype: dict
+        """
+
+        entry = self.index.get(path)
+        return entry.as_dict() if entry else {}
+
+    def page_metadata(self, path: str) -> dict:
+        """
+        Returns a page's metadata: its front matter combined with its ``render.index`` entry.
+
+        :param path: Source path relative to the source directory.
+        :type path: str
+
+        :return: The page's metadata.
+        :rtype: dict
+        """
+
+        metadata = self.metadata.metadata(path)
+        if metadata is None:
+            # The page is not in the store when the engine is used outside of a build
+            metadata = self.index_settings(path)
+        return metadata
+
+    def page_fingerprint(self, path: str) -> str:
+        """
+        Returns a digest of the page's metadata, including its front matter.
+
+        :param path: Source path relative to the source directory.
+        :type path: str
+
+        :return: Hexadecimal digest.
+        :rtype: str
+        """
+
+        return hash_data(self.page_metadata(path))
+
+    @property
+    def markdown(self) -> Markdown:
+        """
+        The Markdown converter, configured with this engine's extensions. It is reset before each
+        conversion rather than rebuilt. When ``rewrite_md_urls`` is enabled or assets are being
+        fingerprinted, URLs are rewritten during the conversion by a
+        :py:class:`microsite.render.extensions.RewriteUrlsExtension`.
+        """
+
+        if not self._markdown:
+            extensions = list(self.config.extensions)
+            self._url_rewriter = None
+            if self.config.rewrite_md_urls or self.assets:
+                self._url_rewriter = RewriteUrlsExtension(
+                    md_links=self.config.rewrite_md_urls, assets=self.assets
+                )
+                extensions.append(self._url_rewriter)
+            self._markdown = Markdown(extensions=extensions)
+        return self._markdown
+
+    @property
+    def environment(self) -> jinja2.Environment:
+        """
+        The Jinja2 environment templates are loaded from. It lives as long as the engine does, so
+        each template is compiled at most once per build. When the engine has a cache directory,
+        compiled templates are also kept on disk between builds. Templates are checked for changes
+        each time they are loaded, so a long-lived engine still picks up edits.
+
+        When ``rewrite_md_urls`` is enabled, links to ``*.md`` files written in the templates are
+        rewritten as the templates are loaded (see :py:class:`RewriteMdLinksLoader`), and the
+        ``md_url`` filter rewrites URLs which templates build from variables, as in
+        ``{{ link | md_url }}``. Otherwise the filter leaves URLs alone.
+        """
+
+        if not self._environment:
+            bytecode_cache = None
+            if self.cache_dir:
+                bytecode_dir = self.cache_dir / 'jinja2'
+                bytecode_dir.mkdir(parents=True, exist_ok=True)
+                bytecode_cache = jinja2.FileSystemBytecodeCache(directory=str(bytecode_dir))
+            if self.config.rewrite_md_urls:
+                loader_class = RewriteMdLinksLoader
+                md_url = rewrite_md_url
+            else:
+                loader_class = jinja2.FileSystemLoader
+                md_url = str
+            self._environment = jinja2.Environment(
+                loader=loader_class(searchpath=str(self.html_template.parent)),
+                bytecode_cache=bytecode_cache,
+                auto_reload=True,
+            )
+            self._environment.filters['md_url'] = md_url
+        return self._environment
+
+    @property
+    def template(self) -> jinja2.Template:
+        """
+        The compiled Jinja2 template every page is rendered into.
+        """
+
+        return self.environment.get_template(self.html_template.name)
+
+    def template_files(self, template_name: str) -> list[str]:
+        """
+        Returns the paths of a template and every template it uses through ``extends``, ``include``,
+        ``import`` or ``from`` tags, recursively. If any template refers to another template by a
+        name which is only known at render time, every template the loader can find is returned,
+        since any of them might be used.
+
+        :param template_name: Name of the template, as given to the loader.
+        :type template_name: str
+
+        :return: Sorted list of paths to template files.
+        :rtype: list[str]
+        """
+
+        return self.scan_templates(template_name)[0]
+
+    def scan_templates(self, template_name: str) -> tuple[list[str], set[str]]:
+        """
+        Finds the template files a template uses, as :py:meth:`template_files` does, along with the
+        variables they read from the context they are rendered with.
+
+        :param template_name: Name of the template, as given to the loader.
+        :type template_name: str
+
+        :return: Tuple of the sorted list of paths to template files, and the set of variable names.
+        :rtype: tuple[list[str], set[str]]
+        """
+
+        loader = self.environment.loader
+        files = set()
+        variables = set()
+        seen = set()
+        pending = [template_name]
+        while pending:
+            name = pending.pop()
+            if name in seen:
+                continue
+            seen.add(name)
+            try:
+                source, filename, _uptodate = loader.get_source(self.environment, name)
+            except jinja2.TemplateNotFound:
+                log.debug(f'Template {name} could not be found; it will not be tracked.')
+                continue
+            files.add(filename)
+            ast = self.environment.parse(source)
+            variables.update(jinja2.meta.find_undeclared_variables(ast))
+            for referenced in jinja2.meta.find_referenced_templates(ast):
+                if referenced is None:
+                    log.debug(f'Template {name} refers to a template by a dynamic name.')
+                    pending.extend(loader.list_templates())
+                else:
+                    pending.append(referenced)
+
+        return sorted(files), variables
+
+    def watch_paths(self) -> list[str]:
+        """
+        Pages depend on every template in the template's directory that it might use, and the
+        stylesheet is copied into every build.
+
+        :return: List containing the template directory and the stylesheet.
+        :rtype: list[str]
+        """
+
+        return [str(self.html_template.parent), self.stylesheet]
+
+    def dependencies(self, path: str) -> list[str]:
+        """
+        Every rendered page depends on the HTML template and on any templates it extends, includes
+        or imports. These are worked out once per build. When the templates use ``pages``, every
+        page also depends on the metadata of the whole site. When assets are fingerprinted, a page
+        also depends on each asset it refers to, since the asset's filename changes with its
+        contents.
+
+        :param path: Source path relative to the source directory.
+        :type path: str
+
+        :return: List of paths to dependency files.
+        :rtype: list[str]
+        """
+
+        if self._template_files is None:
+            files, variables = self.scan_templates(self.html_template.name)
+            self._template_files = files
+            if 'pages' in variables:
+                self._template_files = files + [PAGES_DEPENDENCY]
+            log.debug(f'Pages depend on these templates: {self._template_files}')
+        if not self._page_assets.get(path):
+            return self._template_files
+
+        assets = []
+        for asset in self._page_assets[path]:
+            if asset == self.config.stylesheet_target_name:
+                assets.append(self.stylesheet)
+            else:
+                assets.append(str(Path(self._source_dir) / asset))
+        return self._template_files + assets
+
+    def output_paths(self, path: str) -> list[str]:
+        """
+        Returns the path of the HTML file rendered from a Markdown file.
+
+        :param path: Source path relative to the source directory.
+        :type path: str
+
+        :return: List containing the single output path.
+        :rtype: list[str]
+        """
+
+        if self.config.rewrite_md_extensions:
+            # Replace .md extension with .html
+            file_parts = path.split('.')
+            file_parts[-1] = 'html'
+            return ['.'.join(file_parts)]
+        return [path]
+
+    def static_outputs(self) -> list[str]:
+        """
+        The stylesheet is copied into every build, along with the search index when it is enabled.
+
+        :return: List containing the stylesheet's target name, fingerprinted if assets are, and the
+            paths of the search index's files.
+        :rtype: list[str]
+        """
+
+        return [self.stylesheet_target_name(), *self._search_files]
+
+    def stylesheet_target_name(self) -> str:
+        """
+        Returns the path the stylesheet is written to, relative to the target directory.
+
+        :return: The configured ``stylesheet_target_name``, fingerprinted if assets are.
+        :rtype: str
+        """
+
+        name = self.config.stylesheet_target_name
+        return self.assets.get(name) if self.assets else name
+
+    def register_assets(self, assets: AssetMap) -> None:
+        """
+        Fingerprints the stylesheet when its extension is among those being fingerprinted. The
+        fingerprint is taken from the stylesheet as it will be written, after any minification.
+
+        :param assets: The build's asset map.
+        :type assets: microsite.render.assets.AssetMap
+        """
+
+        # The converter holds on to the asset map it was built with
+        self._markdown = None
+        name = self.config.stylesheet_target_name
+        if not assets.wants(name):
+            return
+        if name in assets.paths:
+            raise ValueError(
+                f"The stylesheet's filename ({name}) conflicts with a filename in the source "
+                'content. Specify an alternate stylesheet target name.'
+            )
+        if self.minify_stylesheet:
+            with open(self.stylesheet, 'r') as file:
+                data = minify_css(file.read()).encode()
+        else:
+            with open(self.stylesheet, 'rb') as file:
+                data = file.read()
+        assets.add(name, hashlib.sha256(data).hexdigest())
+
+    @property
+    def minify_stylesheet(self) -> bool:
+        """
+        Whether the stylesheet is minified. Unless ``minify_css`` is set, this follows
+        ``pretty_html``.
+        """
+
+        if self.config.minify_css is None:
+            return not self.config.pretty_html
+        return self.config.minify_css
 
-    def render(self, source_dir: str, target_dir: str, paths: list[str]) -> list[str]:
+    def claims(self, path: str) -> bool:
+        """
+        The engine renders every file whose name ends in ``.md``.
+
+        :param path: Source path relative to the source directory.
+        :type path: str
+
+        :return: True if the path is a Markdown file.
+        :rtype: bool
+        """
+
+        return path.endswith('.md')
+
+    def render(
+        self, source_dir: str, target_dir: str, paths: list[str], dirty_paths: set[str] = None
+    ) -> list[str]:
         """
         Searches the ``paths`` to find Markdown files by filenames ending in ``.md``. Renders the
         Jinja2 template found at the configured path (``template_dir/html_template``) for each such
@@ -40,59 +492,187 @@ class MarkdownRenderEngine(RenderEngine):
         :param target_dir: Top-level directory to render files into.
         :type target_dir: str | Path
 
-        :param paths: List of all paths in the source directory to be processed. Not every path in
-            this list will be rendered.
+        :param paths: List of the paths in the source directory claimed by this engine. Any other
+            paths are ignored.
         :type paths: list[str]
 
+        :param dirty_paths: When rendering incrementally, the set of paths which have changed since
+            the last build. Markdown files outside of this set are not rendered again. When None,
+            every Markdown file is rendered. Defaults to None.
+        :type dirty_paths: set[str], optional
+
         :return: List of paths this RenderEngine made alterations to.
         :rtype: list[str]
         """
 
-        # Copy in the stylesheet; detect potential filename conflicts
-        if self.config.stylesheet_target_name in paths:
-            raise ValueError(
-                f"The stylesheet's filename ({self.config.stylesheet_target_name}) "
-                'conflicts with a filename in the source content. '
-                'Specify an alternate stylesheet target name.'
+        # Copy in the stylesheet
+        stylesheet_target = Path(target_dir) / self.stylesheet_target_name()
+        if self.minify_stylesheet:
+            self.write_minified_stylesheet(stylesheet_target)
+        else:
+            self.copy_file(self.stylesheet, stylesheet_target)
+
+        # Templates may have changed since the engine last rendered
+        self._template_files = None
+        self._source_dir = source_dir
+        self._page_assets = {}
+
+        rendered_paths = [path for path in paths if self.claims(path)]
+
+        def jobs() -> Iterator[tuple[str, dict]]:
+            # Jobs are generated as the workers are ready for them rather than all up front
+            for path in rendered_paths:
+                if dirty_paths is not None and path not in dirty_paths:
+                    log.debug(f'Skipping unchanged file {path}')
+                    continue
+
+                log.debug(f'Inspecting {source_dir}{path}')
+                if Path(f'{source_dir}/{path}').is_file():
+                    # Ensure the deeper target directory exists
+                    target_file = Path(target_dir) / self.output_paths(path)[0]
+                    target_file.parent.mkdir(exist_ok=True, parents=True)
+                    yield (
+                        path,
+                        {
+                            'source_dir': source_dir,
+                            'source_file': path,
+                            'target_file': str(target_file),
+                        },
+                    )
+
+        minified_pages = original = minified = 0
+        for path, result in iter_jobs(self, 'render_markdown_file', jobs(), workers=self.workers):
+            if result['assets']:
+                self._page_assets[path] = result['assets']
+            if result['search']:
+                self.search_index.add(path, result['search'])
+            if result['minified']:
+                minified_pages += 1
+                original += result['minified'][0]
+                minified += result['minified'][1]
+        if minified_pages:
+            log.info(
+                f'Minified {minified_pages} pages from {original} to {minified} bytes, saving '
+                f'{original - minified} bytes ({(original - minified) / original:.1%}).'
+            )
+
+        self._search_files = []
+        if self.config.search_index:
+            with get_profiler().phase('search_index'):
+                self.write_search_index(source_dir, target_dir, rendered_paths)
+        return rendered_paths
+
+    @property
+    def search_index(self) -> SearchIndex:
+        """
+        The site's search index. Documents are cached in the engine's cache directory between
+        builds, and held in memory for as long as the engine lives.
+        """
+
+        if not self._search_index:
+            self._search_index = SearchIndex(
+                prefix_length=self.config.search_prefix_length,
+                cache_file=self.cache_dir / 'search.json' if self.cache_dir else None,
             )
-        shutil.copy(
-            self.config.stylesheet or 'microsite/render/styles/plain-white.css',
-            f'{target_dir}/{self.config.stylesheet_target_name}',
+        return self._search_index
+
+    def search_dir(self) -> str:
+        """
+        Returns the directory the search index is written to, relative to the target directory.
+
+        :return: The configured ``search_dir``, or ``search`` if none is configured.
+        :rtype: str
+        """
+
+        return self.config.search_dir.strip('/') or 'search'
+
+    def index_page(self, source_file: str, md_html: str) -> dict:
+        """
+        Builds the search document for a page.
+
+        :param source_file: Path of the page's source file, relative to the source directory.
+        :type source_file: str
+
+        :param md_html: The HTML snippet converted from the page's Markdown.
+        :type md_html: str
+
+        :return: The page's search document. See :py:func:`microsite.render.search.index_document`.
+        :rtype: dict
+        """
+
+        metadata = self.page_metadata(source_file)
+        tags = metadata.get('tags') or []
+        return index_document(
+            url=self.output_paths(source_file)[0],
+            md_html=md_html,
+            title=metadata.get('title'),
+            tags=[tags] if isinstance(tags, str) else tags,
         )
 
-        rendered_paths = []
+    def write_search_index(self, source_dir: str, target_dir: str, paths: list[str]) -> None:
+        """
+        Brings the search index up to date with the pages rendered in this build, then writes it
+        into the target directory. Pages rendered in earlier builds keep their cached documents;
+        any which are missing from the cache are indexed again here.
+
+        :param source_dir: Top-level directory containing source files.
+        :type source_dir: str
+
+        :param target_dir: Top-level directory to write the index into.
+        :type target_dir: str
+
+        :param paths: Source paths of every page the engine handles.
+        :type paths: list[str]
+        """
+
+        search_dir = self.search_dir()
+        search_index = self.search_index
         for path in paths:
-            log.debug(f'Inspecting {source_dir}{path}')
-            if Path(f'{source_dir}{path}').is_file():
-                # Ensure the deeper target directory exists
-                target_subdir = Path('/'.join(f'{target_dir}/{path}'.split('/')[:-1]))
-                target_subdir.mkdir(exist_ok=True, parents=True)
-
-                # Render presumed Markdown files
-                if path.endswith('.md'):
-                    if self.config.rewrite_md_extensions:
-                        # Replace .md extension with .html
-                        file_parts = path.split('.')
-                        file_parts[-1] = 'html'
-                        target_filename = '.'.join(file_parts)
-                    else:
-                        target_filename = path
-                    rendered_paths.append(path)
-                    self.render_markdown_file(
-                        source_dir=source_dir,
-                        source_file=path,
-                        target_file=f'{target_dir}{target_filename}',
-                    )
-        return rendered_paths
+            if path not in search_index.documents:
+                log.debug(f'Indexing unchanged page {path} for search')
+                text = self.read_source(Path(source_dir) / path)
+                search_index.add(path, self.index_page(path, self.convert_markdown(text, path)))
+        search_index.retain(paths)
+        search_index.save_cache()
+
+        target = Path(target_dir) / search_dir
+        self._search_files = [f'{search_dir}/{name}' for name in search_index.write(target)]
+        if self.config.search_client:
+            self.copy_file(SEARCH_CLIENT, target / SEARCH_CLIENT.name)
+            self._search_files.append(f'{search_dir}/{SEARCH_CLIENT.name}')
+
+    def write_minified_stylesheet(self, target: Path) -> None:
+        """
+        Writes a minified copy of the stylesheet. The file is only written when its contents have
+        changed, so that an unchanged stylesheet keeps its modification time between builds.
+
+        :param target: Where to write the stylesheet.
+        :type target: Path
+        """
+
+        with open(self.stylesheet, 'r') as file:
+            original = file.read()
+        css = minify_css(original)
+        if target.is_file():
+            with target.open('r') as file:
+                if file.read() == css:
+                    return
+        log.info(
+            f'Minified stylesheet {self.stylesheet} from {len(original.encode())} to '
+            f'{len(css.encode())} bytes.'
+        )
+        self.write_output(target, css)
 
     def render_markdown_file(
         self,
         source_dir: str,
         source_file: str,
         target_file: str,
-    ) -> None:
+    ) -> dict:
         """
-        Renders a single Markdown file as an HTML file.
+        Renders a single Markdown file as an HTML file. Unless ``pretty_html`` is enabled, the page
+        is minified as the template produces it and written out piece by piece, without the whole
+        page ever being held in memory.
 
         :param source_dir: Directory in which the source file can be found. Used for determining
             relative paths.
@@ -104,76 +684,270 @@ class MarkdownRenderEngine(RenderEngine):
         :param target_file: File to output the rendered HTML into.
         :type target_file: str
 
-        :param stylesheet: Stylesheet file to use.
-        :type stylesheet: str
+        :raises ValueError: When the provided source file is something other than an ordinary file.
+
+        :return: Dict with these keys:
 
-        :param markdown_extensions: List of Markdown extensions to enable. See
-            https://github.com/Python-Markdown/markdown/blob/master/docs/extensions/index.md#officially-supported-extensions
-            Enables no extensions by default.
-        :type markdown_extensions: list[str], optional
+            - ``minified``: When the page was minified, a tuple of its size in bytes before and
+              after minification. Otherwise None.
+            - ``assets``: Sorted list of the fingerprinted assets the page refers to.
+            - ``search``: When ``search_index`` is enabled, the page's search document. See
+              :py:func:`microsite.render.search.index_document`. Otherwise None.
 
-        :raises ValueError: When the provided source file is something other than an ordinary file.
+        :rtype: dict
         """
 
         # Path-ify some things
         source = Path(f'{source_dir}/{source_file}')
         target = Path(target_file)
+        profiler = get_profiler()
 
-        # Determine the containing directory from the template path; remove path portion of template
-        _html_template = str(self.html_template)
-        _template_dir = '/'.join(_html_template.split('/')[:-1])
-        _html_template = _html_template.split('/')[-1]
+        with profiler.phase('page', page=source_file):
+            # Convert the Markdown to HTML (but this is only a snippet, not a full proper document)
+            with profiler.phase('read', page=source_file):
+                text = self.read_source(source)
+            log.debug(f'Rendering Markdown from source {source} into HTML')
+            with profiler.phase('markdown', page=source_file):
+                md_html = self.convert_markdown(text, page=source_file)
+            # Let go of each stage's output once the next stage has it, so that the page is held in
+            # as few forms as possible at once
+            del text
+            result = {'minified': None, 'assets': self.referenced_assets(), 'search': None}
+            if self.config.search_index:
+                with profiler.phase('search', page=source_file):
+                    result['search'] = self.index_page(source_file, md_html)
+
+            # Pipe that HTML into a Jinja template with other rendering details
+            log.info(f'Rendering {source_dir}{source_file} to {target_file}')
+            log.debug(f'Rendering template for source {source}')
+            if not self.config.pretty_html:
+                # Templating, minifying and writing all happen together as the page streams out
+                with profiler.phase('minify', page=source_file):
+                    page = self.generate_page(source_file, md_html)
+                    result['minified'] = self.write_minified(target, page)
+                result['assets'] = self.referenced_assets()
+                return result
+
+            with profiler.phase('jinja', page=source_file):
+                page_html = self.render_page(source_file, md_html)
+            del md_html
+            page_html = self.postprocess_html(page_html, page=source_file)
+
+            # Write out the content to the target
+            log.debug(f'Writing target file {target}')
+            with profiler.phase('write', page=source_file):
+                self.write_output(target, page_html)
+            result['assets'] = self.referenced_assets()
+            return result
+
+    def read_source(self, source: Path) -> str:
+        """
+        Reads a Markdown source file, leaving out its front matter.
+
+        :param source: Path to the source file.
+        :type source: Path
+
+        :raises ValueError: When the provided source file is something other than an ordinary file,
+            when it cannot be decoded as text, or when its front matter cannot be parsed.
+
+        :return: The file's Markdown content.
+        :rtype: str
+        """
 
-        # Convert the Markdown to HTML (but this is only a snippet, not a full proper document)
-        md_html = ''
         if not source.is_file():
-            raise ValueError(f'Source file {source_file} is not a normal file.')
-        with source.open('r') as file:
-            log.debug(f'Rendering Markdown from source {source} into HTML')
-            md_html = markdown(file.read(), extensions=self.config.extensions)
-
-        # Pipe that HTML into a Jinja template with other rendering details
-        log.info(f'Rendering {source_dir}{source_file} to {target_file}')
-        log.debug(f'Rendering template for source {source}')
-        j2_loader = jinja2.FileSystemLoader(searchpath=_template_dir)
-        j2_env = jinja2.Environment(loader=j2_loader)
-        j2_tpl = j2_env.get_template(_html_template)
-        dots = '../' * (len(source_file.split('/')) - 1)
-        relative_stylesheet = f'{dots}{self.config.stylesheet_target_name}'
-
-        # Get the index config
-        index = AttrDict(self.index.get(source_file, {}))
-        title = index.title if index.title else self.config.title
-        additional_vars = {k: v for k, v in index.items() if k.startswith('md_')}
-
-        page_html = j2_tpl.render(
-            stylesheet=relative_stylesheet, title=title, html=md_html, **additional_vars
+            raise ValueError(f'Source file {source} is not a normal file.')
+        try:
+            with source.open('r') as file:
+                text = file.read()
+        except UnicodeDecodeError as ex:
+            raise ValueError(f'Unable to read {source}: {ex}')
+        return split_front_matter(text, source=str(source))[1]
+
+    def convert_markdown(self, text: str, page: str = '') -> str:
+        """
+        Converts Markdown into an HTML snippet.
+
+        :param text: Markdown text.
+        :type text: str
+
+        :param page: Path of the page's source file, relative to the source directory. Relative
+            asset URLs are resolved against it. Defaults to the top of the source directory.
+        :type page: str, optional
+
+        :return: HTML snippet.
+        :rtype: str
+        """
+
+        md = self.markdown.reset()
+        if self._url_rewriter:
+            self._url_rewriter.page = page
+        return md.convert(text)
+
+    def referenced_assets(self) -> list[str]:
+        """
+        Returns the fingerprinted assets the page being rendered refers to, whether through its
+        Markdown or through the template.
+
+        :return: Sorted list of asset paths relative to the target directory.
+        :rtype: list[str]
+        """
+
+        return sorted(self._url_rewriter.referenced) if self._url_rewriter else []
+
+    def asset_url(self, path: str, page: str) -> str:
+        """
+        Returns a URL, relative to a page, pointing to a file in the build. When the file is a
+        fingerprinted asset, the URL points to the fingerprinted file. This is available to
+        templates as ``asset()``, as in ``{{ asset('images/logo.svg') }}``.
+
+        :param path: Path of the file relative to the target directory.
+        :type path: str
+
+        :param page: Path of the page's source file, relative to the source directory.
+        :type page: str
+
+        :return: The relative URL.
+        :rtype: str
+        """
+
+        if self.assets and path in self.assets.paths:
+            if self._url_rewriter:
+                self._url_rewriter.referenced.add(path)
+            return self.assets.url(path, page)
+        return '../' * page.count('/') + path
+
+    def render_page(self, source_file: str, md_html: str) -> str:
+        """
+        Renders the HTML template for a page around an HTML snippet.
+
+        :param source_file: Path of the page's source file, relative to the source directory.
+        :type source_file: str
+
+        :param md_html: The HTML snippet converted from the page's Markdown.
+        :type md_html: str
+
+        :return: The full page.
+        :rtype: str
+        """
+
+        return self.template.render(**self.page_variables(source_file, md_html))
+
+    def generate_page(self, source_file: str, md_html: str) -> Iterator[str]:
+        """
+        Renders the HTML template for a page around an HTML snippet a piece at a time.
+
+        :param source_file: Path of the page's source file, relative to the source directory.
+        :type source_file: str
+
+        :param md_html: The HTML snippet converted from the page's Markdown.
+        :type md_html: str
+
+        :return: Iterator over the pieces of the full page.
+        :rtype: Iterator[str]
+        """
+
+        return self.template.generate(**self.page_variables(source_file, md_html))
+
+    def page_variables(self, source_file: str, md_html: str) -> dict:
+        """
+        Returns the variables the HTML template is rendered with for a page.
+
+        :param source_file: Path of the page's source file, relative to the source directory.
+        :type source_file: str
+
+        :param md_html: The HTML snippet converted from the page's Markdown.
+        :type md_html: str
+
+        :return: Dict of template variables.
+        :rtype: dict
+        """
+
+        relative_stylesheet = self.asset_url(self.config.stylesheet_target_name, source_file)
+
+        # Get the page's metadata
+        metadata = self.page_metadata(source_file)
+        title = metadata.get('title') or self.config.title
+        additional_vars = {k: v for k, v in metadata.items() if k.startswith('md_')}
+
+        return dict(
+            stylesheet=relative_stylesheet,
+            asset=lambda path: self.asset_url(path, source_file),
+            title=title,
+            html=md_html,
+            pages=Pages(self.metadata, source_file),
+            **additional_vars,
         )
 
-        # Convert to a BS object so we can manipulate it before writing it back out
-        page_html = BeautifulSoup(page_html, features='html.parser')
+    def postprocess_html(self, page_html: str, page: str = None) -> str:
+        """
+        Formats a rendered page according to the ``pretty_html`` setting: reformatted for
+        readability when it is enabled, or minified with
+        :py:class:`microsite.render.minify.HTMLMinifier` when it is not.
+
+        :param page_html: The rendered page.
+        :type page_html: str
 
-        if self.config.rewrite_md_urls:
-            page_html = self.rewrite_md_urls(page_html)
+        :param page: Source path of the page, used to label profiling data.
+        :type page: str, optional
 
+        :return: The formatted page.
+        :rtype: str
+        """
+
+        # Links have already been rewritten during conversion, so the page only needs to be parsed
+        # again if it is going to be reformatted
+        profiler = get_profiler()
         if self.config.pretty_html:
-            page_html = str(page_html.prettify())
-        else:
-            page_html = str(page_html).replace('\n', '')
+            with profiler.phase('beautifulsoup', page=page):
+                soup = BeautifulSoup(page_html, features='html.parser')
+            with profiler.phase('serialize', page=page):
+                return soup.prettify()
+        with profiler.phase('minify', page=page):
+            return minify_html(page_html)
+
+    def write_output(self, target: Path, page_html: str) -> None:
+        """
+        Writes a rendered page to its target file. Any existing file is removed first rather than
+        overwritten, since it may be hard linked into an earlier build.
 
-        # Write out the content to the target
+        :param target: Path of the file to write.
+        :type target: Path
+
+        :param page_html: The rendered page.
+        :type page_html: str
+        """
+
+        target.unlink(missing_ok=True)
         with target.open('w') as file:
-            log.debug(f'Writing target file {target}')
             file.write(page_html)
 
-    def rewrite_md_urls(self, html: BeautifulSoup) -> str:
-        log.info('Rewriting URLs in links...')
-        for a_tag in html.find_all('a'):
-            old_href = href = a_tag.get('href')
-            if href and href.endswith('.md') and not href.startswith('http'):
-                href = href.split('.')
-                href[-1] = 'html'
-                href = '.'.join(href)
-                a_tag['href'] = href
-                log.debug(f'Rewriting {old_href} as {href}')
-        return html
+    def write_minified(self, target: Path, chunks: Iterator[str]) -> tuple[int, int]:
+        """
+        Minifies a page as it is produced and writes each minified piece straight to its target
+        file. Any existing file is removed first rather than overwritten, since it may be hard
+        linked into an earlier build.
+
+        :param target: Path of the file to write.
+        :type target: Path
+
+        :param chunks: The pieces of the page, in order.
+        :type chunks: Iterator[str]
+
+        :return: Tuple of the page's size in bytes before and after minification.
+        :rtype: tuple[int, int]
+        """
+
+        original = 0
+        parts = []
+        minifier = HTMLMinifier(write=parts.append)
+        target.unlink(missing_ok=True)
+        with target.open('w') as file:
+            # The minifier produces many tiny pieces, so write them out once per chunk
+            for chunk in chunks:
+                original += len(chunk.encode())
+                minifier.feed(chunk)
+                file.write(''.join(parts))
+                parts.clear()
+            minifier.close()
+            file.write(''.join(parts))
+        return original, target.stat().st_size
@@ -0,0 +1,400 @@
+"""
+Module for reading the metadata pages declare about themselves in front matter, and for keeping
+every page's metadata in a store which templates can query.
+
+Front matter is a block at the very top of a Markdown file, set off by delimiter lines. YAML front
+matter is set off by ``---`` lines and requires the optional ``PyYAML`` package. TOML front matter
+is set off by ``+++`` lines:
+
+.. code-block:: markdown
+
+    +++
+    title = "Release notes"
+    tags = ["releases"]
+    +++
+
+    # Release notes
+
+A YAML block which does not hold a mapping (as with a horizontal rule followed by a heading) is not
+treated as front matter, and is left in the page.
+"""
+
+import hashlib
+import json
+import logging
+import posixpath
+import sqlite3
+import tomllib
+
+from pathlib import Path
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+log = logging.getLogger(__name__)
+
+# Opening delimiter lines, mapped to the name of the front matter's format
+FRONT_MATTER_DELIMITERS = {'---': 'yaml', '+++': 'toml'}
+
+# Bumped whenever the layout of the metadata store changes, so old stores are rebuilt
+STORE_VERSION = 1
+
+
+def split_front_matter(text: str, source: str = None) -> tuple[dict, str]:
+    """
+    Separates a Markdown file's front matter from its content.
+
+    :param text: The contents of the file.
+    :type text: str
+
+    :param source: Name of the file, used in error messages.
+    :type source: str, optional
+
+    :raises ValueError: When the front matter cannot be parsed.
+
+    :return: Tuple of the front matter (an empty dict if there is none) and the rest of the file.
+    :rtype: tuple[dict, str]
+    """
+
+    lines = text.splitlines(keepends=True)
+    delimiter = lines[0].rstrip() if lines else None
+    fmt = FRONT_MATTER_DELIMITERS.get(delimiter)
+    if not fmt:
+        return {}, text
+    for number, line in enumerate(lines[1:], start=1):
+        if line.rstrip() == delimiter:
+            block = ''.join(lines[1:number])
+            body = ''.join(lines[number + 1 :])
+            break
+    else:
+        return {}, text
+
+    if fmt == 'toml':
+        try:
+            return tomllib.loads(block), body
+        except tomllib.TOMLDecodeError as ex:
+            raise ValueError(f'Unable to parse the TOML front matter of {source or "a page"}: {ex}')
+
+    if yaml is None:
+        log.warning(
+            f'{source or "A page"} appears to have YAML front matter, but the PyYAML package is '
+            'not installed, so it will be treated as part of the page.'
+        )
+        return {}, text
+    try:
+        front_matter = yaml.safe_load(block)
+    except yaml.YAMLError as ex:
+        raise ValueError(f'Unable to parse the YAML front matter of {source or "a page"}: {ex}')
+    if not isinstance(front_matter, dict):
+        return {}, text
+    return front_matter, body
+
+
+def read_front_matter(path: str | Path) -> dict:
+    """
+    Reads only as much of a file as it takes to get its front matter.
+
+    :param path: Path to the Markdown file.
+    :type path: str | Path
+
+    :raises ValueError: When the file cannot be decoded as text, or its front matter cannot be
+        parsed.
+
+    :return: The front matter, or an empty dict if the file has none.
+    :rtype: dict
+    """
+
+    try:
+        with open(path, 'r') as file:
+            first_line = file.readline()
+            delimiter = first_line.rstrip()
+            if delimiter not in FRONT_MATTER_DELIMITERS:
+                return {}
+            lines = [first_line]
+            for line in file:
+                lines.append(line)
+                if line.rstrip() == delimiter:
+                    break
+    except UnicodeDecodeError as ex:
+        raise ValueError(f'Unable to read the front matter of {path}: {ex}')
+    return split_front_matter(''.join(lines), source=str(path))[0]
+
+
+class MetadataStore:
+    """
+    A SQLite database holding the metadata of every page in a site. Each page's front matter is
+    kept along with the content hash of the file it came from, so a file only has to be read again
+    when it changes. Alongside it is the page's complete metadata, with any settings from the
+    project's ``render.index`` applied, which is what templates see.
+
+    :param db_file: File to keep the database in. When None, the database only lives in memory.
+        Defaults to None.
+    :type db_file: str | Path, optional
+    """
+
+    def __init__(self, db_file: str | Path = None):
+        self.db_file = Path(db_file) if db_file else None
+        if self.db_file:
+            self.db_file.parent.mkdir(parents=True, exist_ok=True)
+        # Engines may be run on a different thread from the one which built them, but never use the
+        # store from more than one thread at a time
+        self.connection = sqlite3.connect(
+            str(self.db_file) if self.db_file else ':memory:', check_same_thread=False
+        )
+        version = self.connection.execute('PRAGMA user_version').fetchone()[0]
+        if version != STORE_VERSION:
+            if version:
+                log.info(f'Rebuilding the page metadata store {self.db_file} for a new version')
+            self.connection.executescript(
+                f"""
+                DROP TABLE IF EXISTS tags;
+                DROP TABLE IF EXISTS pages;
+                CREATE TABLE pages (
+                    path TEXT PRIMARY KEY,
+                    hash TEXT NOT NULL,
+                    front_matter TEXT NOT NULL,
+                    output TEXT NOT NULL,
+                    metadata TEXT NOT NULL
+                );
+                CREATE TABLE tags (
+                    tag TEXT NOT NULL,
+                    path TEXT NOT NULL REFERENCES pages (path) ON DELETE CASCADE
+                );
+                CREATE INDEX tags_by_tag ON tags (tag);
+                CREATE INDEX tags_by_path ON tags (path);
+                PRAGMA user_version = {STORE_VERSION};
+                """
+            )
+        self.connection.execute('PRAGMA foreign_keys = ON')
+
+    def front_matter(self, path: str, file_hash: str) -> dict | None:
+        """
+        Returns the front matter recorded for a page, as long as it was read from a file with the
+        same contents.
+
+        :param path: Source path of the page.
+        :type path: str
+
+        :param file_hash: Content hash of the page's source file.
+        :type file_hash: str
+
+        :return: The page's front matter, or None if it is not known for this version of the file.
+        :rtype: dict | None
+        """
+
+        row = self.connection.execute(
+            'SELECT front_matter FROM pages WHERE path = ? AND hash = ?', (path, file_hash)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def update(
+        self, path: str, file_hash: str, front_matter: dict, output: str, metadata: dict
+    ) -> None:
+        """
+        Records a page's front matter and complete metadata, replacing anything recorded before.
+
+        :param path: Source path of the page.
+        :type path: str
+
+        :param file_hash: Content hash of the page's source file.
+        :type file_hash: str
+
+        :param front_matter: The page's front matter.
+        :type front_matter: dict
+
+        :param output: Path of the rendered page, relative to the top of the site.
+        :type output: str
+
+        :param metadata: The page's complete metadata.
+        :type metadata: dict
+        """
+
+        encoded = json.dumps(metadata, sort_keys=True, default=str)
+        row = self.connection.execute(
+            'SELECT hash, output, metadata FROM pages WHERE path = ?', (path,)
+        ).fetchone()
+        if row == (file_hash, output, encoded):
+            return
+
+        self.connection.execute('DELETE FROM pages WHERE path = ?', (path,))
+        self.connection.execute(
+            'INSERT INTO pages (path, hash, front_matter, output, metadata) VALUES (?, ?, ?, ?, ?)',
+            (path, file_hash, json.dumps(front_matter, default=str), output, encoded),
+        )
+        tags = metadata.get('tags') or []
+        if isinstance(tags, str):
+            tags = [tags]
+        self.connection.executemany(
+            'INSERT INTO tags (tag, path) VALUES (?, ?)', [(str(tag), path) for tag in set(tags)]
+        )
+
+    def retain(self, paths: list[str]) -> None:
+        """
+        Removes every page from the store except those given, such as pages which have been
+        deleted.
+
+        :param paths: Source paths of the pages to keep.
+        :type paths: list[str]
+        """
+
+        keep = set(paths)
+        stale = [
+            (path,)
+            for (path,) in self.connection.execute('SELECT path FROM pages')
+            if path not in keep
+        ]
+        self.connection.executemany('DELETE FROM pages WHERE path = ?', stale)
+
+    def commit(self) -> None:
+        """
+        Saves the changes made to the store, making them visible to worker processes.
+        """
+
+        self.connection.commit()
+
+    def close(self) -> None:
+        """
+        Closes the database.
+        """
+
+        self.connection.close()
+
+    def digest(self) -> str:
+        """
+        Returns a digest of every page's output path and metadata. This changes whenever anything a
+        template could learn from the store does.
+
+        :return: Hexadecimal digest.
+        :rtype: str
+        """
+
+        digest = hashlib.sha256()
+        rows = self.connection.execute('SELECT path, output, metadata FROM pages ORDER BY path')
+        for row in rows:
+            digest.update('\0'.join(row).encode())
+            digest.update(b'\n')
+        return digest.hexdigest()
+
+    def metadata(self, path: str) -> dict | None:
+        """
+        Returns a page's complete metadata.
+
+        :param path: Source path of the page.
+        :type path: str
+
+        :return: The page's metadata, or None if the page is not in the store.
+        :rtype: dict | None
+        """
+
+        row = self.connection.execute(
+            'SELECT metadata FROM pages WHERE path = ?', (path,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def pages(self, tag: str = None) -> list[tuple[str, str, dict]]:
+        """
+        Returns pages from the store, in order of their source paths.
+
+        :param tag: When given, only pages with this tag are returned.
+        :type tag: str, optional
+
+        :return: List of tuples of each page's source path, output path, and complete metadata.
+        :rtype: list[tuple[str, str, dict]]
+        """
+
+        if tag is None:
+            rows = self.connection.execute('SELECT path, output, metadata FROM pages ORDER BY path')
+        else:
+            rows = self.connection.execute(
+                'SELECT pages.path, output, metadata FROM pages '
+                'JOIN tags ON tags.path = pages.path WHERE tag = ? ORDER BY pages.path',
+                (tag,),
+            )
+        return [(path, output, json.loads(metadata)) for path, output, metadata in rows]
+
+    def tags(self) -> list[str]:
+        """
+        Returns every tag used by any page.
+
+        :return: Sorted list of tags.
+        :rtype: list[str]
+        """
+
+        rows = self.connection.execute('SELECT DISTINCT tag FROM tags ORDER BY tag')
+        return [tag for (tag,) in rows]
+
+
+class Pages:
+    """
+    The view of the metadata store given to templates as ``pages``. Each page it returns is a dict
+    of the page's metadata with these keys added:
+
+    - ``source``: Path of the page's source file, relative to the source directory.
+    - ``path``: Path of the rendered page, relative to the top of the site.
+    - ``url``: URL of the rendered page, relative to the page being rendered.
+
+    Iterating over it yields every page in the site, in order of their source paths:
+
+    .. code-block:: jinja
+
+        {% for page in pages.tagged('releases') %}
+          <a href="{{ page.url }}">{{ page.title }}</a>
+        {% endfor %}
+
+    :param store: The metadata store to query.
+    :type store: MetadataStore
+
+    :param page: Source path of the page being rendered.
+    :type page: str
+    """
+
+    def __init__(self, store: MetadataStore, page: str):
+        self.store = store
+        self.page = page
+
+    def __iter__(self):
+        return iter(self.all())
+
+    def __len__(self) -> int:
+        return self.store.connection.execute('SELECT COUNT(*) FROM pages').fetchone()[0]
+
+    def entry(self, source: str, path: str, metadata: dict) -> dict:
+        """
+        Builds the entry templates see for a page.
+        """
+
+        url = posixpath.relpath(path, posixpath.dirname(self.page) or '.')
+        return {**metadata, 'source': source, 'path': path, 'url': url}
+
+    def all(self) -> list[dict]:
+        """
+        Returns every page in the site.
+        """
+
+        return [self.entry(*row) for row in self.store.pages()]
+
+    def tagged(self, tag: str) -> list[dict]:
+        """
+        Returns every page with the given tag.
+        """
+
+        return [self.entry(*row) for row in self.store.pages(tag=tag)]
+
+    def tags(self) -> list[str]:
+        """
+        Returns every tag used by any page, in sorted order.
+        """
+
+        return self.store.tags()
+
+    def get(self, source: str) -> dict | None:
+        """
+        Returns the page rendered from the given source path, or None if there is no such page.
+        """
+
+        row = self.store.connection.execute(
+            'SELECT path, output, metadata FROM pages WHERE path = ?', (source,)
+        ).fetchone()
+        return self.entry(row[0], row[1], json.loads(row[2])) if row else None
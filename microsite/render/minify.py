@@ -0,0 +1,439 @@
+"""
+Module for shrinking HTML and CSS by removing whatever a browser does not need to display them the
+same way.
+"""
+
+import re
+
+from collections.abc import Callable, Iterable
+
+# Elements which start on a new line, so whitespace next to their tags is never displayed
+BLOCK_TAGS = {
+    'address',
+    'article',
+    'aside',
+    'base',
+    'blockquote',
+    'body',
+    'caption',
+    'col',
+    'colgroup',
+    'dd',
+    'details',
+    'dialog',
+    'div',
+    'dl',
+    'dt',
+    'fieldset',
+    'figcaption',
+    'figure',
+    'footer',
+    'form',
+    'h1',
+    'h2',
+    'h3',
+    'h4',
+    'h5',
+    'h6',
+    'head',
+    'header',
+    'hgroup',
+    'hr',
+    'html',
+    'legend',
+    'li',
+    'link',
+    'main',
+    'meta',
+    'nav',
+    'ol',
+    'optgroup',
+    'option',
+    'p',
+    'pre',
+    'script',
+    'section',
+    'style',
+    'summary',
+    'table',
+    'tbody',
+    'td',
+    'tfoot',
+    'th',
+    'thead',
+    'title',
+    'tr',
+    'ul',
+}
+
+# Elements whose contents must be kept exactly as written
+PRESERVE_TAGS = {'pre', 'script', 'style', 'textarea'}
+
+# Elements which never have contents or an end tag
+VOID_TAGS = {
+    'area',
+    'base',
+    'br',
+    'col',
+    'embed',
+    'hr',
+    'img',
+    'input',
+    'link',
+    'meta',
+    'source',
+    'track',
+    'wbr',
+}
+
+# Elements whose end tags may be left out, mapped to the start tags which may immediately follow
+# the omitted end tag, and whether it may also be left out when its parent element ends. See
+# https://html.spec.whatwg.org/multipage/syntax.html#optional-tags
+OPTIONAL_END_TAGS = {
+    'body': (set(), True),
+    'dd': ({'dd', 'dt'}, True),
+    'dt': ({'dd', 'dt'}, False),
+    'head': ({'body'}, True),
+    'html': (set(), True),
+    'li': ({'li'}, True),
+    'optgroup': ({'optgroup'}, True),
+    'option': ({'option', 'optgroup'}, True),
+    'p': (
+        {
+            'address',
+            'article',
+            'aside',
+            'blockquote',
+            'details',
+            'div',
+            'dl',
+            'fieldset',
+            'figcaption',
+            'figure',
+            'footer',
+            'form',
+            'h1',
+            'h2',
+            'h3',
+            'h4',
+            'h5',
+            'h6',
+            'header',
+            'hgroup',
+            'hr',
+            'main',
+            'menu',
+            'nav',
+            'ol',
+            'p',
+            'pre',
+            'section',
+            'table',
+            'ul',
+        },
+        True,
+    ),
+    'tbody': ({'tbody', 'tfoot'}, True),
+    'td': ({'td', 'th'}, True),
+    'tfoot': (set(), True),
+    'th': ({'td', 'th'}, True),
+    'thead': ({'tbody', 'tfoot'}, False),
+    'tr': ({'tr'}, True),
+}
+
+# A paragraph's end tag may not be left out when its parent is one of these
+P_END_REQUIRED_PARENTS = {'a', 'audio', 'del', 'ins', 'map', 'noscript', 'video'}
+
+WHITESPACE = re.compile(r'\s+')
+
+HTML_TOKEN = re.compile(
+    r'(<!--.*?-->)'  # Comments
+    r'|<(/?)([a-zA-Z][-.:\w]*)((?:"[^"]*"|\'[^\']*\'|[^\'">])*)>'  # Tags and their attributes
+    r'|(<[!?][^>]*>)'  # Doctypes and other declarations
+    r'|([^<]+)'  # Text
+    r'|(<)',  # The start of a tag which is not complete
+    re.DOTALL,
+)
+
+ATTRIBUTE_WHITESPACE = re.compile(r'("[^"]*"|\'[^\']*\')|\s+')
+
+# Elements whose contents are not HTML at all, mapped to patterns matching their end tags
+RAW_END_TAGS = {
+    'script': re.compile(r'</script\s*>', re.IGNORECASE),
+    'style': re.compile(r'</style\s*>', re.IGNORECASE),
+}
+
+# Length of the longest partial end tag that could be cut off at the end of a piece of a document
+RAW_END_LOOKBEHIND = 16
+
+CSS_TOKEN = re.compile(
+    r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')'  # Strings
+    r'|(/\*.*?\*/)'  # Comments
+    r'|(\s+)'  # Whitespace
+    r'|([{};,>:()!])'  # Punctuation which whitespace can be removed around
+    r'|([^"\'\s{};,>:()!/]+|/)',  # Everything else
+    re.DOTALL,
+)
+
+# Characters after which, and punctuation before which, whitespace in a stylesheet can be removed
+CSS_NO_SPACE_AFTER = '{};,>:(!'
+CSS_NO_SPACE_BEFORE = ('{', '}', ';', ',', '>', ')', '!')
+
+
+class HTMLMinifier:
+    """
+    Minifies HTML as it is fed in, writing the result out in pieces as it goes, so that a page never
+    needs to be held in memory as a whole. The minifier:
+
+    - Collapses runs of whitespace into a single space, and removes whitespace next to the tags of
+      block elements (like ``<p>`` and ``<li>``), where it is never displayed. A single space is
+      kept between inline elements (like ``<a>`` and ``<em>``) and text, where it is.
+    - Keeps the contents of ``<pre>``, ``<textarea>``, ``<script>`` and ``<style>`` elements exactly
+      as written.
+    - Removes comments, except for conditional comments.
+    - Leaves out end tags which the HTML standard allows to be left out, like ``</li>`` and
+      ``</p>``, wherever doing so does not change the page.
+
+    Text, character references and attribute values are copied through untouched, so the minified
+    page means the same thing as the original.
+
+    :param write: Function which is called with each piece of the minified output.
+    :type write: Callable[[str], Any]
+    """
+
+    def __init__(self, write: Callable[[str], object]):
+        self.write = write
+        self.buffer = ''
+        self.raw_tag = None
+        self.preserve = 0
+        self.stack = []
+        self.pending_space = False
+        self.at_boundary = True
+        self.pending_end = None
+
+    def feed(self, data: str) -> None:
+        """
+        Minifies the next piece of the document. Anything at the end of the piece which can't be
+        handled until more of the document arrives, like half of a tag, is held back until then.
+
+        :param data: The next piece of the document.
+        :type data: str
+        """
+
+        self.buffer += data
+        self.process(final=False)
+
+    def close(self) -> None:
+        """
+        Finishes the document, writing out anything still held back.
+        """
+
+        self.process(final=True)
+        self.resolve_pending_end('eof')
+
+    def feed_all(self, chunks: Iterable[str]) -> None:
+        """
+        Minifies each chunk of a document in turn, then finishes the document.
+
+        :param chunks: The pieces of the document.
+        :type chunks: Iterable[str]
+        """
+
+        for chunk in chunks:
+            self.feed(chunk)
+        self.close()
+
+    def process(self, final: bool) -> None:
+        buffer = self.buffer
+        position = 0
+        while position < len(buffer):
+            if self.raw_tag:
+                # Copy the contents of a script or style element up to its end tag
+                end = RAW_END_TAGS[self.raw_tag].search(buffer, position)
+                if not end:
+                    safe = len(buffer) if final else len(buffer) - RAW_END_LOOKBEHIND
+                    if safe > position:
+                        self.write(buffer[position:safe])
+                        position = safe
+                    break
+                self.write(buffer[position : end.start()])
+                position = end.start()
+                self.raw_tag = None
+                continue
+
+            match = HTML_TOKEN.match(buffer, position)
+            comment, slash, name, attributes, declaration, text, other = match.groups()
+            if other is not None or (declaration and declaration.startswith('<!--')):
+                # The start of a tag or comment which doesn't end within the buffer
+                if not final:
+                    break
+                text = match.group()
+            position = match.end()
+
+            if text is not None:
+                self.handle_text(text)
+            elif name is not None:
+                if slash:
+                    self.handle_endtag(name)
+                else:
+                    self.handle_starttag(name, attributes)
+            elif comment is not None:
+                # Conditional comments are instructions to old browsers rather than notes
+                if comment.startswith('<!--[if') or comment.startswith('<!--<![endif]'):
+                    self.resolve_pending_end('text')
+                    self.write(comment)
+            else:
+                self.resolve_pending_end('text')
+                self.write(declaration)
+        self.buffer = buffer[position:]
+
+    def resolve_pending_end(self, kind: str, tag: str = None) -> None:
+        """
+        Decides whether an optional end tag held back by :py:meth:`handle_endtag` has to be written,
+        now that the next thing in the document is known.
+
+        :param kind: What comes next: ``start`` or ``end`` for a tag, ``text`` for anything else, or
+            ``eof`` for the end of the document.
+        :type kind: str
+
+        :param tag: The next tag's name, if the next thing is a tag.
+        :type tag: str, optional
+        """
+
+        if not self.pending_end:
+            return
+        pending, parent = self.pending_end
+        self.pending_end = None
+        followed_by, parent_may_end = OPTIONAL_END_TAGS[pending]
+        if kind == 'start' and tag in followed_by:
+            return
+        if kind in ('end', 'eof') and parent_may_end:
+            if pending != 'p' or parent not in P_END_REQUIRED_PARENTS:
+                return
+        self.write(f'</{pending}>')
+
+    def write_inline(self, text: str) -> None:
+        if self.pending_space and not self.at_boundary:
+            self.write(' ')
+        self.pending_space = False
+        self.at_boundary = False
+        self.write(text)
+
+    def handle_starttag(self, name: str, attributes: str) -> None:
+        tag = name.lower()
+        self.resolve_pending_end('start', tag)
+
+        self_closing = attributes.endswith('/')
+        if self_closing:
+            attributes = attributes[:-1]
+        if '\n' in attributes or '  ' in attributes or '\t' in attributes:
+            attributes = ATTRIBUTE_WHITESPACE.sub(lambda match: match.group(1) or ' ', attributes)
+        attributes = attributes.rstrip()
+        slash = '/' if self_closing and tag not in VOID_TAGS else ''
+        html = f'<{name}{attributes}{slash}>'
+
+        if tag in BLOCK_TAGS:
+            self.pending_space = False
+            self.at_boundary = True
+            self.write(html)
+        else:
+            self.write_inline(html)
+        if self_closing or tag in VOID_TAGS:
+            return
+
+        self.stack.append(tag)
+        if tag in RAW_END_TAGS:
+            self.raw_tag = tag
+        elif tag in PRESERVE_TAGS:
+            self.preserve += 1
+
+    def handle_endtag(self, name: str) -> None:
+        tag = name.lower()
+        self.resolve_pending_end('end', tag)
+        if tag in self.stack:
+            while self.stack.pop() != tag:
+                pass
+        if tag in PRESERVE_TAGS and tag not in RAW_END_TAGS and self.preserve:
+            self.preserve -= 1
+
+        if tag not in BLOCK_TAGS:
+            # Any whitespace before the end tag is written after it instead, which looks the same
+            self.write(f'</{name}>')
+            self.at_boundary = False
+            return
+
+        self.pending_space = False
+        self.at_boundary = True
+        if tag in OPTIONAL_END_TAGS:
+            self.pending_end = (tag, self.stack[-1] if self.stack else None)
+        else:
+            self.write(f'</{name}>')
+
+    def handle_text(self, data: str) -> None:
+        if self.preserve:
+            self.resolve_pending_end('text')
+            self.write(data)
+            self.at_boundary = False
+            return
+
+        text = WHITESPACE.sub(' ', data)
+        if text == ' ':
+            self.pending_space = True
+            return
+
+        self.resolve_pending_end('text')
+        if text.startswith(' '):
+            self.pending_space = True
+        self.write_inline(text.strip(' '))
+        self.pending_space = text.endswith(' ')
+
+
+def minify_html(html: str) -> str:
+    """
+    Minifies an HTML document held in memory. See :py:class:`HTMLMinifier` for what this does.
+
+    :param html: The document to minify.
+    :type html: str
+
+    :return: The minified document.
+    :rtype: str
+    """
+
+    parts = []
+    HTMLMinifier(write=parts.append).feed_all([html])
+    return ''.join(parts)
+
+
+def minify_css(css: str) -> str:
+    """
+    Minifies a stylesheet by removing comments and any whitespace which does not separate two words.
+    Strings and comments starting with ``/*!`` (often used for license notices) are kept as written.
+
+    :param css: The stylesheet to minify.
+    :type css: str
+
+    :return: The minified stylesheet.
+    :rtype: str
+    """
+
+    out = []
+    pending_space = False
+    for match in CSS_TOKEN.finditer(css):
+        string, comment, space, punctuation, other = match.groups()
+        if space is not None or (comment is not None and not comment.startswith('/*!')):
+            pending_space = True
+            continue
+
+        token = string or comment or punctuation or other
+        if punctuation == '}' and out and out[-1] == ';':
+            out.pop()
+        if (
+            pending_space
+            and out
+            and out[-1][-1] not in CSS_NO_SPACE_AFTER
+            and punctuation not in CSS_NO_SPACE_BEFORE
+        ):
+            out.append(' ')
+        pending_space = False
+        out.append(token)
+    return ''.join(out)
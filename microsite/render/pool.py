@@ -0,0 +1,149 @@
+"""
+Module for spreading a rendering engine's work across a pool of worker processes.
+"""
+
+import itertools
+import logging
+
+from collections import deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from microsite.profiling import get_profiler
+
+log = logging.getLogger(__name__)
+
+# Each worker process holds its own copy of the engine, built once by the pool initializer
+_worker_engine = None
+_worker_records = []
+
+
+class _RecordCollector(logging.Handler):
+    """
+    Logging handler which holds on to the records produced in a worker process so they can be sent
+    back to the parent process and logged there in a predictable order.
+    """
+
+    def emit(self, record: logging.LogRecord) -> None:
+        # Flatten the record so that it survives being pickled
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        _worker_records.append(record)
+
+
+def _init_worker(engine_class: type, engine_kwargs: dict, log_level: int, profile: bool) -> None:
+    """
+    Initializes a worker process by building its copy of the rendering engine and routing all of its
+    log output into a buffer.
+    """
+
+    global _worker_engine
+
+    root_logger = logging.getLogger()
+    for handler in list(root_logger.handlers):
+        root_logger.removeHandler(handler)
+    root_logger.addHandler(_RecordCollector())
+    root_logger.setLevel(log_level)
+    # A forked worker starts with a copy of the parent's events, which the parent already has
+    profiler = get_profiler()
+    profiler.enabled = profile
+    profiler.take_events()
+
+    _worker_engine = engine_class(**engine_kwargs)
+
+
+def _run_job(method_name: str, kwargs: dict) -> tuple[object, list[logging.LogRecord], list[dict]]:
+    """
+    Runs one job in a worker process and returns its result along with the log records and
+    profiler events it produced.
+    """
+
+    _worker_records.clear()
+    result = getattr(_worker_engine, method_name)(**kwargs)
+    return result, list(_worker_records), get_profiler().take_events()
+
+
+def iter_jobs(
+    engine, method_name: str, jobs: Iterable[tuple[str, dict]], workers: int, window: int = None
+) -> Iterator[tuple[str, object]]:
+    """
+    Calls a method of a rendering engine once for each job, yielding the results as they become
+    available. When ``workers`` is greater than 1 and there is more than one job, the calls are
+    spread over a pool of worker processes, each of which builds its own copy of the engine exactly
+    once using the engine's :py:meth:`microsite.render.RenderEngine.worker_kwargs`. Log output from
+    the workers is replayed in the parent process in the same order as the jobs, so it reads the
+    same regardless of the number of workers. Profiler events recorded by the workers are collected
+    into the parent's profiler.
+
+    Jobs are taken from ``jobs`` only as fast as the workers get through them: no more than
+    ``window`` jobs are in progress or waiting to be collected at once. Together with a lazily
+    generated ``jobs`` iterable, this keeps memory use the same however many jobs there are.
+
+    :param engine: The rendering engine to run the jobs for.
+    :type engine: microsite.render.RenderEngine
+
+    :param method_name: Name of the engine method to call for each job.
+    :type method_name: str
+
+    :param jobs: Iterable of tuples, each containing the source path the job is for and a dict of
+        keyword arguments to call the method with.
+    :type jobs: Iterable[tuple[str, dict]]
+
+    :param workers: Number of worker processes to use.
+    :type workers: int
+
+    :param window: Number of jobs which may be submitted to the workers at once. Defaults to four
+        per worker, which keeps every worker busy.
+    :type window: int, optional
+
+    :raises RuntimeError: When any job fails. No further jobs are started and the build stops.
+
+    :return: Iterator of tuples of each job's source path and the value returned by its call, in
+        the same order as the jobs. The values must be picklable.
+    :rtype: Iterator[tuple[str, object]]
+    """
+
+    jobs = iter(jobs)
+    first = list(itertools.islice(jobs, 2))
+    if workers <= 1 or len(first) <= 1:
+        for path, kwargs in itertools.chain(first, jobs):
+            yield path, getattr(engine, method_name)(**kwargs)
+        return
+
+    log.info(f'Rendering files with {workers} worker processes')
+    window = window or workers * 4
+    executor = ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(
+            type(engine),
+            engine.worker_kwargs(),
+            logging.getLogger().getEffectiveLevel(),
+            get_profiler().enabled,
+        ),
+    )
+    pending = deque()
+
+    def collect() -> tuple[str, object]:
+        path, future = pending.popleft()
+        try:
+            result, records, events = future.result()
+        except Exception as ex:
+            raise RuntimeError(f'Failed to render {path}: {ex}') from ex
+        for record in records:
+            logging.getLogger(record.name).handle(record)
+        get_profiler().add_events(events)
+        return path, result
+
+    try:
+        for path, kwargs in itertools.chain(first, jobs):
+            pending.append((path, executor.submit(_run_job, method_name, kwargs)))
+            if len(pending) >= window:
+                yield collect()
+        while pending:
+            yield collect()
+    finally:
+        # On failure, drop any jobs which have not started yet rather than waiting on them
+        executor.shutdown(wait=True, cancel_futures=True)
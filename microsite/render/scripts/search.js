@@ -0,0 +1,137 @@
+/*
+ * Client for the search index Microsite writes when the Markdown engine's search_index option is
+ * enabled. See microsite/render/search.py for the index format.
+ *
+ *     const results = await micrositeSearch('query terms', 'search/');
+ *
+ * Resolves to a list of {url, title, score} objects for the pages containing every term, best
+ * matches first. URLs are relative to the top of the site.
+ */
+(function () {
+  'use strict';
+
+  const indexes = {};
+  const shards = {};
+
+  function fetchIndex(base) {
+    if (!indexes[base]) {
+      indexes[base] = fetch(base + 'index.json').then((response) => response.json());
+    }
+    return indexes[base];
+  }
+
+  function fetchShard(base, name) {
+    const url = base + name;
+    if (!shards[url]) {
+      shards[url] = fetch(url).then((response) =>
+        response.ok ? response.arrayBuffer().then(decodeShard) : {}
+      );
+    }
+    return shards[url];
+  }
+
+  function tokenize(text, maxLength) {
+    const terms = text.toLowerCase().match(/[\p{L}\p{M}\p{N}]+/gu) || [];
+    return terms
+      .filter((term) => term.length > 1 || /^\p{N}$/u.test(term))
+      .map((term) => Array.from(term).slice(0, maxLength).join(''));
+  }
+
+  function shardName(term, prefixLength) {
+    const prefix = Array.from(term).slice(0, prefixLength).join('');
+    const bytes = new TextEncoder().encode(prefix);
+    return Array.from(bytes, (byte) => byte.toString(16).padStart(2, '0')).join('') + '.bin';
+  }
+
+  function decodeShard(buffer) {
+    const data = new Uint8Array(buffer);
+    const decoder = new TextDecoder();
+    let offset = 0;
+    function varint() {
+      let value = 0;
+      let scale = 1;
+      let byte;
+      do {
+        byte = data[offset++];
+        value += (byte & 0x7f) * scale;
+        scale *= 128;
+      } while (byte >= 0x80);
+      return value;
+    }
+
+    const postings = {};
+    const termCount = varint();
+    for (let i = 0; i < termCount; i++) {
+      const length = varint();
+      const term = decoder.decode(data.subarray(offset, offset + length));
+      offset += length;
+      const documentCount = varint();
+      const documents = [];
+      let document = 0;
+      for (let j = 0; j < documentCount; j++) {
+        document += varint();
+        const fields = varint();
+        const positionCount = varint();
+        for (let k = 0; k < positionCount; k++) {
+          varint();
+        }
+        documents.push({ document, fields, count: positionCount });
+      }
+      postings[term] = documents;
+    }
+    return postings;
+  }
+
+  async function micrositeSearch(query, base) {
+    base = base || 'search/';
+    if (!base.endsWith('/')) {
+      base += '/';
+    }
+    const index = await fetchIndex(base);
+    const terms = Array.from(new Set(tokenize(query, index.max_term_length)));
+    if (!terms.length) {
+      return [];
+    }
+
+    const found = await Promise.all(
+      terms.map((term) =>
+        fetchShard(base, shardName(term, index.prefix_length)).then((shard) => shard[term] || [])
+      )
+    );
+
+    // Only pages containing every term match; each match scores by field and frequency
+    let scores = null;
+    for (const documents of found) {
+      const termScores = new Map();
+      for (const { document, fields, count } of documents) {
+        let score = count;
+        if (fields & index.fields.title) {
+          score += index.boosts.title;
+        }
+        if (fields & index.fields.tags) {
+          score += index.boosts.tags;
+        }
+        termScores.set(document, score);
+      }
+      if (scores === null) {
+        scores = termScores;
+      } else {
+        for (const [document, score] of scores) {
+          if (termScores.has(document)) {
+            scores.set(document, score + termScores.get(document));
+          } else {
+            scores.delete(document);
+          }
+        }
+      }
+    }
+
+    return Array.from(scores, ([document, score]) => ({
+      url: index.documents[document][0],
+      title: index.documents[document][1],
+      score,
+    })).sort((a, b) => b.score - a.score);
+  }
+
+  window.micrositeSearch = micrositeSearch;
+})();
@@ -0,0 +1,379 @@
+"""
+Module for building a full-text search index of a site's pages, which browsers can query without any
+server-side search service.
+
+The index is split into small shards by the first characters of each term, so that a browser only
+has to download the shards containing the terms it is searching for. Everything lives in one
+directory in the build:
+
+- ``index.json``: The index's format version, how terms are sharded, how much matches in each field
+  count for, and the list of documents (each one's URL and title). Documents are numbered by their
+  position in this list.
+- ``<prefix>.bin``: One shard for each distinct prefix, named by the hexadecimal UTF-8 encoding of
+  the prefix (``ap`` becomes ``6170.bin``).
+
+Shards are a sequence of unsigned LEB128 variable-length integers ("varints"). A shard holds the
+number of terms in it, followed by each term in sorted order:
+
+- The length of the term in UTF-8 bytes, followed by those bytes.
+- The number of documents containing the term, followed by a posting for each, in order of document
+  number. Each posting holds the difference between its document number and the previous posting's
+  (the first is relative to zero), a bit field of the fields the term appears in (see ``FIELDS``),
+  and the number of times the term appears in the body, followed by the difference between each
+  position and the one before it.
+"""
+
+import html
+import json
+import logging
+import re
+
+from pathlib import Path
+
+log = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+INDEX_FILENAME = 'index.json'
+
+# Fields a term can appear in, mapped to the bit which marks them in a posting
+FIELDS = {'body': 1, 'title': 2, 'tags': 4}
+
+# How much more a match in each field counts for than a single match in the body
+DEFAULT_BOOSTS = {'title': 10, 'tags': 5}
+
+# Terms are runs of letters and digits; longer ones are cut short to keep shards compact
+TERM_PATTERN = re.compile(r'[^\W_]+')
+MAX_TERM_LENGTH = 32
+
+HTML_TAG = re.compile(r'<[^>]*>')
+HTML_HEADING = re.compile(r'<h1\b[^>]*>(.*?)</h1\s*>', re.IGNORECASE | re.DOTALL)
+HTML_UNINDEXED = re.compile(r'<(script|style)\b.*?</\1\s*>', re.IGNORECASE | re.DOTALL)
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Splits text into lower-case terms. Single characters are dropped, since they make poor search
+    terms.
+
+    :param text: Plain text.
+    :type text: str
+
+    :return: List of terms in the order they appear.
+    :rtype: list[str]
+    """
+
+    return [
+        term[:MAX_TERM_LENGTH]
+        for term in TERM_PATTERN.findall(text.lower())
+        if len(term) > 1 or term.isdigit()
+    ]
+
+
+def html_text(snippet: str) -> str:
+    """
+    Returns the text of an HTML snippet, without its tags or the contents of any scripts or styles.
+
+    :param snippet: HTML snippet.
+    :type snippet: str
+
+    :return: Plain text.
+    :rtype: str
+    """
+
+    return html.unescape(HTML_TAG.sub(' ', HTML_UNINDEXED.sub(' ', snippet)))
+
+
+def index_document(url: str, md_html: str, title: str = None, tags: list[str] = None) -> dict:
+    """
+    Works out which terms a page contains and where. This is run as each page is rendered, while
+    its HTML is still at hand.
+
+    :param url: URL of the page, relative to the top of the site.
+    :type url: str
+
+    :param md_html: The HTML snippet converted from the page's Markdown.
+    :type md_html: str
+
+    :param title: The page's title. When None, the text of the page's first ``<h1>`` heading is
+        used, or failing that the URL.
+    :type title: str, optional
+
+    :param tags: Terms relevant to the content of the page, from its ``index`` entry.
+    :type tags: list[str], optional
+
+    :return: Dict of the page's ``url``, ``title``, and ``terms``, which maps each term to a list of
+        its field bit field followed by the term's positions in the body.
+    :rtype: dict
+    """
+
+    if not title:
+        heading = HTML_HEADING.search(md_html)
+        title = ' '.join(html_text(heading.group(1)).split()) if heading else url
+
+    terms = {}
+    for position, term in enumerate(tokenize(html_text(md_html))):
+        if term not in terms:
+            terms[term] = [FIELDS['body']]
+        terms[term].append(position)
+    for field, text in (('title', title), ('tags', ' '.join(tags or []))):
+        for term in tokenize(text):
+            if term not in terms:
+                terms[term] = [0]
+            terms[term][0] |= FIELDS[field]
+    return {'url': url, 'title': title, 'terms': terms}
+
+
+def encode_varint(value: int, out: bytearray) -> None:
+    """
+    Appends an unsigned integer to a buffer in LEB128 encoding: seven bits per byte, least
+    significant first, with the high bit set on every byte but the last.
+    """
+
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def decode_varint(data: bytes, offset: int) -> tuple[int, int]:
+    """
+    Reads an unsigned LEB128 integer from a buffer.
+
+    :return: Tuple of the integer and the offset just past it.
+    :rtype: tuple[int, int]
+    """
+
+    value = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def encode_shard(postings: dict[str, list[tuple[int, list[int]]]]) -> bytes:
+    """
+    Encodes the postings of a shard in the format described at the top of this module.
+
+    :param postings: Dict of terms, each mapped to a list of ``(document, posting)`` tuples sorted
+        by document number, where each posting is a field bit field followed by body positions.
+    :type postings: dict[str, list[tuple[int, list[int]]]]
+
+    :return: The encoded shard.
+    :rtype: bytes
+    """
+
+    out = bytearray()
+    encode_varint(len(postings), out)
+    for term in sorted(postings):
+        encoded = term.encode()
+        encode_varint(len(encoded), out)
+        out += encoded
+        encode_varint(len(postings[term]), out)
+        previous_document = 0
+        for document, (fields, *positions) in postings[term]:
+            encode_varint(document - previous_document, out)
+            previous_document = document
+            encode_varint(fields, out)
+            encode_varint(len(positions), out)
+            previous_position = 0
+            for position in positions:
+                encode_varint(position - previous_position, out)
+                previous_position = position
+    return bytes(out)
+
+
+def decode_shard(data: bytes) -> dict[str, list[tuple[int, list[int]]]]:
+    """
+    Decodes a shard written by :py:func:`encode_shard`.
+
+    :param data: The encoded shard.
+    :type data: bytes
+
+    :return: The shard's postings, in the form :py:func:`encode_shard` takes them.
+    :rtype: dict[str, list[tuple[int, list[int]]]]
+    """
+
+    postings = {}
+    term_count, offset = decode_varint(data, 0)
+    for _ in range(term_count):
+        length, offset = decode_varint(data, offset)
+        term = data[offset : offset + length].decode()
+        offset += length
+        document_count, offset = decode_varint(data, offset)
+        document = 0
+        postings[term] = []
+        for _ in range(document_count):
+            delta, offset = decode_varint(data, offset)
+            document += delta
+            fields, offset = decode_varint(data, offset)
+            position_count, offset = decode_varint(data, offset)
+            posting = [fields]
+            position = 0
+            for _ in range(position_count):
+                delta, offset = decode_varint(data, offset)
+                position += delta
+                posting.append(position)
+            postings[term].append((document, posting))
+    return postings
+
+
+def shard_name(term: str, prefix_length: int) -> str:
+    """
+    Returns the name of the shard file a term belongs in.
+
+    :param term: A term in the index.
+    :type term: str
+
+    :param prefix_length: Number of leading characters of a term which decide its shard.
+    :type prefix_length: int
+
+    :return: Filename of the shard.
+    :rtype: str
+    """
+
+    return f'{term[:prefix_length].encode().hex()}.bin'
+
+
+class SearchIndex:
+    """
+    A search index of a site's pages, kept up to date one page at a time. The documents the index is
+    built from are cached between builds, so an incremental build only has to index the pages which
+    changed.
+
+    :param prefix_length: Number of leading characters of a term which decide its shard. Longer
+        prefixes make for more, smaller shards. Defaults to 2.
+    :type prefix_length: int, optional
+
+    :param boosts: How much a match in the ``title`` and ``tags`` fields counts for, relative to a
+        single match in the body. Defaults to ``DEFAULT_BOOSTS``.
+    :type boosts: dict, optional
+
+    :param cache_file: File to keep the indexed documents in between builds. When None, nothing is
+        cached on disk. Defaults to None.
+    :type cache_file: str | Path, optional
+    """
+
+    def __init__(self, prefix_length: int = 2, boosts: dict = None, cache_file: str | Path = None):
+        self.prefix_length = prefix_length
+        self.boosts = dict(boosts or DEFAULT_BOOSTS)
+        self.cache_file = Path(cache_file) if cache_file else None
+        self.documents = {}
+        if self.cache_file and self.cache_file.is_file():
+            try:
+                with self.cache_file.open('r') as file:
+                    cached = json.load(file)
+                if cached.get('version') == FORMAT_VERSION:
+                    self.documents = cached['documents']
+            except (OSError, ValueError) as ex:
+                log.warning(f'Unable to read the search index cache {self.cache_file}: {ex}')
+
+    def add(self, path: str, document: dict) -> None:
+        """
+        Adds a page to the index, replacing any earlier version of it.
+
+        :param path: Source path of the page.
+        :type path: str
+
+        :param document: The page's document, as returned by :py:func:`index_document`.
+        :type document: dict
+        """
+
+        self.documents[path] = document
+
+    def retain(self, paths: list[str]) -> None:
+        """
+        Removes every page from the index except those given, such as pages which have been deleted.
+
+        :param paths: Source paths of the pages to keep.
+        :type paths: list[str]
+        """
+
+        keep = set(paths)
+        for path in [path for path in self.documents if path not in keep]:
+            del self.documents[path]
+
+    def save_cache(self) -> None:
+        """
+        Writes the indexed documents to the cache file, if there is one.
+        """
+
+        if not self.cache_file:
+            return
+        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        partial = self.cache_file.with_name(f'{self.cache_file.name}.tmp')
+        with partial.open('w') as file:
+            json.dump({'version': FORMAT_VERSION, 'documents': self.documents}, file)
+        partial.replace(self.cache_file)
+
+    def shards(self) -> dict[str, bytes]:
+        """
+        Encodes the index into shards.
+
+        :return: Dict of shard filenames mapped to their contents.
+        :rtype: dict[str, bytes]
+        """
+
+        postings = {}
+        for number, path in enumerate(sorted(self.documents)):
+            for term, posting in self.documents[path]['terms'].items():
+                shard = postings.setdefault(shard_name(term, self.prefix_length), {})
+                shard.setdefault(term, []).append((number, posting))
+        return {name: encode_shard(shard) for name, shard in postings.items()}
+
+    def metadata(self) -> dict:
+        """
+        Returns the contents of the index's ``index.json`` file.
+
+        :return: Dict of the format version, sharding and scoring settings, and documents.
+        :rtype: dict
+        """
+
+        return {
+            'version': FORMAT_VERSION,
+            'prefix_length': self.prefix_length,
+            'max_term_length': MAX_TERM_LENGTH,
+            'fields': FIELDS,
+            'boosts': self.boosts,
+            'documents': [
+                [self.documents[path]['url'], self.documents[path]['title']]
+                for path in sorted(self.documents)
+            ],
+        }
+
+    def write(self, target_dir: str | Path) -> list[str]:
+        """
+        Writes the index into a directory, replacing any index already there. Files whose contents
+        have not changed are left alone, so they keep their modification times and can be reused by
+        later steps of the build, like compression.
+
+        :param target_dir: Directory to write the index into.
+        :type target_dir: str | Path
+
+        :return: Names of the files making up the index.
+        :rtype: list[str]
+        """
+
+        target_dir = Path(target_dir)
+        target_dir.mkdir(parents=True, exist_ok=True)
+        files = self.shards()
+        files[INDEX_FILENAME] = json.dumps(self.metadata(), separators=(',', ':')).encode()
+
+        written = 0
+        for name, data in files.items():
+            target = target_dir / name
+            if target.is_file() and target.read_bytes() == data:
+                continue
+            # Remove the old file rather than overwrite it, since it may be hard linked into an
+            # earlier build
+            target.unlink(missing_ok=True)
+            target.write_bytes(data)
+            written += 1
+        log.info(
+            f'Indexed {len(self.documents)} pages for search in {len(files) - 1} shards; '
+            f'{written} files changed.'
+        )
+        return sorted(files)
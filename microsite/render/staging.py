@@ -0,0 +1,250 @@
+"""
+Module for building a site in a staging directory and swapping it into place once it is complete, so
+that the target directory always holds a whole, working build.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import functools
+import logging
+import os
+import shutil
+
+from datetime import datetime
+from microsite.filecopy import copy_file
+from pathlib import Path
+
+log = logging.getLogger(__name__)
+
+BUILDS_SUFFIX = '.builds'
+STAGING_NAME = 'staging'
+
+# From <fcntl.h> and <linux/fs.h>
+AT_FDCWD = -100
+RENAME_EXCHANGE = 2
+
+
+def builds_dir(target_dir: str | Path) -> Path:
+    """
+    Returns the directory holding the staging directory and any earlier builds kept for rollback.
+    This sits next to the target directory (``output/`` uses ``output.builds/``), so that builds can
+    be moved in and out of place with a rename.
+
+    :param target_dir: The build's target directory.
+    :type target_dir: str | Path
+
+    :return: Path to the builds directory.
+    :rtype: Path
+    """
+
+    target_dir = Path(target_dir)
+    return target_dir.with_name(f'{target_dir.name}{BUILDS_SUFFIX}')
+
+
+def kept_builds(target_dir: str | Path) -> list[Path]:
+    """
+    Returns the earlier builds kept for rollback, oldest first.
+
+    :param target_dir: The build's target directory.
+    :type target_dir: str | Path
+
+    :return: List of paths to kept builds.
+    :rtype: list[Path]
+    """
+
+    builds = builds_dir(target_dir)
+    if not builds.is_dir():
+        return []
+    return sorted(
+        entry for entry in builds.iterdir() if entry.is_dir() and entry.name != STAGING_NAME
+    )
+
+
+def prepare_staging(target_dir: str | Path, seed: bool = False) -> Path:
+    """
+    Creates an empty staging directory to build into, removing any left behind by a build which was
+    interrupted.
+
+    :param target_dir: The build's target directory.
+    :type target_dir: str | Path
+
+    :param seed: When True, fill the staging directory with hard links to every file in the target
+        directory, so that an incremental build only has to replace what has changed. Where hard
+        links are not supported, the files are copied instead. Defaults to False.
+    :type seed: bool, optional
+
+    :return: Path to the staging directory.
+    :rtype: Path
+    """
+
+    staging = builds_dir(target_dir) / STAGING_NAME
+    if staging.exists():
+        log.debug(f'Removing incomplete build {staging}')
+        shutil.rmtree(staging)
+    staging.parent.mkdir(parents=True, exist_ok=True)
+
+    if seed:
+        log.debug(f'Seeding {staging} from {target_dir}')
+        shutil.copytree(
+            target_dir,
+            staging,
+            symlinks=True,
+            copy_function=functools.partial(copy_file, strategy='hardlink', skip_unchanged=False),
+        )
+    else:
+        staging.mkdir()
+    return staging
+
+
+def discard_staging(target_dir: str | Path) -> None:
+    """
+    Deletes the staging directory, such as after a build fails, along with the builds directory if
+    nothing else is left in it.
+
+    :param target_dir: The build's target directory.
+    :type target_dir: str | Path
+    """
+
+    shutil.rmtree(builds_dir(target_dir) / STAGING_NAME, ignore_errors=True)
+    remove_empty_builds_dir(target_dir)
+
+
+def remove_empty_builds_dir(target_dir: str | Path) -> None:
+    """
+    Deletes the builds directory if it holds no staging directory and no kept builds, so a site
+    with no earlier builds to roll back to leaves nothing behind next to its target directory.
+
+    :param target_dir: The build's target directory.
+    :type target_dir: str | Path
+    """
+
+    builds = builds_dir(target_dir)
+    try:
+        builds.rmdir()
+    except OSError:
+        # It does not exist, or is not empty
+        return
+    log.debug(f'Removed the empty builds directory {builds}')
+
+
+def exchange_paths(first: str | Path, second: str | Path) -> None:
+    """
+    Atomically swaps two paths using the Linux ``renameat2`` system call, so that there is no moment
+    when either path does not exist.
+
+    :param first: A file or directory.
+    :type first: str | Path
+
+    :param second: Another file or directory on the same file system.
+    :type second: str | Path
+
+    :raises OSError: When the swap fails, including when this system does not support it.
+    """
+
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        renameat2 = libc.renameat2
+    except (OSError, AttributeError, TypeError):
+        raise OSError(errno.ENOSYS, 'renameat2 is not available on this system')
+    renameat2.argtypes = [
+        ctypes.c_int,
+        ctypes.c_char_p,
+        ctypes.c_int,
+        ctypes.c_char_p,
+        ctypes.c_uint,
+    ]
+    result = renameat2(AT_FDCWD, os.fsencode(first), AT_FDCWD, os.fsencode(second), RENAME_EXCHANGE)
+    if result != 0:
+        error = ctypes.get_errno()
+        raise OSError(error, os.strerror(error), str(first), None, str(second))
+
+
+def swap_in(build: str | Path, target_dir: str | Path, retired: str | Path) -> bool:
+    """
+    Moves a finished build into the target directory, moving the build it replaces to ``retired``.
+    Where the system supports it, the two are exchanged atomically. Otherwise the old build is
+    renamed out of the way and the new one renamed into place, leaving the target directory missing
+    for an instant.
+
+    :param build: The finished build.
+    :type build: str | Path
+
+    :param target_dir: The build's target directory.
+    :type target_dir: str | Path
+
+    :param retired: Where to move the build being replaced. Must not exist.
+    :type retired: str | Path
+
+    :return: True if there was a build to replace.
+    :rtype: bool
+    """
+
+    build, target_dir, retired = Path(build), Path(target_dir), Path(retired)
+    if not target_dir.exists():
+        build.rename(target_dir)
+        return False
+
+    retired.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        exchange_paths(build, target_dir)
+    except OSError as ex:
+        log.debug(f'Unable to swap builds atomically ({ex}); renaming them instead.')
+        target_dir.rename(retired)
+        build.rename(target_dir)
+    else:
+        build.rename(retired)
+    return True
+
+
+def publish_build(staging: str | Path, target_dir: str | Path, keep_builds: int = 1) -> None:
+    """
+    Swaps a finished build into the target directory and keeps the build it replaces for rollback.
+    Only the newest ``keep_builds`` earlier builds are kept.
+
+    :param staging: The finished build.
+    :type staging: str | Path
+
+    :param target_dir: The build's target directory.
+    :type target_dir: str | Path
+
+    :param keep_builds: Number of earlier builds to keep. Defaults to 1.
+    :type keep_builds: int, optional
+    """
+
+    retired = builds_dir(target_dir) / datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+    if swap_in(staging, target_dir, retired):
+        log.debug(f'Moved the previous build to {retired}')
+
+    builds = kept_builds(target_dir)
+    for build in builds[: max(len(builds) - keep_builds, 0)]:
+        log.debug(f'Removing old build {build}')
+        shutil.rmtree(build)
+    remove_empty_builds_dir(target_dir)
+
+
+def rollback(target_dir: str | Path) -> Path:
+    """
+    Replaces the build in the target directory with the newest build kept by
+    :py:func:`publish_build`. The replaced build is deleted, so rolling back again goes back one
+    more build.
+
+    :param target_dir: The build's target directory.
+    :type target_dir: str | Path
+
+    :raises IOError: When there is no earlier build to roll back to.
+
+    :return: Path the restored build was kept at.
+    :rtype: Path
+    """
+
+    builds = kept_builds(target_dir)
+    if not builds:
+        raise IOError(f'There are no earlier builds of {target_dir} to roll back to.')
+    restored = builds[-1]
+    discarded = builds_dir(target_dir) / f'{restored.name}.discarded'
+    log.info(f'Rolling {target_dir} back to the build kept at {restored}')
+    if swap_in(restored, target_dir, discarded):
+        shutil.rmtree(discarded)
+    remove_empty_builds_dir(target_dir)
+    return restored
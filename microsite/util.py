@@ -1,59 +1,64 @@
+import hashlib
+import json
 import logging
 
+from pathlib import Path
+
 log = logging.getLogger(__name__)
 
+HASH_CHUNK_SIZE = 1024 * 1024
 
-class AttrDict(dict):
-    """
-    A dict that also acts like a namespace, allowing access to its values using dot notation as
-    though they were any other Python object attributes.
+
+class Engine:
     """
+    All of the tools here fall into different run modes, such as "render" and "publish". Each of
+    these implements different kinds of "engines" to power those tools. This is the base class for
+    those engines' base classes, containing a name and the engine's settings.
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        for arg in args:
-            if type(arg) is dict:
-                for key, value in arg.items():
-                    self.__setitem__(key, value)
+    :param name: The name of the engine.
+    :type name: str
 
-    def __getattr__(self, attr):
-        attr = self.get(attr)
-        if type(attr) is dict:
-            return AttrDict(attr)
-        return attr
+    :param config: The engine's settings.
+    :type config: microsite.config.ConfigSection
 
-    def __setattr__(self, key, value):
-        self.__setitem__(key, value)
+    """
 
-    def __setitem__(self, key, value):
-        super().__setitem__(key, value)
-        if type(value) is dict:
-            self.__dict__.update({key: AttrDict(value)})
-        else:
-            self.__dict__.update({key: value})
+    def __init__(self, name: str, config):
+        self.name = name
+        self.config = config
 
-    def __delattr__(self, key):
-        self.__delitem__(key)
 
-    def __delitem__(self, key):
-        super().__delitem__(key)
-        del self.__dict__[key]
+def hash_file(path: str | Path) -> str:
+    """
+    Returns the SHA-256 digest of a file's contents, reading the file in chunks so that large assets
+    do not have to be held in memory.
 
+    :param path: Path to the file to hash.
+    :type path: str | Path
 
-class Engine:
+    :return: Hexadecimal SHA-256 digest of the file's contents.
+    :rtype: str
     """
-    All of the tools here fall into different run modes, such as "render" and "publish". Each of
-    these implements different kinds of "engines" to power those tools. This is the base class for
-    those engines' base classes, containing a name and an arbitrary config dict.
 
-    :param name: The name of the engine.
-    :type name: str
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        while chunk := file.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
 
-    :param config: A dict containing operating parameters for this engine.
-    :type config: dict
 
+def hash_data(data) -> str:
     """
+    Returns the SHA-256 digest of any JSON-serializable data structure. Keys are sorted before
+    hashing so that equivalent dicts always produce the same digest. Values which cannot be
+    serialized are converted to strings.
 
-    def __init__(self, name: str, config: AttrDict):
-        self.name = name
-        self.config = config
+    :param data: The data to hash.
+    :type data: any
+
+    :return: Hexadecimal SHA-256 digest of the data.
+    :rtype: str
+    """
+
+    serialized = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
@@ -0,0 +1,326 @@
+"""
+Module for watching a project's files and rebuilding the site whenever they change.
+"""
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import sys
+import time
+
+from abc import ABC, abstractmethod
+from collections.abc import Callable
+from pathlib import Path
+
+log = logging.getLogger(__name__)
+
+# inotify constants, from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_WATCH_MASK = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+)
+INOTIFY_EVENT = struct.Struct('iIII')
+
+
+class Watcher(ABC):
+    """
+    Abstract class for watchers, which report changes to a set of files and directories. Directories
+    are watched recursively.
+
+    :param paths: Files and directories to watch.
+    :type paths: list[str]
+
+    :param ignore: Directories whose contents should never be reported, such as the render target.
+    :type ignore: list[str], optional
+    """
+
+    def __init__(self, paths: list[str], ignore: list[str] = None):
+        self.paths = [Path(path).resolve() for path in paths]
+        self.ignore = [Path(path).resolve() for path in ignore or []]
+
+    def is_ignored(self, path: Path) -> bool:
+        return any(path == ignored or ignored in path.parents for ignored in self.ignore)
+
+    @abstractmethod
+    def changes(self, timeout: float = None) -> set[str]:
+        """
+        Waits for files to change and returns the paths which did.
+
+        :param timeout: Maximum number of seconds to wait. When None, waits indefinitely.
+        :type timeout: float, optional
+
+        :return: Set of changed paths. Empty if nothing changed before the timeout.
+        :rtype: set[str]
+        """
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class InotifyWatcher(Watcher):
+    """
+    Watches files using the Linux inotify API, so changes are reported as soon as they happen
+    without repeatedly scanning the file system. Directories created after watching begins are
+    watched as well.
+
+    :raises OSError: If inotify is not available on this system.
+    """
+
+    def __init__(self, paths: list[str], ignore: list[str] = None):
+        super().__init__(paths=paths, ignore=ignore)
+
+        libc_name = ctypes.util.find_library('c')
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError('inotify is not available on this system')
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+
+        # Watch descriptor -> (directory, names of interest in it or None for everything)
+        self.watches = {}
+        for path in self.paths:
+            if path.is_dir():
+                self.watch_tree(path)
+            else:
+                self.watch_dir(path.parent, name=path.name)
+
+    def watch_dir(self, directory: Path, name: str = None) -> None:
+        wd = self._add_watch(self.fd, os.fsencode(directory), IN_WATCH_MASK)
+        if wd < 0:
+            log.warning(f'Unable to watch {directory}: {os.strerror(ctypes.get_errno())}')
+            return
+        _watched_dir, names = self.watches.get(wd, (directory, set()))
+        if name is None or names is None:
+            names = None
+        else:
+            names.add(name)
+        self.watches[wd] = (directory, names)
+
+    def watch_tree(self, directory: Path) -> None:
+        for dirpath, dirnames, _filenames in os.walk(directory):
+            if self.is_ignored(Path(dirpath)):
+                dirnames.clear()
+                continue
+            self.watch_dir(Path(dirpath))
+
+    def changes(self, timeout: float = None) -> set[str]:
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+
+        changed = set()
+        data = os.read(self.fd, 64 * 1024)
+        offset = 0
+        while offset < len(data):
+            wd, mask, _cookie, length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            name = os.fsdecode(data[offset : offset + length].rstrip(b'\0'))
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost, so report everything as changed
+                log.debug('The inotify event queue overflowed.')
+                changed.update(str(path) for path in self.paths)
+                continue
+            if wd not in self.watches:
+                continue
+            directory, names = self.watches[wd]
+            if names is not None and name not in names:
+                continue
+            path = directory / name if name else directory
+            if self.is_ignored(path):
+                continue
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                self.watch_tree(path)
+            changed.add(str(path))
+        return changed
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class PollingWatcher(Watcher):
+    """
+    Watches files by scanning them at a regular interval and comparing their modification times and
+    sizes. This works everywhere, but is slower to notice changes and costs more to run on large
+    source trees than :py:class:`InotifyWatcher`.
+
+    :param interval: Number of seconds between scans. Defaults to 0.5.
+    :type interval: float, optional
+    """
+
+    def __init__(self, paths: list[str], ignore: list[str] = None, interval: float = 0.5):
+        super().__init__(paths=paths, ignore=ignore)
+        self.interval = interval
+        self.snapshot = self.scan()
+
+    def scan(self) -> dict[str, tuple[int, int]]:
+        snapshot = {}
+        for path in self.paths:
+            if path.is_dir():
+                for dirpath, dirnames, filenames in os.walk(path):
+                    if self.is_ignored(Path(dirpath)):
+                        dirnames.clear()
+                        continue
+                    for filename in filenames:
+                        self.stat_into(snapshot, os.path.join(dirpath, filename))
+            else:
+                self.stat_into(snapshot, str(path))
+        return snapshot
+
+    def stat_into(self, snapshot: dict, path: str) -> None:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+
+    def changes(self, timeout: float = None) -> set[str]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            snapshot = self.scan()
+            changed = {
+                path
+                for path in snapshot.keys() | self.snapshot.keys()
+                if snapshot.get(path) != self.snapshot.get(path)
+            }
+            self.snapshot = snapshot
+            if changed:
+                return changed
+
+            wait = self.interval
+            if deadline is not None:
+                wait = min(wait, deadline - time.monotonic())
+                if wait <= 0:
+                    return set()
+            time.sleep(wait)
+
+
+def get_watcher(
+    paths: list[str], ignore: list[str] = None, poll: bool = False, interval: float = 0.5
+) -> Watcher:
+    """
+    Returns an :py:class:`InotifyWatcher` if inotify is available on this system, or a
+    :py:class:`PollingWatcher` otherwise.
+
+    :param paths: Files and directories to watch.
+    :type paths: list[str]
+
+    :param ignore: Directories whose contents should never be reported.
+    :type ignore: list[str], optional
+
+    :param poll: When True, always use a :py:class:`PollingWatcher`. Defaults to False.
+    :type poll: bool, optional
+
+    :param interval: Number of seconds between scans when polling. Defaults to 0.5.
+    :type interval: float, optional
+
+    :return: A watcher for the given paths.
+    :rtype: Watcher
+    """
+
+    if not poll and sys.platform.startswith('linux'):
+        try:
+            watcher = InotifyWatcher(paths=paths, ignore=ignore)
+            log.info('Watching for changes with inotify.')
+            return watcher
+        except (OSError, AttributeError) as ex:
+            log.info(f'inotify is unavailable ({ex}); falling back to polling.')
+    log.info(f'Watching for changes by polling every {interval} seconds.')
+    return PollingWatcher(paths=paths, ignore=ignore, interval=interval)
+
+
+def watch(
+    rebuild: Callable[[], None],
+    paths: list[str],
+    ignore: list[str] = None,
+    debounce: float = 0.2,
+    poll: bool = False,
+    interval: float = 0.5,
+) -> None:
+    """
+    Runs ``rebuild`` once, then again each time any of the watched paths change, until interrupted.
+    Changes which arrive in a burst (such as an editor writing several files on save) are gathered
+    up until no new changes have arrived for ``debounce`` seconds, then handled by a single rebuild.
+    The time taken by each rebuild is logged. A failed rebuild is logged, and watching continues.
+
+    The changed paths are only logged, not handed to ``rebuild``. An incremental render works out
+    for itself which files need rendering again by comparing the sources against the build manifest,
+    which also catches changes the watcher did not see, such as those made while a rebuild ran.
+
+    :param rebuild: Function which rebuilds the site. It takes no arguments.
+    :type rebuild: Callable
+
+    :param paths: Files and directories to watch.
+    :type paths: list[str]
+
+    :param ignore: Directories whose contents should never trigger a rebuild, such as the render
+        target.
+    :type ignore: list[str], optional
+
+    :param debounce: Number of seconds without changes to wait before rebuilding. Defaults to 0.2.
+    :type debounce: float, optional
+
+    :param poll: When True, poll for changes even if inotify is available. Defaults to False.
+    :type poll: bool, optional
+
+    :param interval: Number of seconds between scans when polling. Defaults to 0.5.
+    :type interval: float, optional
+    """
+
+    run_rebuild(rebuild)
+    watcher = get_watcher(paths=paths, ignore=ignore, poll=poll, interval=interval)
+    try:
+        while True:
+            changed = watcher.changes()
+            first_change = time.perf_counter()
+            while more := watcher.changes(timeout=debounce):
+                changed.update(more)
+            log.info(f'Detected changes to {len(changed)} file(s). Rebuilding.')
+            for path in sorted(changed):
+                log.debug(f'Changed: {path}')
+            run_rebuild(rebuild, first_change=first_change)
+    except KeyboardInterrupt:
+        log.info('Stopped watching.')
+    finally:
+        watcher.close()
+
+
+def run_rebuild(rebuild: Callable[[], None], first_change: float = None) -> None:
+    start = time.perf_counter()
+    try:
+        rebuild()
+    except Exception as ex:
+        log.error(f'Rebuild failed: {ex}', exc_info=log.isEnabledFor(logging.DEBUG))
+        return
+    end = time.perf_counter()
+    message = f'Rebuilt in {(end - start) * 1000:.0f} ms'
+    if first_change is not None:
+        message += f' ({(end - first_change) * 1000:.0f} ms after the first change)'
+    log.info(message)
@@ -0,0 +1,96 @@
+"""
+Fixtures shared by the tests. AWS is stood in for by moto, so no test needs an account or network
+access.
+"""
+
+import boto3
+import pytest
+
+from moto import mock_aws
+
+# Region and bucket the AWS fixtures are set up in
+REGION = 'us-east-1'
+BUCKET = 'microsite-test'
+
+
+@pytest.fixture
+def aws(monkeypatch):
+    """
+    Runs the test against moto's stand-in for AWS, with fake credentials so nothing can reach a
+    real account.
+    """
+
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    monkeypatch.setenv('AWS_SECURITY_TOKEN', 'testing')
+    monkeypatch.setenv('AWS_SESSION_TOKEN', 'testing')
+    monkeypatch.setenv('AWS_DEFAULT_REGION', REGION)
+    monkeypatch.delenv('AWS_PROFILE', raising=False)
+    with mock_aws():
+        yield
+
+
+@pytest.fixture
+def s3_client(aws):
+    """
+    An S3 client, with an empty ``BUCKET`` to publish into.
+    """
+
+    client = boto3.client('s3', region_name=REGION)
+    client.create_bucket(Bucket=BUCKET)
+    return client
+
+
+@pytest.fixture
+def cloudfront_client(aws):
+    """
+    A CloudFront client.
+    """
+
+    return boto3.client('cloudfront', region_name=REGION)
+
+
+@pytest.fixture
+def distribution_id(cloudfront_client) -> str:
+    """
+    ID of a CloudFront distribution serving ``BUCKET``.
+    """
+
+    origin_id = f's3-{BUCKET}'
+    response = cloudfront_client.create_distribution(
+        DistributionConfig={
+            'CallerReference': 'microsite-test',
+            'Comment': '',
+            'Enabled': True,
+            'Origins': {
+                'Quantity': 1,
+                'Items': [
+                    {
+                        'Id': origin_id,
+                        'DomainName': f'{BUCKET}.s3.amazonaws.com',
+                        'S3OriginConfig': {'OriginAccessIdentity': ''},
+                    }
+                ],
+            },
+            'DefaultCacheBehavior': {
+                'TargetOriginId': origin_id,
+                'ViewerProtocolPolicy': 'allow-all',
+                'MinTTL': 0,
+            },
+        }
+    )
+    return response['Distribution']['Id']
+
+
+def invalidated_paths(client, distribution_id: str) -> list[list[str]]:
+    """
+    Returns the paths of each invalidation created in a distribution, oldest first.
+    """
+
+    listing = client.list_invalidations(DistributionId=distribution_id)['InvalidationList']
+    batches = []
+    for summary in listing.get('Items', []):
+        invalidation = client.get_invalidation(DistributionId=distribution_id, Id=summary['Id'])
+        batch = invalidation['Invalidation']['InvalidationBatch']
+        batches.append((batch['CallerReference'], sorted(batch['Paths'].get('Items', []))))
+    return [paths for _reference, paths in sorted(batches)]
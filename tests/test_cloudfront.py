@@ -0,0 +1,146 @@
+from conftest import BUCKET, invalidated_paths
+from microsite.publish import cloudfront
+from microsite.publish.cloudfront import invalidate, invalidation_paths
+from microsite.publish.s3sync import S3SyncPublishEngine
+
+
+def site_files(directory: str, count: int) -> list[str]:
+    prefix = f'{directory}/' if directory else ''
+    return [f'{prefix}page{number:03}.html' for number in range(count)]
+
+
+def test_nothing_changed():
+    assert invalidation_paths([], existing=site_files('', 10)) == []
+
+
+def test_changed_files_are_invalidated_by_url():
+    existing = site_files('', 10) + site_files('docs', 10)
+    changed = ['page001.html', 'docs/page002.html', 'docs/a file.html']
+    assert invalidation_paths(changed, existing) == [
+        '/docs/a%20file.html',
+        '/docs/page002.html',
+        '/page001.html',
+    ]
+
+
+def test_index_documents_are_invalidated_by_directory_url():
+    existing = site_files('', 10) + site_files('docs', 10) + ['index.html', 'docs/index.html']
+    assert invalidation_paths(['index.html', 'docs/index.html'], existing) == [
+        '/',
+        '/docs/',
+        '/docs/index.html',
+        '/index.html',
+    ]
+    assert invalidation_paths(['docs/default.htm'], existing, index_document='default.htm') == [
+        '/docs/',
+        '/docs/default.htm',
+    ]
+
+
+def test_mostly_changed_directories_collapse_into_wildcards():
+    existing = site_files('', 10) + site_files('docs', 4) + site_files('blog', 4)
+    changed = ['page000.html', 'docs/page000.html', 'docs/page001.html', 'blog/page000.html']
+    assert invalidation_paths(changed, existing) == [
+        '/blog/page000.html',
+        '/docs/*',
+        '/page000.html',
+    ]
+    assert invalidation_paths(changed, existing, wildcard_ratio=0.6) == [
+        '/blog/page000.html',
+        '/docs/page000.html',
+        '/docs/page001.html',
+        '/page000.html',
+    ]
+
+
+def test_wildcards_only_replace_two_or_more_paths():
+    existing = site_files('', 10) + ['docs/only.html']
+    assert invalidation_paths(['docs/only.html'], existing) == ['/docs/only.html']
+
+
+def test_deepest_directories_collapse_first():
+    existing = site_files('', 10) + site_files('docs', 10) + site_files('docs/api', 4)
+    changed = site_files('docs/api', 4)
+    assert invalidation_paths(changed, existing) == ['/docs/api/*']
+
+
+def test_collapsed_wildcards_absorb_those_below_them():
+    changed = site_files('docs/api', 4) + site_files('docs/guide', 4)
+    assert invalidation_paths(changed, changed) == ['/docs/*']
+    existing = changed + site_files('docs', 10)
+    assert invalidation_paths(changed, existing) == ['/docs/api/*', '/docs/guide/*']
+
+
+def test_paths_are_collapsed_to_stay_within_max_paths():
+    existing = site_files('', 10) + site_files('docs', 100)
+    changed = site_files('docs', 100)[:10]
+    assert len(invalidation_paths(changed, existing)) == 10
+    assert invalidation_paths(changed, existing, max_paths=5) == ['/docs/*']
+    assert invalidation_paths(changed + ['page000.html'], existing, max_paths=5) == ['/*']
+
+
+def test_wildcards_are_collapsed_to_stay_within_cloudfront_limit():
+    directories = [f'docs/section{number:02}' for number in range(cloudfront.MAX_WILDCARDS + 1)]
+    existing = site_files('', 10) + site_files('docs', 100)
+    changed = []
+    for directory in directories:
+        changed += site_files(directory, 2)
+    existing += changed
+
+    assert invalidation_paths(changed, existing) == ['/docs/*']
+    fitting = changed[: 2 * cloudfront.MAX_WILDCARDS]
+    assert invalidation_paths(fitting, existing) == [
+        f'/{directory}/*' for directory in directories[: cloudfront.MAX_WILDCARDS]
+    ]
+
+
+def test_invalidations_are_batched(cloudfront_client, distribution_id):
+    paths = [f'/page{number:05}.html' for number in range(2 * cloudfront.MAX_PATHS_PER_REQUEST + 1)]
+
+    ids = invalidate(cloudfront_client, distribution_id, paths)
+    assert len(ids) == 3
+    batches = invalidated_paths(cloudfront_client, distribution_id)
+    assert [len(batch) for batch in batches] == [
+        cloudfront.MAX_PATHS_PER_REQUEST,
+        cloudfront.MAX_PATHS_PER_REQUEST,
+        1,
+    ]
+    assert sorted(path for batch in batches for path in batch) == paths
+
+
+def test_s3sync_invalidates_replaced_and_deleted_objects(
+    tmp_path, s3_client, cloudfront_client, distribution_id
+):
+    source = tmp_path / 'site'
+    (source / 'docs').mkdir(parents=True)
+    for path in ['index.html', 'about.html', 'docs/index.html', 'docs/a.html', 'docs/b.html']:
+        (source / path).write_text(path)
+
+    def publish():
+        S3SyncPublishEngine(
+            name='test',
+            source_dir=str(source),
+            config={
+                'engine': 's3sync',
+                'bucket': BUCKET,
+                'cloudfront_distribution_id': distribution_id,
+            },
+            dry_run=False,
+            destroy=False,
+            client=s3_client,
+            cloudfront_client=cloudfront_client,
+        ).publish()
+
+    publish()
+    assert invalidated_paths(cloudfront_client, distribution_id) == []
+
+    (source / 'docs' / 'index.html').write_text('changed')
+    (source / 'about.html').unlink()
+    (source / 'new.html').write_text('new')
+    publish()
+    assert invalidated_paths(cloudfront_client, distribution_id) == [
+        ['/about.html', '/docs/', '/docs/index.html']
+    ]
+
+    publish()
+    assert len(invalidated_paths(cloudfront_client, distribution_id)) == 1
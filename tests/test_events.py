@@ -0,0 +1,28 @@
+import logging
+
+from microsite.publish import events, parallel
+from microsite.publish.events import PulumiOperationLog
+from microsite.publish.parallel import TargetLogFilter
+from pulumi.automation.events import EngineEvent
+
+
+def test_logged_progress_names_the_target(tmp_path, monkeypatch, caplog):
+    monkeypatch.setattr(events, 'PROGRESS_INTERVAL', 0)
+    operation_log = PulumiOperationLog(
+        target='docs',
+        operation='up',
+        log_file=str(tmp_path / 'pulumi.log'),
+        error_log_file=str(tmp_path / 'pulumi-error.log'),
+        live=False,
+    )
+    caplog.set_level(logging.INFO, logger=events.__name__)
+    with operation_log:
+        operation_log.on_event(EngineEvent(sequence=1, timestamp=0))
+
+    record = next(record for record in caplog.records if 'resources done' in record.msg)
+    assert record.getMessage().startswith('[docs] Pulumi up: 0 resources done')
+
+    # The message is not prefixed again when it is logged while publishing a target
+    monkeypatch.setattr(parallel._current, 'target', 'docs', raising=False)
+    TargetLogFilter().filter(record)
+    assert record.getMessage().startswith('[docs] Pulumi up')
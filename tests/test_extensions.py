@@ -0,0 +1,19 @@
+from microsite.render.extensions import rewrite_md_links, rewrite_md_url
+
+
+def test_rewrite_md_url():
+    assert rewrite_md_url('page.md') == 'page.html'
+    assert rewrite_md_url('../docs/page.md?x=1#top') == '../docs/page.html?x=1#top'
+    assert rewrite_md_url('https://example.com/README.md') == 'https://example.com/README.md'
+    assert rewrite_md_url('notes.mdx') == 'notes.mdx'
+
+
+def test_rewrite_md_links_only_rewrites_links():
+    html = (
+        '<nav><a class="x" href="b.md">B</a> <A HREF=c.md#x>C</A> '
+        '<a href=\'{{ base }}/d.md\'>D</a> <img src="e.md"> b.md</nav>'
+    )
+    assert rewrite_md_links(html) == (
+        '<nav><a class="x" href="b.html">B</a> <A HREF=c.html#x>C</A> '
+        '<a href=\'{{ base }}/d.html\'>D</a> <img src="e.md"> b.md</nav>'
+    )
@@ -0,0 +1,142 @@
+import gzip
+
+from conftest import invalidated_paths
+from microsite.publish.s3 import TbPulumiS3Website
+from microsite.render.assets import ASSET_MANIFEST_FILENAME
+from microsite.render.manifest import MANIFEST_FILENAME
+from pulumi.automation import events
+
+BUCKET_OBJECT = 'aws:s3/bucketObject:BucketObject'
+
+
+def step_event(op: events.OpType, key: str, resource_type: str = BUCKET_OBJECT):
+    """
+    Returns the engine event Pulumi reports when it starts a step on a resource.
+    """
+
+    urn = f'urn:pulumi:test::microsite::{resource_type}::{key}'
+    state = events.StepEventStateMetadata(
+        type=resource_type, urn=urn, id=key, parent='', provider='', inputs={'key': key}
+    )
+    creating = op in (events.OpType.CREATE, events.OpType.CREATE_REPLACEMENT)
+    metadata = events.StepEventMetadata(
+        op=op,
+        urn=urn,
+        type=resource_type,
+        provider='',
+        old=None if creating else state,
+        new=None if op == events.OpType.DELETE else state,
+    )
+    return events.EngineEvent(
+        sequence=1, timestamp=0, resource_pre_event=events.ResourcePreEvent(metadata=metadata)
+    )
+
+
+def make_engine(tmp_path, **settings):
+    source = tmp_path / 'site'
+    if not source.exists():
+        (source / 'docs').mkdir(parents=True)
+        for path in ['index.html', 'docs/index.html', 'docs/a.html', 'docs/b.html', 'docs/c.html']:
+            (source / path).write_text(path)
+    config = {
+        'engine': 'tbp_s3website',
+        'pulumi_state_backend': 's3',
+        'pulumi_stack_name': 'test',
+        'pulumi_work_dir': str(tmp_path / 'pulumi'),
+        'pulumi_cache_dir': str(tmp_path / 'cache'),
+        **settings,
+    }
+    return TbPulumiS3Website('test', str(source), config, dry_run=False, destroy=False)
+
+
+def test_changed_and_deleted_bucket_objects_are_invalidated(
+    tmp_path, cloudfront_client, distribution_id
+):
+    engine = make_engine(tmp_path)
+    engine.on_engine_event(step_event(events.OpType.UPDATE, 'docs/index.html'))
+    engine.on_engine_event(step_event(events.OpType.DELETE, 'old.html'))
+    engine.on_engine_event(step_event(events.OpType.CREATE, 'docs/new.html'))
+    engine.on_engine_event(step_event(events.OpType.SAME, 'docs/a.html'))
+    engine.on_engine_event(step_event(events.OpType.UPDATE, 'site', 'aws:s3/bucket:Bucket'))
+    engine.on_engine_event(events.EngineEvent(sequence=2, timestamp=0))
+
+    engine.deployed({}, {'cloudfront_distribution_id': distribution_id})
+    assert invalidated_paths(cloudfront_client, distribution_id) == [
+        ['/docs/', '/docs/index.html', '/old.html']
+    ]
+
+
+def test_replaced_bucket_objects_are_invalidated_under_their_old_key(
+    tmp_path, cloudfront_client, distribution_id
+):
+    engine = make_engine(tmp_path)
+    engine.on_engine_event(step_event(events.OpType.CREATE_REPLACEMENT, 'docs/a.html'))
+    engine.on_engine_event(step_event(events.OpType.REPLACE, 'docs/a.html'))
+    engine.on_engine_event(step_event(events.OpType.DELETE_REPLACED, 'docs/a.html'))
+
+    engine.deployed({}, {'cloudfront_distribution_id': distribution_id})
+    assert invalidated_paths(cloudfront_client, distribution_id) == [['/docs/a.html']]
+
+
+def test_nothing_is_invalidated_without_changes_or_when_turned_off(
+    tmp_path, cloudfront_client, distribution_id
+):
+    engine = make_engine(tmp_path)
+    engine.on_engine_event(step_event(events.OpType.CREATE, 'docs/new.html'))
+    engine.deployed({}, {'cloudfront_distribution_id': distribution_id})
+
+    engine = make_engine(tmp_path, invalidate_cache=False)
+    engine.on_engine_event(step_event(events.OpType.UPDATE, 'docs/index.html'))
+    engine.deployed({}, {'cloudfront_distribution_id': distribution_id})
+    assert invalidated_paths(cloudfront_client, distribution_id) == []
+
+
+def test_content_is_not_exported_as_a_stack_output(tmp_path):
+    engine = make_engine(tmp_path)
+    assert list(engine.stack_outputs('fingerprint')) == ['microsite_fingerprint']
+
+
+def uploaded_files(engine) -> dict:
+    return {
+        path.relative_to(engine.upload_dir).as_posix(): path.read_text()
+        for path in engine.upload_dir.rglob('*')
+        if path.is_file()
+    }
+
+
+def test_upload_dir_holds_only_the_files_to_publish(tmp_path):
+    engine = make_engine(tmp_path)
+    source = tmp_path / 'site'
+    (source / MANIFEST_FILENAME).write_text('{}')
+    (source / ASSET_MANIFEST_FILENAME).write_text('{}')
+    (source / 'index.html.gz').write_bytes(gzip.compress(b'index.html'))
+
+    engine.construct_upload_dir()
+    assert uploaded_files(engine) == {
+        'index.html': 'index.html',
+        'docs/index.html': 'docs/index.html',
+        'docs/a.html': 'docs/a.html',
+        'docs/b.html': 'docs/b.html',
+        'docs/c.html': 'docs/c.html',
+    }
+    assert (engine.upload_dir / 'index.html').samefile(source / 'index.html')
+
+    engine.ensure_work_dir()
+    engine.construct_config_stack_yaml()
+    assert f'object_dir: {engine.upload_dir}' in engine.file_config_stack_yaml.read_text()
+    assert list(engine.content()) == sorted(uploaded_files(engine))
+
+
+def test_upload_dir_follows_the_site(tmp_path):
+    make_engine(tmp_path).construct_upload_dir()
+    source = tmp_path / 'site'
+    for path in ['docs/a.html', 'docs/b.html', 'docs/c.html', 'docs/index.html']:
+        (source / path).unlink()
+    (source / 'docs').rmdir()
+    (source / 'index.html').unlink()
+    (source / 'index.html').write_text('changed')
+
+    engine = make_engine(tmp_path)
+    engine.construct_upload_dir()
+    assert uploaded_files(engine) == {'index.html': 'changed'}
+    assert not (engine.upload_dir / 'docs').exists()
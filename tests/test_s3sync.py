@@ -0,0 +1,219 @@
+import gzip
+import hashlib
+import json
+import pytest
+
+from conftest import BUCKET
+from microsite.publish import s3sync
+from microsite.publish.s3sync import SYNC_MANIFEST_KEY, S3SyncPublishEngine, s3_etag
+from microsite.render.assets import ASSET_MANIFEST_FILENAME
+from microsite.render.manifest import MANIFEST_FILENAME
+
+MIB = 2**20
+
+
+@pytest.fixture
+def site(tmp_path):
+    """
+    A rendered site to publish, with build and asset manifests and a compressed copy of its front
+    page.
+    """
+
+    source = tmp_path / 'site'
+    (source / 'docs').mkdir(parents=True)
+    (source / 'index.html').write_text('<h1>Home</h1>')
+    (source / 'index.html.gz').write_bytes(gzip.compress(b'<h1>Home</h1>'))
+    (source / 'style.css').write_text('body { color: black; }')
+    (source / 'docs' / 'index.html').write_text('<h1>Docs</h1>')
+    (source / 'docs' / 'page.html').write_text('<h1>Page</h1>')
+    (source / MANIFEST_FILENAME).write_text('{}')
+    (source / ASSET_MANIFEST_FILENAME).write_text('{}')
+    return source
+
+
+def make_engine(source, client, dry_run: bool = False, destroy: bool = False, **settings):
+    config = {'engine': 's3sync', 'bucket': BUCKET, 'workers': 2, **settings}
+    return S3SyncPublishEngine(
+        name='test',
+        source_dir=str(source),
+        config=config,
+        dry_run=dry_run,
+        destroy=destroy,
+        client=client,
+    )
+
+
+def remote_objects(client, prefix: str = '') -> dict:
+    """
+    Returns the keys and ETags of the objects in the bucket.
+    """
+
+    response = client.list_objects_v2(Bucket=BUCKET, Prefix=prefix)
+    return {item['Key']: item['ETag'].strip('"') for item in response.get('Contents', [])}
+
+
+def test_s3_etag_of_small_file_is_md5(tmp_path):
+    path = tmp_path / 'file'
+    path.write_bytes(b'hello')
+    assert s3_etag(path, 5, 5 * MIB, 5 * MIB) == hashlib.md5(b'hello').hexdigest()
+
+
+def test_s3_etag_of_large_file_combines_part_digests(tmp_path):
+    path = tmp_path / 'file'
+    data = b'0123456789'
+    path.write_bytes(data)
+    parts = [data[0:4], data[4:8], data[8:10]]
+    combined = hashlib.md5(b''.join(hashlib.md5(part).digest() for part in parts)).hexdigest()
+    assert s3_etag(path, len(data), 4, 4) == f'{combined}-3'
+
+
+def test_s3_etag_doubles_part_size_to_fit_the_part_limit(tmp_path, monkeypatch):
+    monkeypatch.setattr(s3sync, 'MAX_PARTS', 2)
+    path = tmp_path / 'file'
+    data = b'0123456789'
+    path.write_bytes(data)
+    parts = [data[0:6], data[6:10]]
+    combined = hashlib.md5(b''.join(hashlib.md5(part).digest() for part in parts)).hexdigest()
+    assert s3_etag(path, len(data), 1, 3) == f'{combined}-2'
+
+
+def test_first_publish_uploads_site(site, s3_client):
+    make_engine(site, s3_client, cache_control='max-age=300').publish()
+
+    objects = remote_objects(s3_client)
+    assert set(objects) == {
+        'index.html',
+        'style.css',
+        'docs/index.html',
+        'docs/page.html',
+        SYNC_MANIFEST_KEY,
+    }
+    head = s3_client.head_object(Bucket=BUCKET, Key='index.html')
+    assert head['ContentType'] == 'text/html; charset=utf-8'
+    assert head['CacheControl'] == 'max-age=300'
+    assert 'ContentEncoding' not in head
+
+    manifest = json.loads(s3_client.get_object(Bucket=BUCKET, Key=SYNC_MANIFEST_KEY)['Body'].read())
+    assert set(manifest['objects']) == set(objects) - {SYNC_MANIFEST_KEY}
+    assert manifest['objects']['style.css']['etag'] == objects['style.css']
+
+
+def test_republish_without_changes_uploads_nothing(site, s3_client):
+    make_engine(site, s3_client).publish()
+
+    uploads, deletes, unchanged = make_engine(site, s3_client).plan(site)
+    assert uploads == {}
+    assert deletes == []
+    assert set(unchanged) == {'index.html', 'style.css', 'docs/index.html', 'docs/page.html'}
+
+
+def test_changed_content_and_headers_are_uploaded(site, s3_client):
+    make_engine(site, s3_client).publish()
+    (site / 'style.css').write_text('body { color: red; }')
+
+    engine = make_engine(site, s3_client, cache_control='max-age=60')
+    uploads, _deletes, _unchanged = engine.plan(site)
+    assert set(uploads) == {'index.html', 'style.css', 'docs/index.html', 'docs/page.html'}
+    assert all(upload['replaces'] for upload in uploads.values())
+
+    engine.publish()
+    body = s3_client.get_object(Bucket=BUCKET, Key='style.css')['Body'].read()
+    assert body == b'body { color: red; }'
+    head = s3_client.head_object(Bucket=BUCKET, Key='docs/page.html')
+    assert head['CacheControl'] == 'max-age=60'
+    assert make_engine(site, s3_client, cache_control='max-age=60').plan(site)[0] == {}
+
+
+def test_removed_files_are_deleted(site, s3_client):
+    make_engine(site, s3_client).publish()
+    (site / 'docs' / 'page.html').unlink()
+
+    make_engine(site, s3_client).publish()
+    assert 'docs/page.html' not in remote_objects(s3_client)
+
+    (site / 'style.css').unlink()
+    make_engine(site, s3_client, delete=False).publish()
+    assert 'style.css' in remote_objects(s3_client)
+
+
+def test_large_files_are_uploaded_in_parts(site, s3_client):
+    data = bytes(range(256)) * (12 * MIB // 256)
+    (site / 'video.mp4').write_bytes(data)
+    settings = {'multipart_threshold': 5 * MIB, 'multipart_chunk_size': 5 * MIB}
+
+    make_engine(site, s3_client, **settings).publish()
+    etag = remote_objects(s3_client)['video.mp4']
+    assert etag.endswith('-3')
+    assert etag == s3_etag(site / 'video.mp4', len(data), 5 * MIB, 5 * MIB)
+    assert make_engine(site, s3_client, **settings).plan(site)[0] == {}
+
+
+def test_manifest_recognizes_objects_whose_etag_is_not_md5(site, s3_client):
+    make_engine(site, s3_client).publish()
+
+    # Objects encrypted with KMS keys have ETags unrelated to their contents
+    s3_client.put_object(Bucket=BUCKET, Key='style.css', Body=b'encrypted')
+    etag = remote_objects(s3_client)['style.css']
+    manifest = json.loads(s3_client.get_object(Bucket=BUCKET, Key=SYNC_MANIFEST_KEY)['Body'].read())
+    manifest['objects']['style.css']['etag'] = etag
+    s3_client.put_object(Bucket=BUCKET, Key=SYNC_MANIFEST_KEY, Body=json.dumps(manifest).encode())
+
+    uploads, _deletes, unchanged = make_engine(site, s3_client).plan(site)
+    assert 'style.css' not in uploads
+    assert unchanged['style.css']['etag'] == etag
+
+    (site / 'style.css').write_text('body { color: blue; }')
+    uploads, _deletes, _unchanged = make_engine(site, s3_client).plan(site)
+    assert set(uploads) == {'style.css'}
+
+
+def test_objects_changed_behind_the_manifest_are_uploaded(site, s3_client):
+    make_engine(site, s3_client).publish()
+    s3_client.put_object(Bucket=BUCKET, Key='style.css', Body=b'changed elsewhere')
+
+    uploads, _deletes, _unchanged = make_engine(site, s3_client).plan(site)
+    assert set(uploads) == {'style.css'}
+
+
+def test_manifest_from_another_version_is_ignored(site, s3_client):
+    make_engine(site, s3_client).publish()
+    s3_client.put_object(Bucket=BUCKET, Key=SYNC_MANIFEST_KEY, Body=b'{"version": 0}')
+
+    assert make_engine(site, s3_client).load_manifest() == {}
+    assert make_engine(site, s3_client).plan(site)[0] == {}
+
+
+def test_compressed_copies_are_uploaded_in_place_of_files(site, s3_client):
+    make_engine(site, s3_client, content_encoding='gzip').publish()
+
+    objects = remote_objects(s3_client)
+    assert 'index.html.gz' not in objects
+    assert MANIFEST_FILENAME not in objects
+    head = s3_client.head_object(Bucket=BUCKET, Key='index.html')
+    assert head['ContentEncoding'] == 'gzip'
+    body = s3_client.get_object(Bucket=BUCKET, Key='index.html')['Body'].read()
+    assert gzip.decompress(body) == b'<h1>Home</h1>'
+    assert 'ContentEncoding' not in s3_client.head_object(Bucket=BUCKET, Key='docs/page.html')
+
+
+def test_prefix_keeps_objects_under_it(site, s3_client):
+    s3_client.put_object(Bucket=BUCKET, Key='other/keep.html', Body=b'keep')
+    make_engine(site, s3_client, prefix='/preview/').publish()
+
+    objects = remote_objects(s3_client)
+    assert 'preview/index.html' in objects
+    assert f'preview/{SYNC_MANIFEST_KEY}' in objects
+    assert 'other/keep.html' in objects
+
+
+def test_dry_run_changes_nothing(site, s3_client):
+    make_engine(site, s3_client, dry_run=True).publish()
+    assert remote_objects(s3_client) == {}
+
+
+def test_destroy_empties_the_prefix(site, s3_client):
+    s3_client.put_object(Bucket=BUCKET, Key='other/keep.html', Body=b'keep')
+    make_engine(site, s3_client, prefix='preview').publish()
+
+    make_engine(site, s3_client, destroy=True, prefix='preview').publish()
+    assert set(remote_objects(s3_client)) == {'other/keep.html'}
@@ -0,0 +1,20 @@
+import pytest
+
+from microsite.watch import PollingWatcher, Watcher
+
+
+def test_watchers_must_report_changes(tmp_path):
+    with pytest.raises(TypeError):
+        Watcher(paths=[str(tmp_path)])
+
+
+def test_polling_watcher_reports_changed_paths(tmp_path):
+    (tmp_path / 'target').mkdir()
+    (tmp_path / 'page.md').write_text('one')
+    watcher = PollingWatcher(paths=[str(tmp_path)], ignore=[str(tmp_path / 'target')], interval=0)
+    assert watcher.changes(timeout=0) == set()
+
+    (tmp_path / 'page.md').write_text('changed')
+    (tmp_path / 'target' / 'page.html').write_text('ignored')
+    (tmp_path / 'new.md').write_text('new')
+    assert watcher.changes(timeout=0) == {str(tmp_path / 'page.md'), str(tmp_path / 'new.md')}